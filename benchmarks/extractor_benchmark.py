@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Extractor throughput against the local TWS simulator, written as a pytest-benchmark suite.
+    Every round extracts a fresh set of tickers over an open connection, each served with the 1301 fixture bars.
+    Reports tickers/sec, messages/sec & p50/p99 request latency per scenario, saved as "extra_info" along
+    with the timings when the results are exported.
+
+    Usage:
+        python -m pytest benchmarks/extractor_benchmark.py
+        python -m pytest benchmarks/extractor_benchmark.py --benchmark-json extractor.json
+"""
+
+from statistics import quantiles
+from time import perf_counter
+
+import pytest
+
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import connect_extractor
+from tws_equities.tws_clients import HistoricalDataExtractor
+
+
+pytest.importorskip('pytest_benchmark')
+_TICKERS = 200
+_ROUNDS = 3
+_SCENARIOS = {
+    # name: (simulator options, extractor options)
+    'no latency': ({}, {}),
+    'no latency, 50 in flight': ({}, {'max_requests_in_flight': 50}),
+    '5 ms latency': ({'latency': 0.005}, {}),
+    '5 ms latency, 50 in flight': ({'latency': 0.005}, {'max_requests_in_flight': 50}),
+    '1% pacing violations': ({'latency': 0.005, 'error_rate': 0.01}, {}),
+}
+
+
+class _TimedExtractor(HistoricalDataExtractor):
+    """
+        Records the time taken by every request, from the moment it is sent till its last bar is received.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent_at = {}
+        self.latencies = []
+
+    def _request_historical_data(self, ticker):
+        self.sent_at[ticker] = perf_counter()
+        super()._request_historical_data(ticker)
+
+    def historicalDataEnd(self, ticker, start, end):
+        if ticker in self.sent_at:
+            self.latencies.append(perf_counter() - self.sent_at.pop(ticker))
+        super().historicalDataEnd(ticker, start, end)
+
+
+@pytest.mark.parametrize('scenario', list(_SCENARIOS))
+def test_extractor_throughput(benchmark, capsys, scenario):
+    simulator_options, extractor_options = _SCENARIOS[scenario]
+    rounds = []
+    with TWSSimulator(**simulator_options) as simulator:
+        extractor = connect_extractor(simulator, extractor_class=_TimedExtractor, keep_alive=True,
+                                      **extractor_options)
+        batches = iter(range(10000, 10000 + _TICKERS * 100, _TICKERS))
+
+        def setup():
+            extractor.set_request_window(extractor_options.get('max_requests_in_flight', 10))
+            extractor.latencies = []
+            first = next(batches)
+            return (list(range(first, first + _TICKERS)),), {}
+
+        def extract(tickers):
+            messages = simulator.stats['messages_sent'] + simulator.stats['messages_received']
+            start = perf_counter()
+            data = extractor.extract_historical_data(tickers)
+            time_lapsed = perf_counter() - start
+            messages = simulator.stats['messages_sent'] + simulator.stats['messages_received'] - messages
+            rounds.append((time_lapsed, messages, extractor.latencies))
+            return data
+
+        data = benchmark.pedantic(extract, setup=setup, rounds=_ROUNDS, iterations=1)
+        extractor.disconnect()
+
+    assert all(result['meta_data']['status'] for result in data.values()), 'Some tickers were not extracted.'
+    time_lapsed = sum(timing for timing, _, _ in rounds)
+    latencies = [latency for _, _, round_latencies in rounds for latency in round_latencies]
+    percentiles = quantiles(latencies, n=100)
+    benchmark.extra_info.update({
+        'tickers_per_second': round(_TICKERS * len(rounds) / time_lapsed, 1),
+        'messages_per_second': round(sum(messages for _, messages, _ in rounds) / time_lapsed, 1),
+        'p50_latency_ms': round(percentiles[49] * 1000, 2),
+        'p99_latency_ms': round(percentiles[98] * 1000, 2),
+    })
+    with capsys.disabled():
+        print(f'\n{scenario:>28}: {benchmark.extra_info}')
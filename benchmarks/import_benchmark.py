@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Measures start-up time of short-lived CLI invocations, each one is run in a fresh interpreter.
+    Reports the best wall time per invocation, whether heavy dependencies got imported & the slowest imports
+    as reported by "python -X importtime".
+
+    Usage:
+        python benchmarks/import_benchmark.py
+        python benchmarks/import_benchmark.py --repeat 10 --top 15
+"""
+
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os.path import abspath
+from os.path import dirname
+from time import perf_counter
+
+
+_PROJECT_ROOT = dirname(dirname(abspath(__file__)))
+_HEAVY_MODULES = ['pandas', 'numpy', 'alive_progress', 'ibapi.client', 'ibapi.decoder']
+_INVOCATIONS = {
+    'import tws_equities': ['-c', 'import tws_equities'],
+    'tws_equities -h': ['-m', 'tws_equities', '-h'],
+    'tws_equities metrics -h': ['-m', 'tws_equities', 'metrics', '-h'],
+    'parse run command': ['-c', 'from tws_equities import parse_user_args; '
+                                'parse_user_args(["run", "tickers", "-l", "1301"])'],
+}
+
+
+def _run(arguments, *options):
+    return subprocess.run([sys.executable, *options, *arguments], cwd=_PROJECT_ROOT, capture_output=True,
+                          text=True, check=True)
+
+
+def time_invocation(arguments, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        _run(arguments)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def loaded_heavy_modules(arguments):
+    """
+        Returns the heavy modules imported by an invocation, read from the import time report.
+    """
+    report = _run(arguments, '-X', 'importtime').stderr
+    imported = {line.split('|')[-1].strip() for line in report.splitlines() if line.startswith('import time:')}
+    return [name for name in _HEAVY_MODULES if name in imported]
+
+
+def slowest_imports(arguments, top):
+    """
+        Returns (cumulative micro-seconds, module) for the slowest imports of an invocation.
+    """
+    report = _run(arguments, '-X', 'importtime').stderr
+    imports = []
+    for line in report.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def run(repeat, top):
+    baseline = time_invocation(['-c', 'pass'], repeat)
+    print(f'{"interpreter start-up":>26}: {baseline * 1000:7.1f} ms')
+    for name, arguments in _INVOCATIONS.items():
+        timing = time_invocation(arguments, repeat)
+        heavy = ', '.join(loaded_heavy_modules(arguments)) or '-'
+        print(f'{name:>26}: {timing * 1000:7.1f} ms, heavy imports: {heavy}')
+    print(f'\nSlowest imports for "tws_equities -h":')
+    for cumulative, name in slowest_imports(_INVOCATIONS['tws_equities -h'], top):
+        print(f'{cumulative / 1000:9.1f} ms {name}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='CLI start-up benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per invocation, best one is reported')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to be listed')
+    args = parser.parse_args()
+    run(args.repeat, args.top)
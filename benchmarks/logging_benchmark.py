@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Measures the cost of hot path logging in ibapi & the extractor callbacks, at default log levels.
+    Every case is run in a fresh interpreter, once with hot path logging switched on(IBAPI_HOT_PATH_LOGGING=1,
+    same as before the switch was added) & once with it stripped(default).
+
+    Usage:
+        python benchmarks/logging_benchmark.py
+        python benchmarks/logging_benchmark.py --messages 500 --repeat 5
+"""
+
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os import environ
+from os.path import abspath
+from os.path import dirname
+from time import perf_counter
+
+
+_PROJECT_ROOT = dirname(dirname(abspath(__file__)))
+_BARS = 390
+
+
+def _historical_data_message(req_id, bars=_BARS):
+    from ibapi import comm
+    fields = ['17', str(req_id), '20210101  09:00:00', '20210101  15:00:00', str(bars)]
+    for i in range(bars):
+        fields += [f'20210101  {9 + i // 60:02d}:{i % 60:02d}:00', '1000.0', '1010.0', '990.0', '1005.0',
+                   '12300', '1001.5', '42']
+    return ''.join(comm.make_field(f) for f in fields).encode()
+
+
+def _best(case, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        case()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def measure(messages, repeat):
+    """
+        Runs every case in the current interpreter, returns case --> units processed per second.
+    """
+    from ibapi.client import EClient
+    from ibapi.common import BarData
+    from ibapi.connection import Connection
+    from ibapi.decoder import Decoder
+    from ibapi.server_versions import MAX_CLIENT_VER
+    from ibapi.wrapper import EWrapper
+    from tws_equities.tws_clients import HistoricalDataExtractor
+
+    class BarWrapper(EWrapper):
+        def historicalData(self, reqId, bar):
+            pass
+
+        def historicalDataEnd(self, reqId, start, end):
+            pass
+
+    class BatchWrapper(BarWrapper):
+        def historicalDataBatch(self, reqId, columns):
+            pass
+
+    class Socket:
+        def send(self, msg):
+            return len(msg)
+
+    payloads = [_historical_data_message(req_id) for req_id in range(messages)]
+    results = {}
+    for name, wrapper in [('message loop, bar by bar', BarWrapper()), ('message loop, batch', BatchWrapper())]:
+        client = EClient(wrapper)
+
+        def message_loop():
+            client.decoder = Decoder(wrapper, MAX_CLIENT_VER)
+            for payload in payloads:
+                client.msg_queue.put(payload)
+            client.run()
+
+        results[name] = messages * _BARS / _best(message_loop, repeat)
+
+    extractor = HistoricalDataExtractor()
+    extractor.data = {}
+    extractor._init_counters()
+    extractor._init_data_tracker(1301)
+    bars = []
+    for i in range(_BARS):
+        bar = BarData()
+        bar.date, bar.barCount = f'20210101  {9 + i // 60:02d}:{i % 60:02d}:00', 42
+        bar.open, bar.high, bar.low, bar.close = 1000.0, 1010.0, 990.0, 1005.0
+        bar.volume, bar.average = 12300, 1001.5
+        bars.append(bar)
+
+    def extractor_callbacks():
+        for _ in range(messages):
+            for bar in bars:
+                extractor.historicalData(1301, bar)
+
+    results['extractor, bar by bar'] = messages * _BARS / _best(extractor_callbacks, repeat)
+
+    client = EClient(BarWrapper())
+    client.conn = Connection('127.0.0.1', 0)
+    client.conn.socket = Socket()
+    client.serverVersion_ = MAX_CLIENT_VER
+    client.setConnState(EClient.CONNECTED)
+
+    def send_path():
+        for req_id in range(messages * 10):
+            client.cancelHistoricalData(req_id)
+
+    results['send path'] = messages * 10 / _best(send_path, repeat)
+    return results
+
+
+def run(messages, repeat):
+    results = {}
+    for switch in ['1', '0']:
+        output = subprocess.run([sys.executable, abspath(__file__), '--child', '--messages', str(messages),
+                                 '--repeat', str(repeat)], cwd=_PROJECT_ROOT, capture_output=True, text=True,
+                                check=True, env={**environ, 'IBAPI_HOT_PATH_LOGGING': switch}).stdout
+        results[switch] = json.loads(output.splitlines()[-1])
+    print(f'{"case":>26} | {"logging on":>14} | {"stripped":>14} | speed-up')
+    for name in results['0']:
+        before, after = results['1'][name], results['0'][name]
+        unit = 'msgs/s' if name == 'send path' else 'bars/s'
+        print(f'{name:>26} | {before:>7.0f} {unit} | {after:>7.0f} {unit} | {after / before:5.2f}x')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Hot path logging benchmark')
+    parser.add_argument('--messages', type=int, default=200, help='historical data messages per case')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case, best one is reported')
+    parser.add_argument('--child', action='store_true', help='measure in this interpreter & print JSON')
+    args = parser.parse_args()
+    if args.child:
+        sys.path.insert(0, _PROJECT_ROOT)
+        print(json.dumps(measure(args.messages, args.repeat)))
+    else:
+        run(args.messages, args.repeat)
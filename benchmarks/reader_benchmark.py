@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Replays a captured TWS API session through the legacy & the zero-copy EReader framing.
+    Without a capture file, a multi-megabyte session of historical data responses is synthesized.
+
+    Usage:
+        python benchmarks/reader_benchmark.py
+        python benchmarks/reader_benchmark.py --capture session.cap --chunk-size 65536
+
+    Capture files written by SessionRecorder(see "tws_equities/tws_clients/capture.py") are replayed with their
+    inbound messages only, any other file is taken to be the raw byte stream received from TWS API.
+"""
+
+import socket
+import sys
+from argparse import ArgumentParser
+from os.path import abspath
+from os.path import dirname
+from queue import Queue
+from struct import pack
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from ibapi import comm  # noqa: E402
+from tws_equities.tws_clients.capture import INBOUND  # noqa: E402
+from tws_equities.tws_clients.capture import MAGIC  # noqa: E402
+from tws_equities.tws_clients.capture import read_capture  # noqa: E402
+
+
+class _ReplaySocket:
+    """
+        Hands out a captured byte stream in chunks, the way a socket would.
+    """
+
+    def __init__(self, stream, chunk_size):
+        self.stream = memoryview(stream)
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    def recv(self, size):
+        size = min(size, self.chunk_size)
+        chunk = self.stream[self.position:self.position + size]
+        self.position += len(chunk)
+        if not chunk:
+            raise socket.timeout()
+        return bytes(chunk)
+
+    def recv_into(self, view):
+        size = min(len(view), self.chunk_size)
+        chunk = self.stream[self.position:self.position + size]
+        if not chunk:
+            raise socket.timeout()
+        view[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.stream)
+
+
+def synthesize_session(requests=200, bars=390):
+    """
+        Builds the byte stream for a session with the given number of 1 min historical data responses.
+    """
+    messages = []
+    for req_id in range(requests):
+        fields = ['17', str(req_id), '20210101  09:00:00', '20210101  15:00:00', str(bars)]
+        for i in range(bars):
+            fields += [f'20210101  {9 + i // 60:02d}:{i % 60:02d}:00', '1000.0', '1010.0', '990.0', '1005.0',
+                       '12300', '1001.5', '42']
+        messages.append(comm.make_msg(''.join(comm.make_field(f) for f in fields)))
+    return b''.join(messages)
+
+
+def load_session(path):
+    """
+        Returns the byte stream received from TWS API in a session, as saved to the given file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        return data
+    return b''.join(pack('!I', len(payload)) + payload
+                    for direction, _, payload in read_capture(path) if direction == INBOUND)
+
+
+def legacy_reader(sock):
+    """
+        Framing as done by Connection._recvAllMsg & EReader.run before the frame buffer.
+    """
+    queue, buf = Queue(), b''
+    while not sock.exhausted:
+        allbuf = b''
+        try:
+            while True:
+                data = sock.recv(4096)
+                allbuf += data
+                if len(data) < 4096:
+                    break
+        except socket.timeout:
+            pass
+        buf += allbuf
+        while len(buf) > 0:
+            (size, msg, buf) = comm.read_msg(buf)
+            if msg:
+                queue.put(msg)
+            else:
+                break
+    return queue
+
+
+def frame_buffer_reader(sock):
+    """
+        Framing as done by Connection.recvMsgInto & EReader.run with a reusable frame buffer.
+    """
+    queue, frame_buf = Queue(), comm.FrameBuffer()
+    while not sock.exhausted:
+        try:
+            while True:
+                view = frame_buf.write_view()
+                n = sock.recv_into(view)
+                frame_buf.commit(n)
+                if n < len(view):
+                    break
+        except socket.timeout:
+            pass
+        for msg in frame_buf.messages():
+            queue.put(bytes(msg))
+            msg.release()
+    return queue
+
+
+def run(stream, chunk_size, repeat):
+    print(f'Session size: {len(stream) / 1e6:.1f} MB, chunk size: {chunk_size} bytes')
+    results = {}
+    for name, reader in [('legacy', legacy_reader), ('frame buffer', frame_buffer_reader)]:
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            queue = reader(_ReplaySocket(stream, chunk_size))
+            timings.append(perf_counter() - start)
+        results[name] = [queue.get() for _ in range(queue.qsize())]
+        print(f'{name:>12}: {min(timings) * 1000:9.1f} ms, messages: {len(results[name])}')
+    assert results['legacy'] == results['frame buffer'], 'readers produced different messages'
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='EReader framing benchmark')
+    parser.add_argument('--capture', help='capture file or raw byte stream received from TWS API, synthesized if '
+                                          'omitted')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='bytes handed out per receive call')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if args.capture:
+        session = load_session(args.capture)
+    else:
+        session = synthesize_session()
+    run(session, args.chunk_size, args.repeat)
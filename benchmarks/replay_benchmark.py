@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Replays a recorded TWS API session through EReader & Decoder, once into a bare wrapper & once into the
+    extractor callbacks, to profile the decode path without a connection to TWS.
+    Without a capture file, a session is recorded against the local TWS simulator first.
+    Sessions can be recorded from a live TWS with: HistoricalDataExtractor(capture_file='session.cap')
+
+    Usage:
+        python benchmarks/replay_benchmark.py
+        python benchmarks/replay_benchmark.py --capture session.cap --repeat 5
+        python -m cProfile -s cumtime benchmarks/replay_benchmark.py --capture session.cap
+"""
+
+import sys
+from argparse import ArgumentParser
+from os.path import abspath
+from os.path import dirname
+from os.path import getsize
+from os.path import join
+from tempfile import mkdtemp
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from ibapi.wrapper import EWrapper  # noqa: E402
+from tws_equities.tws_clients import HistoricalDataExtractor  # noqa: E402
+from tws_equities.tws_clients.capture import replay  # noqa: E402
+
+
+class _BareWrapper(EWrapper):
+    """
+        Receives bars in bulk & drops them, leaves nothing but the decode path to be measured.
+    """
+
+    def historicalDataBatch(self, reqId, columns):
+        pass
+
+    def historicalDataEnd(self, reqId, start, end):
+        pass
+
+    def error(self, reqId, errorCode, errorString):
+        pass
+
+
+def record_session(tickers):
+    """
+        Records an extraction against the local TWS simulator, returns the location of the capture file.
+    """
+    from tests.tws_simulator import TWSSimulator
+    from tests.tws_simulator import connect_extractor
+    capture_file = join(mkdtemp(), 'session.cap')
+    with TWSSimulator() as simulator:
+        extractor = connect_extractor(simulator, capture_file=capture_file)
+        extractor.extract_historical_data(list(range(10000, 10000 + tickers)))
+    return capture_file
+
+
+def run(capture_file, repeat, realtime):
+    print(f'Capture size: {getsize(capture_file) / 1e6:.1f} MB, replayed at '
+          f'{"original pace" if realtime else "full speed"}')
+    timings = []
+    for _ in range(repeat):
+        stats = replay(capture_file, _BareWrapper(), realtime=realtime)
+        timings.append(stats['time_lapsed'])
+    best = min(timings)
+    print(f'{"decoder":>10}: {best * 1000:9.1f} ms, {stats["messages"] / best:10.0f} messages/sec, '
+          f'{stats["bytes"] / best / 1e6:6.1f} MB/sec')
+    timings = []
+    for _ in range(repeat):
+        extractor = HistoricalDataExtractor()
+        start = perf_counter()
+        data = extractor.replay_session(capture_file, realtime=realtime)
+        timings.append(perf_counter() - start)
+    best = min(timings)
+    print(f'{"extractor":>10}: {best * 1000:9.1f} ms, {stats["messages"] / best:10.0f} messages/sec, '
+          f'{len(data) / best:6.0f} tickers/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Recorded session replay benchmark')
+    parser.add_argument('--capture', help='capture file recorded with "capture_file", recorded locally if omitted')
+    parser.add_argument('--tickers', type=int, default=500, help='tickers to be recorded, without a capture file')
+    parser.add_argument('--repeat', type=int, default=3, help='replays per target, best one is reported')
+    parser.add_argument('--realtime', action='store_true', help='replay messages at their original pace')
+    args = parser.parse_args()
+    run(args.capture or record_session(args.tickers), args.repeat, args.realtime)
@@ -27,7 +27,7 @@ from ibapi.order import Order
 from ibapi.execution import ExecutionFilter
 from ibapi.scanner import ScannerSubscription
 from ibapi.comm import (make_field, make_field_handle_empty)
-from ibapi.utils import (current_fn_name, BadMessage)
+from ibapi.utils import (current_fn_name, BadMessage, HOT_PATH_LOGGING)
 from ibapi.errors import * #@UnusedWildImport
 from ibapi.server_versions import * # @UnusedWildImport
 
@@ -45,6 +45,8 @@ class EClient(object):
         self.msg_queue = queue.Queue()
         self.wrapper = wrapper
         self.decoder = None
+        # opt-in session recorder, handed over to every new connection
+        self.recorder = None
         self.reset()
 
 
@@ -74,7 +76,8 @@ class EClient(object):
 
     def sendMsg(self, msg):
         full_msg = comm.make_msg(msg)
-        logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
+        if HOT_PATH_LOGGING:
+            logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
         self.conn.sendMsg(full_msg)
 
 
@@ -133,6 +136,7 @@ class EClient(object):
             logger.debug("Connecting to %s:%d w/ id:%d", self.host, self.port, self.clientId)
 
             self.conn = Connection(self.host, self.port)
+            self.conn.recorder = self.recorder
 
             self.conn.connect()
             self.setConnState(EClient.CONNECTING)
@@ -203,8 +207,9 @@ class EClient(object):
         """Call this function to check if there is a connection with TWS"""
 
         connConnected = self.conn and self.conn.isConnected()
-        logger.debug("%s isConn: %s, connConnected: %s" % (id(self),
-            self.connState, str(connConnected)))
+        if HOT_PATH_LOGGING:
+            logger.debug("%s isConn: %s, connConnected: %s", id(self),
+                         self.connState, connConnected)
         return EClient.CONNECTED == self.connState and connConnected
 
     def keyboardInterrupt(self):
@@ -232,10 +237,12 @@ class EClient(object):
                             self.disconnect()
                             break
                     except queue.Empty:
-                        logger.debug("queue.get: empty")
+                        if HOT_PATH_LOGGING:
+                            logger.debug("queue.get: empty")
                     else:
                         fields = comm.read_fields(text)
-                        logger.debug("fields %s", fields)
+                        if HOT_PATH_LOGGING:
+                            logger.debug("fields %s", fields)
                         self.decoder.interpret(fields)
                 except (KeyboardInterrupt, SystemExit):
                     logger.info("detected KeyboardInterrupt, SystemExit")
@@ -245,9 +252,10 @@ class EClient(object):
                     logger.info("BadMessage")
                     self.conn.disconnect()
 
-                logger.debug("conn:%d queue.sz:%d",
-                             self.isConnected(),
-                             self.msg_queue.qsize())
+                if HOT_PATH_LOGGING:
+                    logger.debug("conn:%d queue.sz:%d",
+                                 self.isConnected(),
+                                 self.msg_queue.qsize())
         finally:
             self.disconnect()
 
@@ -13,6 +13,7 @@ import struct
 import logging
 
 from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE
+from ibapi.utils import HOT_PATH_LOGGING
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +54,8 @@ def read_msg(buf:bytes) -> tuple:
     if len(buf) < 4:
         return (0, "", buf)
     size = struct.unpack("!I", buf[0:4])[0]
-    logger.debug("read_msg: size: %d", size)
+    if HOT_PATH_LOGGING:
+        logger.debug("read_msg: size: %d", size)
     if len(buf) - 4 >= size:
         text = struct.unpack("!%ds" % size, buf[4:4+size])[0]
         return (size, text, buf[4+size:])
@@ -73,3 +75,70 @@ def read_fields(buf:bytes) -> tuple:
 
 
 
+
+class FrameBuffer:
+    """ reusable receive buffer, frames size prefixed messages without
+    re-copying the unread tail on every message """
+
+    def __init__(self, capacity=65536):
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first unread byte
+        self.end = 0    # first free byte
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _reserve(self, nbytes):
+        """ makes room for at least nbytes after the unread data """
+        if len(self.buf) - self.end >= nbytes:
+            return
+        unread = self.end - self.start
+        if unread + nbytes > len(self.buf):
+            # buffer is too small even once compacted, grow it
+            capacity = max(2 * len(self.buf), unread + nbytes)
+            buf = bytearray(capacity)
+            buf[:unread] = self.buf[self.start:self.end]
+            self.buf = buf
+            self.view = memoryview(self.buf)
+        else:
+            self.view[:unread] = self.view[self.start:self.end]
+        self.start, self.end = 0, unread
+
+    def write_view(self, nbytes=4096) -> memoryview:
+        """ writable view over the free space, to be filled by recv_into """
+        self._reserve(nbytes)
+        return self.view[self.end:]
+
+    def commit(self, nbytes):
+        """ marks nbytes of the free space as received """
+        self.end += nbytes
+
+    def extend(self, data):
+        """ appends data, for sources that hand out bytes instead of filling a buffer """
+        self._reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def read_msg(self):
+        """ returns a view over the payload of the next complete message,
+        None if more data is needed; the view is valid until the next write """
+        if self.end - self.start < 4:
+            return None
+        size = struct.unpack_from("!I", self.buf, self.start)[0]
+        if self.end - self.start - 4 < size:
+            # make sure the rest of the message fits without compacting again
+            self._reserve(size + 4 - (self.end - self.start))
+            return None
+        msg = self.view[self.start + 4:self.start + 4 + size]
+        self.start += 4 + size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return msg
+
+    def messages(self):
+        """ yields the payload of every complete message in the buffer """
+        msg = self.read_msg()
+        while msg is not None:
+            yield msg
+            msg = self.read_msg()
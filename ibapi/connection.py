@@ -16,6 +16,7 @@ import logging
 
 from ibapi.common import * # @UnusedWildImport
 from ibapi.errors import * # @UnusedWildImport
+from ibapi.utils import HOT_PATH_LOGGING
 
 
 #TODO: support SSL !!
@@ -30,6 +31,9 @@ class Connection:
         self.socket = None
         self.wrapper = None
         self.lock = threading.Lock()
+        # opt-in session recorder, any object with inbound(data) and
+        # outbound(data) methods; gets every chunk of bytes received & sent
+        self.recorder = None
 
 
     def connect(self):
@@ -69,24 +73,32 @@ class Connection:
 
     def sendMsg(self, msg):
 
-        logger.debug("acquiring lock")
+        if HOT_PATH_LOGGING:
+            logger.debug("acquiring lock")
         self.lock.acquire()
-        logger.debug("acquired lock")
+        if HOT_PATH_LOGGING:
+            logger.debug("acquired lock")
         if not self.isConnected():
             logger.debug("sendMsg attempted while not connected, releasing lock")
             self.lock.release()
             return 0
         try:
+            # recorded ahead of sending, so that it precedes the response
+            if self.recorder is not None:
+                self.recorder.outbound(msg)
             nSent = self.socket.send(msg)
         except socket.error:
             logger.debug("exception from sendMsg %s", sys.exc_info())
             raise
         finally:
-            logger.debug("releasing lock")
+            if HOT_PATH_LOGGING:
+                logger.debug("releasing lock")
             self.lock.release()
-            logger.debug("release lock")
+            if HOT_PATH_LOGGING:
+                logger.debug("release lock")
 
-        logger.debug("sendMsg: sent: %d", nSent)
+        if HOT_PATH_LOGGING:
+            logger.debug("sendMsg: sent: %d", nSent)
 
         return nSent
 
@@ -97,6 +109,8 @@ class Connection:
             return b""
         try:
             buf = self._recvAllMsg()
+            if buf and self.recorder is not None:
+                self.recorder.inbound(buf)
             # receiving 0 bytes outside a timeout means the connection is either
             # closed or broken
             if len(buf) == 0:
@@ -111,6 +125,33 @@ class Connection:
         return buf
 
 
+    def recvMsgInto(self, frame_buf):
+        """ receives straight into the free space of a comm.FrameBuffer,
+        returns the number of bytes received """
+        if not self.isConnected():
+            logger.debug("recvMsgInto attempted while not connected")
+            return 0
+        nRecv = 0
+        try:
+            while self.socket is not None:
+                view = frame_buf.write_view()
+                n = self.socket.recv_into(view)
+                if n and self.recorder is not None:
+                    self.recorder.inbound(view[:n])
+                frame_buf.commit(n)
+                nRecv += n
+                # receiving 0 bytes outside a timeout means the connection is either
+                # closed or broken
+                if n == 0 and nRecv == 0:
+                    logger.debug("socket either closed or broken, disconnecting")
+                    self.disconnect()
+                if n < len(view):
+                    break
+        except socket.timeout:
+            logger.debug("socket timeout from recvMsgInto %s", sys.exc_info())
+        return nRecv
+
+
     def _recvAllMsg(self):
         cont = True
         allbuf = b""
@@ -118,7 +159,8 @@ class Connection:
         while cont and self.socket is not None:
             buf = self.socket.recv(4096)
             allbuf += buf
-            logger.debug("len %d raw:%s|", len(buf), buf)
+            if HOT_PATH_LOGGING:
+                logger.debug("len %d raw:%s|", len(buf), buf)
 
             if len(buf) < 4096:
                 cont = False
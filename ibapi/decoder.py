@@ -10,6 +10,9 @@ It will call the corresponding method from the EWrapper so that customer's code
 (eg: class derived from EWrapper) can make further use of the data.
 """
 
+import array
+import itertools
+
 from ibapi.message import IN
 from ibapi.wrapper import * # @UnusedWildImport
 from ibapi.contract import ContractDescription
@@ -46,6 +49,9 @@ class Decoder(Object):
         self.serverVersion = serverVersion
         self.discoverParams()
         #self.printParams()
+        # bulk delivery of historical bars is opt-in, wrapper has to override historicalDataBatch
+        self.useHistoricalDataBatch = (getattr(type(wrapper), "historicalDataBatch", None)
+                                       not in (None, EWrapper.historicalDataBatch))
 
 
     def processTickPriceMsg(self, fields):
@@ -499,6 +505,11 @@ class Decoder(Object):
 
         itemCount = decode(int, fields)
 
+        if self.useHistoricalDataBatch:
+            self.wrapper.historicalDataBatch(reqId, self.decodeHistoricalBars(fields, itemCount))
+            self.wrapper.historicalDataEnd(reqId, startDateStr, endDateStr)
+            return
+
         for _ in range(itemCount):
             bar = BarData()
             bar.date = decode(str, fields)
@@ -519,6 +530,27 @@ class Decoder(Object):
         # send end of dataset marker
         self.wrapper.historicalDataEnd(reqId, startDateStr, endDateStr)
 
+    def decodeHistoricalBars(self, fields, itemCount) -> dict:
+        """ decodes the bars of a HISTORICAL_DATA payload in one pass into
+        typed columns, no per-bar objects or decode() calls """
+        # older servers send an extra "hasGaps" field ahead of the bar count
+        stride = 8 if self.serverVersion >= MIN_SERVER_VER_SYNT_REALTIME_BARS else 9
+        payload = tuple(itertools.islice(fields, itemCount * stride))
+        if len(payload) < itemCount * stride:
+            raise BadMessage("truncated historical data message")
+        columns = {
+            # date & time separators are dropped, "20210101  09:00:00" --> 20210101090000
+            "date": array.array("q", [int(date.translate(None, b" :")) for date in payload[0::stride]]),
+            "open": array.array("d", map(float, payload[1::stride])),
+            "high": array.array("d", map(float, payload[2::stride])),
+            "low": array.array("d", map(float, payload[3::stride])),
+            "close": array.array("d", map(float, payload[4::stride])),
+            "volume": array.array("q", map(int, payload[5::stride])),
+            "average": array.array("d", map(float, payload[6::stride])),
+            "barCount": array.array("q", map(int, payload[stride - 1::stride])),
+        }
+        return columns
+
     def processHistoricalDataUpdateMsg(self, fields):
         next(fields)
         reqId = decode(int, fields)
@@ -1240,12 +1272,14 @@ class Decoder(Object):
         args = []
         for (pname, param) in handleInfo.wrapperParams.items():
             if pname != "self":
-                logger.debug("field %s ", fields[fieldIdx])
+                if HOT_PATH_LOGGING:
+                    logger.debug("field %s ", fields[fieldIdx])
                 try:
                     arg = fields[fieldIdx].decode('UTF-8')
                 except UnicodeDecodeError:
                     arg = fields[fieldIdx].decode('latin-1')
-                logger.debug("arg %s type %s", arg, param.annotation)
+                if HOT_PATH_LOGGING:
+                    logger.debug("arg %s type %s", arg, param.annotation)
                 if param.annotation is int:
                     arg = int(arg)
                 elif param.annotation is float:
@@ -1255,7 +1289,8 @@ class Decoder(Object):
                 fieldIdx += 1
 
         method = getattr(self.wrapper, handleInfo.wrapperMeth.__name__)
-        logger.debug("calling %s with %s %s", method, self.wrapper, args)
+        if HOT_PATH_LOGGING:
+            logger.debug("calling %s with %s %s", method, self.wrapper, args)
         method(*args)
 
     def interpret(self, fields):
@@ -1274,7 +1309,8 @@ class Decoder(Object):
 
         try:
             if handleInfo.wrapperMeth is not None:
-                logger.debug("In interpret(), handleInfo: %s", handleInfo)
+                if HOT_PATH_LOGGING:
+                    logger.debug("In interpret(), handleInfo: %s", handleInfo)
                 self.interpretWithSignature(fields, handleInfo)
             elif handleInfo.processMeth is not None:
                 handleInfo.processMeth(self, iter(fields))
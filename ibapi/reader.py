@@ -15,6 +15,7 @@ import logging
 from threading import Thread
 
 from ibapi import comm
+from ibapi.utils import HOT_PATH_LOGGING
 
 
 logger = logging.getLogger(__name__)
@@ -28,26 +29,21 @@ class EReader(Thread):
 
     def run(self):
         try:
-            buf = b""
+            frame_buf = comm.FrameBuffer()
             while self.conn.isConnected():
 
-                data = self.conn.recvMsg()
-                logger.debug("reader loop, recvd size %d", len(data))
-                buf += data
+                size = self.conn.recvMsgInto(frame_buf)
+                if HOT_PATH_LOGGING:
+                    logger.debug("reader loop, recvd size %d", size)
 
-                while len(buf) > 0:
-                    (size, msg, buf) = comm.read_msg(buf)
-                    #logger.debug("resp %s", buf.decode('ascii'))
-                    logger.debug("size:%d msg.size:%d msg:|%s| buf:%s|", size,
-                        len(msg), buf, "|")
+                for msg in frame_buf.messages():
+                    # views are only valid until the next receive, hand out a copy
+                    self.msg_queue.put(bytes(msg))
+                    msg.release()
 
-                    if msg:
-                        self.msg_queue.put(msg)
-                    else:
-                        logger.debug("more incoming packet(s) are needed ")
-                        break
+                if HOT_PATH_LOGGING and len(frame_buf) > 0:
+                    logger.debug("more incoming packet(s) are needed ")
 
             logger.debug("EReader thread finished")
         except:
             logger.exception('unhandled exception in EReader thread')
-
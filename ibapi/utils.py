@@ -9,6 +9,7 @@ Collection of misc tools
 """
 
 
+import os
 import sys
 import logging
 import inspect
@@ -18,6 +19,12 @@ from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE, UNSET_LONG
 
 logger = logging.getLogger(__name__)
 
+# Per field & per message logging on the decode and send paths is stripped
+# unless switched on at start-up, by setting IBAPI_HOT_PATH_LOGGING=1 before
+# ibapi is imported. Modules take a copy of the switch when they are imported,
+# so that the check costs a single global lookup on the hot path.
+HOT_PATH_LOGGING = os.environ.get("IBAPI_HOT_PATH_LOGGING", "0") not in ("", "0")
+
 
 # I use this just to visually emphasize it's a wrapper overriden method
 def iswrapper(fn):
@@ -63,7 +70,8 @@ def decode(the_type, fields, show_unset = False):
     except StopIteration:
         raise BadMessage("no more fields")
 
-    logger.debug("decode %s %s", the_type, s)
+    if HOT_PATH_LOGGING:
+        logger.debug("decode %s %s", the_type, s)
 
     if the_type is str:
         if type(s) is str:
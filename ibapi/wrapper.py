@@ -346,6 +346,21 @@ class EWrapper:
         self.logAnswer(current_fn_name(), vars())
 
 
+    def historicalDataBatch(self, reqId: int, columns: dict):
+        """ returns all the bars of a historical data response at once,
+        instead of one historicalData call per bar. Decoder only takes this
+        path for wrappers that override this method.
+
+        reqId - the request's identifier
+        columns - dict of typed arrays (array.array), one entry per bar:
+            date - int64, yyyymmddhhmmss (or yyyymmdd for daily bars) with
+                formatDate=1, seconds since epoch with formatDate=2
+            open, high, low, close, average - float64
+            volume, barCount - int64 """
+
+        self.logAnswer(current_fn_name(), vars())
+
+
     def historicalDataEnd(self, reqId:int, start:str, end:str):
         """ Marks the ending of the historical bars reception. """
         self.logAnswer(current_fn_name(), vars())
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from pytest import raises
+
+from tests.sample_input import get_positive_input
+from tests.tws_simulator import TWSSimulator
+from tws_equities.tws_clients import AsyncTWSClient
+from tws_equities.tws_clients.async_client import RequestError
+from tws_equities.tws_clients.async_client import _TWSProtocol
+
+
+"""
+    AsyncTWSClient frames messages on the event loop & resolves historical data requests as coroutines.
+    These tests run the client against a local TWS simulator, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/async_client_test.py
+"""
+
+
+_END_DATE_TIME = '20210216 15:01:00'
+
+
+def _run(simulator, scenario, **kwargs):
+    """
+        Connects a fresh client to the simulator, runs the scenario coroutine with it & disconnects.
+    """
+    async def main():
+        client = AsyncTWSClient(timeout=5, **kwargs)
+        await client.connect(*simulator.address, 1)
+        try:
+            return await scenario(client)
+        finally:
+            client.disconnect()
+
+    return asyncio.run(main())
+
+
+def test_connect_completes_handshake():
+    async def scenario(client):
+        return client.isConnected(), client.serverVersion(), client._farms_ready.done()
+
+    with TWSSimulator() as simulator:
+        connected, server_version, farms_ready = _run(simulator, scenario)
+    assert connected and server_version >= 100, 'Version handshake was not completed.'
+    assert farms_ready, 'Client did not wait for data farms.'
+
+
+def test_connect_fails_without_tws():
+    simulator = TWSSimulator()  # nothing listens on its address once it is stopped
+    address = simulator.address
+    simulator.stop()
+    with raises(ConnectionError):
+        asyncio.run(AsyncTWSClient(timeout=1).connect(*address, 1))
+
+
+def test_historical_data_and_request_errors():
+    async def scenario(client):
+        bars = await client.req_historical_data(1301, _END_DATE_TIME)
+        with raises(RequestError) as error:
+            await client.req_historical_data(1302, _END_DATE_TIME)
+        return bars, error.value.code, client._pending
+
+    with TWSSimulator() as simulator:
+        bars, code, pending = _run(simulator, scenario)
+    expected = get_positive_input()[1301]['bar_data']
+    assert len(bars) == len(expected), 'Not all the bars were received.'
+    assert bars[0].open == expected[0]['open'] and bars[-1].close == expected[-1]['close'], 'Bars do not match.'
+    assert code == 200, 'Error code was not passed on.'
+    assert not pending, 'Finished requests are still pending.'
+
+
+def test_timed_out_request_is_cancelled():
+    async def scenario(client):
+        with raises(asyncio.TimeoutError):
+            await client.req_historical_data(1301, _END_DATE_TIME, timeout=0.1)
+        await asyncio.sleep(0.1)  # cancellation has to reach the simulator
+        return client._pending
+
+    with TWSSimulator(latency=1) as simulator:
+        pending = _run(simulator, scenario)
+        open_requests = simulator._sessions[0].open_requests
+        messages_sent = simulator.stats['messages_sent']
+        asyncio.run(asyncio.sleep(1.1))
+        late_messages = simulator.stats['messages_sent'] - messages_sent
+    assert not pending, 'Timed out request is still pending.'
+    assert not open_requests and not late_messages, 'Timed out request was not cancelled.'
+
+
+def test_connection_loss_fails_pending_requests():
+    async def scenario(client):
+        requests = [client.req_historical_data(ticker, _END_DATE_TIME) for ticker in [1301, 1332, 1333]]
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        return results, client._pending
+
+    with TWSSimulator(latency=0.5, disconnect_after=3) as simulator:
+        results, pending = _run(simulator, scenario)
+    assert all(isinstance(result, ConnectionError) for result in results), 'Pending requests were not failed.'
+    assert not pending, 'Failed requests are still pending.'
+
+
+def test_requests_in_flight_are_capped_at_tws_limit():
+    async def scenario(client):
+        requests = [client.req_historical_data(ticker, _END_DATE_TIME) for ticker in range(8000, 8120)]
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    # simulator rejects requests beyond 50 open ones with 322, like TWS does
+    with TWSSimulator(latency=0.05) as simulator:
+        results = _run(simulator, scenario, max_requests_in_flight=60)
+        errors_sent = simulator.stats['errors_sent']
+    assert AsyncTWSClient(max_requests_in_flight=60)._max_requests_in_flight == 50, 'Window was not capped.'
+    assert all(isinstance(result, list) for result in results) and not errors_sent, 'Requests were rejected.'
+
+
+def test_messages_split_across_chunks_are_framed():
+    received = []
+
+    class _Client:
+        def _on_message(self, msg):
+            received.append(msg)
+
+    protocol = _TWSProtocol(_Client())
+    messages = [b'\x00\x00\x00\x03abc', b'\x00\x00\x00\x00', b'\x00\x00\x00\x05defgh']
+    stream = b''.join(messages) * 2000
+    for i in range(0, len(stream), 7):
+        protocol.data_received(stream[i:i + 7])
+    assert received == [b'abc', b'', b'defgh'] * 2000, 'Messages were not framed correctly.'
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from tws_equities.helpers import BarStore
+
+
+"""
+    BarStore keeps extracted data for a date in a single append-only segment file with an index.
+    These tests write to a temporary directory, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/bar_store_test.py
+"""
+
+
+def _data(ticker, status):
+    bar_data = [{'time_stamp': '2021-01-04 09:00:00', 'close': 1.5}] if status else []
+    return {'meta_data': {'ecode': ticker, 'status': status, '_error_stack': []}, 'bar_data': bar_data}
+
+
+def test_latest_record_wins(tmp_path):
+    with BarStore(str(tmp_path)) as store:
+        store.extend({1332: _data(1332, True), 1301: _data(1301, False)})
+        store.append(1301, _data(1301, True))
+        store.append(1302, _data(1302, False))
+    with BarStore(str(tmp_path)) as store:
+        assert store.status(1301) is True and store.status(1302) is False, 'Latest record did not win.'
+        assert store.status(9999) is None, 'Unknown ticker has a status.'
+        assert store.tickers(status=True) == [1301, 1332], 'Successful tickers are not in ticker order.'
+        assert [ticker for ticker, _ in store.records(status=True)] == [1301, 1332]
+        assert store.read(1301) == _data(1301, True), 'Record was not read back as written.'
+
+
+def test_index_is_recovered_from_segment(tmp_path):
+    with BarStore(str(tmp_path)) as store:
+        store.extend({1301: _data(1301, True), 1332: _data(1332, False)})
+    # simulate an interruption, index lost its last entry & segment has a partially written record
+    index_file = tmp_path / 'bars.idx'
+    index_file.write_text(index_file.read_text().splitlines()[0] + '\n')
+    with open(tmp_path / 'bars.seg', 'ab') as f:
+        f.write(b'\x00\x00\x01\x00{"meta')
+    with BarStore(str(tmp_path)) as store:
+        assert store.tickers() == [1301, 1332], 'Index was not recovered from segment.'
+        store.append(1333, _data(1333, True))
+        assert store.read(1333) == _data(1333, True), 'Record appended after recovery is not readable.'
+        assert store.read(1332) == _data(1332, False)
+    # record was written in full, but its payload is corrupt
+    segment_size = (tmp_path / 'bars.seg').stat().st_size
+    with open(tmp_path / 'bars.seg', 'ab') as f:
+        f.write(b'\x00\x00\x00\x06{"meta')
+    index_file.write_text(''.join(index_file.read_text().splitlines(keepends=True)[:2]))
+    with BarStore(str(tmp_path)) as store:
+        assert store.tickers() == [1301, 1332, 1333], 'Index was not recovered past a corrupt record.'
+        assert (tmp_path / 'bars.seg').stat().st_size == segment_size, 'Corrupt record was not truncated.'
+        assert store.read(1333) == _data(1333, True)
+
+
+def test_summary_is_kept_in_index(tmp_path):
+    data = _data(1301, True)
+    data['meta_data'].update(attempts=2, _error_stack=[{'code': 162, 'message': 'no data'}])
+    data['bar_data'].insert(0, {'time_stamp': '2021-01-04 09:01:00', 'close': 1.6})
+    with BarStore(str(tmp_path)) as store:
+        store.extend({1301: data, 1332: _data(1332, False)})
+    # no bar data is needed to read a summary, even after the segment is gone
+    (tmp_path / 'bars.seg').rename(tmp_path / 'bars.bak')
+    with BarStore(str(tmp_path)) as store:
+        assert store.summary(1301) == {'ecode': 1301, 'status': True, 'total_bars': 2,
+                                       'first_bar': '2021-01-04 09:00:00', 'last_bar': '2021-01-04 09:01:00',
+                                       'attempts': 2, 'error_codes': [162]}, 'Unexpected summary.'
+        assert [summary['ecode'] for summary in store.summaries(status=False)] == [1332]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from time import perf_counter
+
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import connect_extractor
+from tws_equities.tws_clients import HistoricalDataExtractor
+from tws_equities.tws_clients import data_extractor
+from tws_equities.tws_clients.capture import HANDSHAKE
+from tws_equities.tws_clients.capture import INBOUND
+from tws_equities.tws_clients.capture import read_capture
+
+
+"""
+    Sessions with a local TWS simulator are recorded to a capture file & replayed into a fresh extractor,
+    no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/capture_test.py
+"""
+
+
+def _record(capture_file, tickers, **kwargs):
+    with TWSSimulator(**kwargs) as simulator:
+        extractor = connect_extractor(simulator, capture_file=str(capture_file))
+        return extractor.extract_historical_data(tickers)
+
+
+def test_replay_reproduces_recorded_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_extractor, 'RECONNECT_DELAY', 0.01)
+    capture_file = tmp_path / 'session.cap'
+    tickers = list(range(3000, 3020)) + [1302]
+    recorded = _record(capture_file, tickers, errors={3000: [162]}, disconnect_after=5)
+    records = list(read_capture(capture_file))
+    assert [direction for direction, _, _ in records].count(HANDSHAKE) == 2, 'Re-connection was not recorded.'
+    time_stamps = [time_stamp for _, time_stamp, _ in records]
+    assert time_stamps == sorted(time_stamps), 'Time stamps are not monotonic.'
+
+    replayed = HistoricalDataExtractor(end_date='20210216').replay_session(capture_file)
+    assert replayed == recorded, 'Replayed data does not match the recorded extraction.'
+
+
+def test_replay_at_original_timing(tmp_path):
+    capture_file = tmp_path / 'session.cap'
+    _record(capture_file, [3000, 3001], latency=0.1)
+    records = [record for record in read_capture(capture_file) if record[0] == INBOUND]
+    duration = (records[-1][1] - records[0][1]) / 1e9
+    start = perf_counter()
+    HistoricalDataExtractor().replay_session(capture_file, realtime=True)
+    assert perf_counter() - start >= duration * 0.9, 'Messages were not replayed at their original pace.'
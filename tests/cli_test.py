@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+from os.path import abspath
+from os.path import dirname
+
+from tws_equities import controller
+from tws_equities.settings import DEFAULT_TICKERS_FILE
+
+
+"""
+    Commands triggered from the CLI without target tickers fall back to the default input file.
+    These tests need no connection to TWS, the CLI one runs a fresh interpreter.
+
+    Here's how you can trigger these tests:
+        - pytest tests/cli_test.py
+"""
+
+
+def test_metrics_receive_default_tickers_as_a_list(monkeypatch):
+    received = []
+    monkeypatch.setattr(controller, 'generate_metrics',
+                        lambda dates, bar_size, tickers, **_: received.append(tickers))
+    controller.metrics(DEFAULT_TICKERS_FILE, end_date='20210104')
+    assert isinstance(received[0], list) and 1301 in received[0], 'Default input file was not loaded as a list.'
+
+
+def test_metrics_command_with_default_tickers():
+    command = [sys.executable, '-m', 'tws_equities', 'metrics', '-ed', '20210104']
+    result = subprocess.run(command, cwd=dirname(dirname(abspath(__file__))), capture_output=True, text=True)
+    assert result.returncode == 0, f'Metrics command failed: {result.stderr}'
+    assert 'Program Crashed' not in result.stderr, f'Metrics command crashed: {result.stderr}'
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from ibapi import comm
+from ibapi.connection import Connection
+
+
+"""
+    FrameBuffer frames size prefixed messages received in arbitrary chunks, EReader receives straight into it
+    through Connection.recvMsgInto. Data is fed locally, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/comm_test.py
+"""
+
+
+def _framed(*payloads):
+    return b''.join(comm.make_msg(payload) for payload in payloads)
+
+
+def _read_all(frame_buf):
+    messages = []
+    for msg in frame_buf.messages():
+        messages.append(bytes(msg))
+        msg.release()
+    return messages
+
+
+class _Socket:
+    """
+        Hands out the given chunks through recv_into, one chunk per call, an empty chunk for a closed socket.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def recv_into(self, view):
+        chunk = self.chunks.pop(0)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+def _connection(chunks):
+    connection = Connection('127.0.0.1', 0)
+    connection.socket = _Socket(chunks)
+    return connection
+
+
+def test_message_split_across_receives():
+    frame_buf = comm.FrameBuffer()
+    data = _framed('first message', 'second')
+    frame_buf.extend(data[:6])
+    assert _read_all(frame_buf) == [], 'Incomplete message was handed out.'
+    frame_buf.extend(data[6:12])
+    assert _read_all(frame_buf) == [], 'Incomplete message was handed out.'
+    frame_buf.extend(data[12:])
+    assert _read_all(frame_buf) == [b'first message', b'second'], 'Messages were not re-assembled.'
+    assert len(frame_buf) == 0, 'Consumed messages were left in the buffer.'
+
+
+def test_size_prefix_split_across_receives():
+    frame_buf = comm.FrameBuffer()
+    data = _framed('payload')
+    for i in range(3):
+        frame_buf.extend(data[i:i + 1])
+        assert frame_buf.read_msg() is None, 'Message was read from a partial size prefix.'
+    frame_buf.extend(data[3:])
+    assert _read_all(frame_buf) == [b'payload'], 'Message with a split size prefix was not framed.'
+
+
+def test_buffer_grows_past_initial_capacity():
+    frame_buf = comm.FrameBuffer(capacity=16)
+    payload = 'x' * 1000
+    data = _framed(payload, 'tail')
+    for i in range(0, len(data), 100):
+        frame_buf.extend(data[i:i + 100])
+    assert len(frame_buf.buf) >= 1004, 'Buffer did not grow to fit the message.'
+    assert _read_all(frame_buf) == [payload.encode(), b'tail'], 'Large message was corrupted while growing.'
+
+
+def test_unread_data_is_compacted_instead_of_growing():
+    frame_buf = comm.FrameBuffer(capacity=32)
+    data = _framed('a' * 10, 'b' * 10)  # 28 bytes, second message is read in two parts
+    frame_buf.extend(data[:20])
+    assert _read_all(frame_buf) == [b'a' * 10], 'First message was not framed.'
+    assert frame_buf.start == 14, 'Read position did not move past the first message.'
+    frame_buf.extend(data[20:] + _framed('c' * 10))
+    assert len(frame_buf.buf) == 32, 'Buffer grew although compacting made enough room.'
+    assert _read_all(frame_buf) == [b'b' * 10, b'c' * 10], 'Unread data was corrupted by compaction.'
+
+
+def test_receive_into_frame_buffer():
+    data = _framed('first', 'second')
+    connection = _connection([data[:5], data[5:]])
+    frame_buf = comm.FrameBuffer(capacity=8)
+    received = 0
+    while len(connection.socket.chunks):
+        received += connection.recvMsgInto(frame_buf)
+    assert received == len(data), 'Not all the bytes were received.'
+    assert _read_all(frame_buf) == [b'first', b'second'], 'Received messages were not framed.'
+
+
+def test_zero_byte_receive_disconnects():
+    connection = _connection([b''])
+    socket = connection.socket
+    frame_buf = comm.FrameBuffer()
+    assert connection.recvMsgInto(frame_buf) == 0, 'Bytes were reported for a closed socket.'
+    assert socket.closed and not connection.isConnected(), 'Connection was not dropped after a zero-byte receive.'
+    assert connection.recvMsgInto(frame_buf) == 0, 'Disconnected connection received data.'
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+from ibapi.common import BarData
+from pytest import raises
+from tws_equities.tws_clients import HistoricalDataExtractor
+from tws_equities.tws_clients import data_extractor
+from tws_equities.tws_clients.retries import RetryPolicy
+
+
+"""
+    Exercises the book-keeping of HistoricalDataExtractor by invoking its callbacks directly,
+    no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/data_extractor_test.py
+"""
+
+
+def _extractor(**kwargs):
+    extractor = HistoricalDataExtractor(**kwargs)
+    extractor.data = {}
+    extractor._init_counters()
+    extractor._init_data_tracker(1301)
+    return extractor
+
+
+def _bar(time_stamp='2021-01-01 09:00:00', high=10.0, low=5.0, close=7.0, volume=100, count=3):
+    return {'time_stamp': time_stamp, 'open': 6.0, 'high': high, 'low': low, 'close': close, 'volume': volume,
+            'average': 7.0, 'count': count, 'session': 1}
+
+
+def test_duplicate_policies():
+    revision = _bar(high=12.0, low=4.0, close=8.0, volume=90, count=5)
+    expected = {'first': _bar(), 'last': revision,
+                'merge': _bar(high=12.0, low=4.0, close=8.0, volume=100, count=5)}
+    for policy, bar in expected.items():
+        extractor = _extractor(duplicate_policy=policy)
+        for received in [_bar(), _bar('2021-01-01 09:01:00'), revision]:
+            extractor._store_bar(1301, dict(received))
+        bar_data = extractor.data[1301]['bar_data']
+        assert len(bar_data) == 2, f'Duplicate bar was stored with policy: {policy}'
+        assert bar_data[0] == bar, f'Duplicate bar was not resolved as per policy: {policy}'
+
+
+def test_unknown_duplicate_policy():
+    with raises(ValueError):
+        HistoricalDataExtractor(duplicate_policy='ignore')
+
+
+class _OfflineExtractor(HistoricalDataExtractor):
+    """
+        Records requests instead of sending them to TWS.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = []
+
+    def isConnected(self):
+        return True
+
+    def reqHistoricalData(self, ticker, *args):
+        self.sent.append(ticker)
+
+    def cancelHistoricalData(self, ticker):
+        pass
+
+
+def test_failed_request_is_retried_first():
+    extractor = _OfflineExtractor(max_requests_in_flight=2, max_attempts=2)
+    extractor.pacer.identical_request_interval = 0
+    extractor._reset_attr(handshake_completed=True, data={}, _target_tickers=[1301, 1332, 1333],
+                          _pending=deque([1301, 1332, 1333]))
+    extractor._init_counters()
+    extractor._fill_request_slots()
+    assert extractor.sent == [1301, 1332], 'Request window was not filled.'
+    extractor.error(1301, 162, 'API historical data query cancelled: 1301')
+    assert extractor.sent == [1301, 1332, 1301], 'Failed request was not retried ahead of pending ones.'
+    extractor.error(1301, 162, 'API historical data query cancelled: 1301')
+    assert 1301 in extractor._failed_tickers and extractor.sent[-1] == 1333, \
+        'Ticker was not given up on after exhausting its attempts.'
+    extractor.historicalDataEnd(1332, '', '')
+    extractor.historicalDataEnd(1333, '', '')
+    assert extractor._extraction_completed(), 'Extraction did not complete.'
+
+
+def test_retries_depend_on_error_code():
+    extractor = _OfflineExtractor(max_requests_in_flight=3, max_attempts=3, retry_policy=RetryPolicy(jitter=0))
+    extractor.pacer.identical_request_interval = 0
+    extractor._set_target_tickers([1301, 1332, 1333, 1334, 1335])
+    extractor._reset_attr(handshake_completed=True)
+    extractor._fill_request_slots()
+    assert extractor.sent == [1301, 1332, 1333], 'Request window was not filled.'
+    extractor.error(1301, 200, 'No security definition has been found for the request')
+    assert 1301 in extractor._failed_tickers and extractor.sent[-1] == 1334, 'Permanent error was retried.'
+    extractor.error(1332, 162, 'Historical Market Data Service error message:Historical data request pacing '
+                               'violation')
+    assert 1332 in extractor._backoffs and extractor.sent[-1] == 1335, 'Pacing violation did not back off.'
+    extractor.error(1333, 504, 'Not connected')
+    assert extractor.sent[-1] == 1333 and extractor.data[1333]['meta_data']['attempts'] == 1, \
+        'Request lost with the connection was not sent again without counting the attempt.'
+    assert not extractor._extraction_completed(), 'Extraction completed while a ticker was backing off.'
+    extractor._backoffs.add(1332, 0)
+    for ticker in [1333, 1334, 1335]:
+        extractor.historicalDataEnd(ticker, '', '')
+    assert extractor.sent[-1] == 1332, 'Ticker was not requested again after its backoff.'
+
+
+def test_narrowed_request_window_recovers(monkeypatch):
+    monkeypatch.setattr(data_extractor, 'WINDOW_RECOVERY_INTERVAL', 0)
+    extractor = _OfflineExtractor(max_requests_in_flight=4)
+    extractor.pacer.identical_request_interval = 0
+    extractor._set_target_tickers(list(range(1301, 1311)))
+    extractor._reset_attr(handshake_completed=True)
+    extractor._fill_request_slots()
+    extractor.error(1304, 322, 'Only 50 simultaneous API historical data requests allowed.')
+    assert extractor.max_requests_in_flight == 3, 'Request window was not narrowed down.'
+    monkeypatch.setattr(data_extractor, 'WINDOW_RECOVERY_INTERVAL', 3600)
+    extractor.historicalDataEnd(1301, '', '')
+    assert extractor.max_requests_in_flight == 3, 'Request window was widened right after a rejection.'
+    monkeypatch.setattr(data_extractor, 'WINDOW_RECOVERY_INTERVAL', 0)
+    extractor.historicalDataEnd(1302, '', '')
+    extractor.historicalDataEnd(1303, '', '')
+    assert extractor.max_requests_in_flight == 4, 'Request window did not recover up to its configured size.'
+    assert len(extractor._requests_in_flight) == 4, 'Recovered slots were not filled.'
+
+
+
+def test_late_response_for_a_request_no_longer_in_flight_is_ignored():
+    # bars & end of data arrive for 1332 after its request was turned down & it is waiting to be sent again
+    extractor = _OfflineExtractor(max_requests_in_flight=2, retry_policy=RetryPolicy(jitter=0))
+    extractor.pacer.identical_request_interval = 0
+    extractor._set_target_tickers([1301, 1332])
+    extractor._reset_attr(handshake_completed=True)
+    extractor._fill_request_slots()
+    extractor.error(1332, 162, 'Historical Market Data Service error message:Historical data request pacing '
+                               'violation')
+    bar = BarData()
+    bar.date, bar.open, bar.high, bar.low, bar.close = '20210215 09:00:00', 6.0, 10.0, 5.0, 7.0
+    extractor.historicalData(1332, bar)
+    extractor.historicalDataBatch(1332, {'date': [20210215090100]})
+    extractor.historicalDataEnd(1332, '', '')
+    assert not extractor.data[1332]['bar_data'], 'Bars from a late response were stored.'
+    assert not extractor.data[1332]['meta_data']['status'] and 1332 not in extractor._processed_tickers, \
+        'Ticker was marked processed by a late response.'
+    assert 1332 in extractor._backoffs, 'Late response took the ticker out of its backoff.'
+    extractor.historicalData(1301, bar)
+    extractor.historicalDataEnd(1301, '', '')
+    assert extractor.data[1301]['meta_data']['status'], 'Response for a request in flight was ignored.'
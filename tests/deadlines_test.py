@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from tws_equities.tws_clients.deadlines import DeadlineScheduler
+
+
+"""
+    DeadlineScheduler tracks outstanding requests & reports the ones that crossed their deadline.
+    These tests drive the scheduler with an explicit clock, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/deadlines_test.py
+"""
+
+
+def test_requests_expire_in_deadline_order():
+    scheduler = DeadlineScheduler()
+    for ticker, timeout in [(1301, 5), (1332, 3), (1333, 10)]:
+        scheduler.add(ticker, timeout, now=100)
+    assert scheduler.next_deadline() == 103, 'Earliest deadline was not reported.'
+    assert scheduler.pop_expired(now=104) == [1332], 'Request did not expire on time.'
+    assert scheduler.pop_expired(now=120) == [1301, 1333], 'Requests did not expire in deadline order.'
+    assert len(scheduler) == 0 and scheduler.next_deadline() is None, 'Expired requests are still outstanding.'
+    assert scheduler.stats['expired'] == 3
+
+
+def test_finished_and_rescheduled_requests_do_not_expire():
+    scheduler = DeadlineScheduler()
+    scheduler.add(1301, 3, now=100)
+    scheduler.add(1332, 3, now=100)
+    assert scheduler.finish(1301, now=101.5), 'Outstanding request could not be finished.'
+    scheduler.add(1332, 10, now=102)  # retry replaces the previous deadline
+    assert scheduler.pop_expired(now=105) == [], 'Finished or re-scheduled request expired.'
+    assert 1332 in scheduler and 1301 not in scheduler
+    assert scheduler.stats['finished'] == 1 and scheduler.stats['max_latency'] == 1.5
+    assert scheduler.stats['peak_outstanding'] == 2
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+from os import environ
+from os.path import abspath
+from os.path import dirname
+
+from ibapi import comm
+from ibapi import utils
+from ibapi.decoder import Decoder
+from ibapi.server_versions import MIN_SERVER_VER_SYNT_REALTIME_BARS
+from ibapi.wrapper import EWrapper
+
+
+"""
+    Decoder delivers historical data either bar by bar or, for wrappers that override "historicalDataBatch",
+    as typed columns in a single call. Both paths must decode the same values.
+    Per field logging is stripped from the decode path, unless switched on at start-up.
+    Messages are built locally, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/decoder_test.py
+"""
+
+
+_BARS = [('20210101  09:00:00', '1000.0', '1010.0', '990.0', '1005.0', '12300', '1001.5', '42'),
+         ('20210101  09:01:00', '1005.0', '1006.0', '1001.0', '1002.0', '800', '1003.25', '7')]
+
+
+class _BarWrapper(EWrapper):
+    def __init__(self):
+        EWrapper.__init__(self)
+        self.bars, self.ended = [], False
+
+    def historicalData(self, reqId, bar):
+        self.bars.append(bar)
+
+    def historicalDataEnd(self, reqId, start, end):
+        self.ended = True
+
+
+class _BatchWrapper(_BarWrapper):
+    def historicalDataBatch(self, reqId, columns):
+        self.columns = columns
+
+
+def _historical_data_fields():
+    fields = ['17', '1301', '20210101  09:00:00', '20210101  09:02:00', str(len(_BARS))]
+    for bar in _BARS:
+        fields += bar
+    return comm.read_fields(''.join(comm.make_field(field) for field in fields))
+
+
+def test_batch_path_is_opt_in():
+    assert not Decoder(_BarWrapper(), MIN_SERVER_VER_SYNT_REALTIME_BARS).useHistoricalDataBatch, \
+        'Batch path was used without overriding historicalDataBatch.'
+    assert Decoder(_BatchWrapper(), MIN_SERVER_VER_SYNT_REALTIME_BARS).useHistoricalDataBatch, \
+        'Batch path was not used after overriding historicalDataBatch.'
+
+
+def test_batch_matches_bar_by_bar():
+    bar_wrapper, batch_wrapper = _BarWrapper(), _BatchWrapper()
+    for wrapper in [bar_wrapper, batch_wrapper]:
+        Decoder(wrapper, MIN_SERVER_VER_SYNT_REALTIME_BARS).interpret(_historical_data_fields())
+        assert wrapper.ended, 'End of data set was not signalled.'
+    columns = batch_wrapper.columns
+    assert list(columns['date']) == [20210101090000, 20210101090100], 'Timestamps were not decoded.'
+    for i, bar in enumerate(bar_wrapper.bars):
+        assert (bar.open, bar.high, bar.low, bar.close, bar.average) == \
+               (columns['open'][i], columns['high'][i], columns['low'][i], columns['close'][i],
+                columns['average'][i]), 'Prices differ between the two paths.'
+        assert (bar.volume, bar.barCount) == (columns['volume'][i], columns['barCount'][i]), \
+            'Volume or bar count differ between the two paths.'
+
+
+def test_hot_path_logging_is_stripped_by_default(monkeypatch):
+    def fail(*args):
+        raise AssertionError('Decode path logged a field, even though hot path logging is switched off.')
+    assert not utils.HOT_PATH_LOGGING, 'Hot path logging should be switched off by default.'
+    monkeypatch.setattr(utils.logger, 'debug', fail)
+    wrapper = _BarWrapper()
+    Decoder(wrapper, MIN_SERVER_VER_SYNT_REALTIME_BARS).interpret(_historical_data_fields())
+    assert len(wrapper.bars) == len(_BARS), 'Bars were not decoded.'
+
+
+def test_hot_path_logging_switch():
+    script = ('import logging; logging.basicConfig(level=logging.DEBUG); from ibapi.utils import decode; '
+              'decode(int, iter([b"42"]))')
+    for switch, expected in [('1', True), ('0', False)]:
+        output = subprocess.run([sys.executable, '-c', script], cwd=dirname(dirname(abspath(__file__))),
+                                capture_output=True, text=True, check=True,
+                                env={**environ, 'IBAPI_HOT_PATH_LOGGING': switch}).stderr
+        assert ('decode' in output) == expected, f'Hot path logging did not follow the switch: {switch}'
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pandas as pd
+import pytest
+
+from tws_equities.data_files import historical_data
+from tws_equities.data_files.historical_data import compute_extraction_metrics
+from tws_equities.data_files.historical_data import create_csv_dump
+from tws_equities.data_files.historical_data import create_dumps
+from tws_equities.data_files.historical_data import generate_extraction_status_sheets
+from tws_equities.data_files.historical_data import generate_failure_csv
+from tws_equities.data_files.historical_data import generate_failure_parquet
+from tws_equities.data_files.historical_data import generate_metrics
+from tws_equities.data_files.historical_data import generate_success_csv
+from tws_equities.data_files.historical_data import generate_success_parquet
+from tws_equities.data_files.historical_data import read_extracted_data
+from tws_equities.helpers import BarStore
+
+
+"""
+    Converters write data cached in a bar store to the final output files.
+    These tests write to a temporary directory, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/historical_data_test.py
+"""
+
+
+def _bar(time_stamp, close):
+    return {'time_stamp': time_stamp, 'session': 1, 'open': close, 'high': close, 'low': close,
+            'close': close, 'volume': 100, 'average': close, 'count': 10}
+
+
+def _data(ticker, bar_data=None, error_stack=None):
+    meta_data = {'ecode': ticker, 'status': bar_data is not None, '_error_stack': error_stack or []}
+    return {'meta_data': meta_data, 'bar_data': bar_data or []}
+
+
+def test_csv_rows_are_sorted_by_ticker_and_time(tmp_path):
+    with BarStore(str(tmp_path)) as store:
+        store.extend({1332: _data(1332, [_bar('2021-01-04 09:01:00', 2.0), _bar('2021-01-04 09:00:00', 1.0)]),
+                      1301: _data(1301, [_bar('2021-01-04 09:00:00', 3.0)]),
+                      1305: _data(1305, error_stack=[{'code': 162, 'message': 'no data'}]),
+                      1302: _data(1302)})
+        generate_success_csv(store, str(tmp_path / 'success.csv'))
+        generate_failure_csv(store, str(tmp_path / 'failure.csv'))
+    success = pd.read_csv(tmp_path / 'success.csv')
+    assert list(success.columns) == ['time_stamp', 'ecode', 'session', 'open', 'high', 'low', 'close',
+                                     'volume', 'average', 'count'], 'Unexpected columns in success file.'
+    assert list(success['ecode']) == [1301, 1332, 1332], 'Rows are not in ticker order.'
+    assert list(success['close']) == [3.0, 1.0, 2.0], 'Rows are not in time order.'
+    failure = pd.read_csv(tmp_path / 'failure.csv')
+    assert failure.values.tolist() == [[1302, 'unknown', 'not available'], [1305, '162', 'no data']], \
+        'Error stacks were not written as expected.'
+
+
+
+def test_parquet_round_trip_matches_csv(tmp_path):
+    pytest.importorskip('pyarrow')
+    with BarStore(str(tmp_path)) as store:
+        store.extend({1332: _data(1332, [_bar('2021-01-04 09:01:00', 2.5), _bar('2021-01-04 09:00:00', 1.0)]),
+                      1301: _data(1301, [_bar('2021-01-04 09:00:00', 3.0)]),
+                      1305: _data(1305, error_stack=[{'code': 162, 'message': 'no data'}]),
+                      1302: _data(1302)})
+        for name, csv_writer, parquet_writer in [('success', generate_success_csv, generate_success_parquet),
+                                                 ('failure', generate_failure_csv, generate_failure_parquet)]:
+            csv_writer(store, str(tmp_path / f'{name}.csv'))
+            parquet_writer(store, str(tmp_path / f'{name}.parquet'))
+    for name in ['success', 'failure']:
+        # latest of the two files is read, make sure that it is the Parquet one
+        os.utime(tmp_path / f'{name}.csv', (0, 0))
+
+    success = read_extracted_data(str(tmp_path), 'success')
+    expected = pd.read_csv(tmp_path / 'success.csv', parse_dates=['time_stamp'])
+    assert list(success.columns) == list(expected.columns), 'Parquet columns differ from CSV columns.'
+    pd.testing.assert_frame_equal(success, expected, check_dtype=False)
+    assert pd.api.types.is_datetime64_any_dtype(success['time_stamp']), 'Time stamps were not typed.'
+    for column in ['ecode', 'session', 'volume', 'count']:
+        assert pd.api.types.is_integer_dtype(success[column]), f'Column: {column} is not an integer.'
+    for column in ['open', 'high', 'low', 'close', 'average']:
+        assert pd.api.types.is_float_dtype(success[column]), f'Column: {column} is not a float.'
+
+    failure = read_extracted_data(str(tmp_path), 'failure')
+    expected = pd.read_csv(tmp_path / 'failure.csv', dtype={'code': str})
+    pd.testing.assert_frame_equal(failure, expected, check_dtype=False)
+    assert list(read_extracted_data(str(tmp_path), 'success', columns=['ecode']).columns) == ['ecode']
+
+def test_parallel_dump_matches_sequential_dump(tmp_path, monkeypatch):
+    monkeypatch.setattr(historical_data, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(historical_data, 'HISTORICAL_DATA_STORAGE', str(tmp_path / 'output'))
+    monkeypatch.setattr(historical_data, '_SHARD_TICKERS', 2)
+    dates = ['20210104', '20210105']
+    for date in dates:
+        store_directory = tmp_path / 'cache' / '1min' / date / '15_01_00'
+        store_directory.mkdir(parents=True)
+        with BarStore(str(store_directory)) as store:
+            store.extend({ticker: _data(ticker, [_bar(f'{date[:4]}-01-{date[6:]} 09:00:00', ticker / 100)])
+                          for ticker in range(1301, 1308)})
+            store.append(1400, _data(1400, error_stack=[{'code': 162, 'message': 'no data'}]))
+
+    output_directory = tmp_path / 'output' / '1min' / '2021' / 'january'
+    create_dumps(dates, workers=2)
+    parallel = {date: (output_directory / date / 'success.csv').read_text() for date in dates}
+    assert not (output_directory / dates[0] / '.parts').exists(), 'Part files were not cleaned up.'
+    for date in dates:
+        create_csv_dump(date)
+        assert (output_directory / date / 'success.csv').read_text() == parallel[date], \
+            f'Parallel dump differs from sequential dump for: {date}'
+
+
+def test_extraction_metrics_by_group():
+    input_data = pd.DataFrame({'code': [1301, 1332, 1333, 1334], 'topix': [1, 1, 0, 1], 'nikkei225': [0, 1, 0, 0],
+                               'jasdaq20': [0, 0, 0, 0], 'section': ['First Section', 'First Section', 'Mothers',
+                                                                     'Second Section'],
+                               'market_cap': [5e+9, 20e+9, 1e+9, 10e+9], 'pv': [0, 0, 0, 0]})
+    success = pd.DataFrame({'ecode': [1301, 1301, 1332, 1332, 1333]})
+    failure = pd.DataFrame({'ecode': [1334]})
+    metrics = compute_extraction_metrics(success, failure, input_data)
+    assert (metrics['total'], metrics['extracted'], metrics['failed'], metrics['missed']) == (4, 3, 1, 0)
+    assert (metrics['total_topix'], metrics['extracted_topix'], metrics['failed_topix']) == (3, 2, 1), \
+        'Topix metrics are incorrect.'
+    assert metrics['extraction_ratio_topix'] == 0.667, 'Extraction ratio was not rounded.'
+    assert (metrics['total_mcap_above_10b'], metrics['extracted_mcap_above_10b']) == (2, 1)
+    assert (metrics['total_jasdaq20'], metrics['extraction_ratio_jasdaq20']) == (0, 0), \
+        'Empty group should have a zero ratio.'
+
+
+def test_status_sheets_for_multiple_dates(tmp_path):
+    input_data = pd.DataFrame({'code': [1301, 1332, 1333], 'name': ['A, Inc.', 'B\n"Holdings"', 'C'],
+                               'status': ['A', 'A', 'D']})
+    generate_extraction_status_sheets([(str(tmp_path), '20210104', [1301, 1333]),
+                                       (str(tmp_path), '20210105', [1332])], input_data)
+    first, second = [pd.read_csv(tmp_path / f'status_{date}.csv', dtype=str, keep_default_na=False)
+                     for date in ('20210104', '20210105')]
+    assert list(first.columns) == ['code', 'name', 'status', 'extraction_status']
+    assert list(first.name) == ['A, Inc.', 'B\n"Holdings"', 'C'], 'Input columns were not written as they are.'
+    assert list(first.extraction_status) == ['True', 'False', 'N/A'], 'Unexpected status for first date.'
+    assert list(second.extraction_status) == ['False', 'True', 'N/A'], 'Unexpected status for second date.'
+
+
+def test_metrics_are_skipped_for_unreadable_input(tmp_path, monkeypatch, caplog):
+    def _open_metrics_store():
+        raise AssertionError('Metrics store was opened for an unreadable input.')
+
+    monkeypatch.setattr(historical_data, '_open_metrics_store', _open_metrics_store)
+    input_file = tmp_path / 'tickers.csv'
+    input_file.write_text('ecode,name\n1301,A\n')  # ticker list, no status & group columns
+    generate_metrics(['20210104'], '1 min', str(input_file))
+    generate_metrics(['20210104'], '1 min', str(tmp_path / 'missing.csv'))
+    messages = [record.getMessage() for record in caplog.records if record.levelname == 'CRITICAL']
+    assert len(messages) == 2 and 'status' in messages[0], 'Unreadable input was not logged.'
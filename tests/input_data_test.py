@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from os import listdir
+from os import utime
+
+import pandas as pd
+from pytest import raises
+
+from tws_equities.data_files.input_data import _compile_japan_indices
+from tws_equities.data_files.input_data import get_tickers_from_user_file
+from tws_equities.data_files.input_data import snapshot
+
+
+"""
+    Input files are compiled into snapshots, which are re-used until the input file changes.
+    These tests write to a temporary directory, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/input_data_test.py
+"""
+
+
+def test_snapshot_is_rebuilt_when_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, '_SNAPSHOT_DIRECTORY', str(tmp_path / 'snapshots'))
+    file_path = str(tmp_path / 'tickers.csv')
+    pd.DataFrame({'Code': [1332, 1301, 1301, 1333, None], 'Status': ['A', 'D', 'A', 'D', 'A']}).to_csv(file_path)
+    assert get_tickers_from_user_file(file_path) == [1301, 1332], 'Only active tickers should be loaded.'
+
+    compiled = []
+    monkeypatch.setattr(pd, 'read_csv', lambda *args, **kwargs: compiled.append(args) or pd.DataFrame())
+    assert get_tickers_from_user_file(file_path) == [1301, 1332], 'Snapshot was not re-used.'
+    assert not compiled, 'Input file was parsed again, even though it did not change.'
+    monkeypatch.undo()
+
+    monkeypatch.setattr(snapshot, '_SNAPSHOT_DIRECTORY', str(tmp_path / 'snapshots'))
+    pd.DataFrame({'ecode': [1401, 1301]}).to_csv(file_path, index=False)
+    utime(file_path, ns=(0, 10 ** 18))  # file may be re-written within the resolution of modification time
+    assert get_tickers_from_user_file(file_path) == [1301, 1401], 'Snapshot was not re-built for a new file.'
+    for directory in listdir(tmp_path / 'snapshots'):
+        assert sorted(listdir(tmp_path / 'snapshots' / directory)) == ['active.npy', 'key.json', 'tickers.npy'], \
+            'Temporary files were left behind.'
+
+
+def test_membership_bitset_is_as_wide_as_the_indices(tmp_path):
+    file_path = str(tmp_path / 'japan_indices.csv')
+    pd.DataFrame({f'index_{i}': [f'{1301 + i}.T', '1301.T'] for i in range(12)}).to_csv(file_path, index=False)
+    compiled = _compile_japan_indices(file_path)
+    assert compiled['membership'].dtype.itemsize == 2, 'Bitset does not fit 12 indices.'
+    members = {str(index): compiled['tickers'][(compiled['membership'] >> bit) & 1 == 1].tolist()
+               for bit, index in enumerate(compiled['indices'])}
+    assert members['index_11'] == [1301, 1312] and members['index_0'] == [1301], 'Membership was not kept.'
+    pd.DataFrame({f'index_{i}': ['1301.T'] for i in range(65)}).to_csv(file_path, index=False)
+    with raises(ValueError):
+        _compile_japan_indices(file_path)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import connect_extractor
+from tests.tws_simulator import relax_pacing
+from tws_equities import tws_clients
+from tws_equities.tws_clients import ExtractionSession
+from tws_equities.tws_clients import extract_historical_data
+from tws_equities.tws_clients.instrumentation import Instruments
+
+
+"""
+    Instruments trace every historical data request & aggregate the traces into counters and histograms.
+    Unit tests drive the instruments with an explicit clock, the end-to-end ones run against a local TWS simulator.
+
+    Here's how you can trigger these tests:
+        - pytest tests/instrumentation_test.py
+"""
+
+
+def test_request_traces_are_aggregated():
+    instruments = Instruments(clock=lambda: 100)
+    instruments.request_sent(1301, attempt=1, queued_at=99.5, now=100)
+    instruments.bars_received(1301, 300, now=100.2)
+    instruments.request_ended(1301, size=4096, now=100.3)
+    instruments.request_sent(1332, attempt=2, queued_at=100, now=100)
+    instruments.request_failed(1332, 162, now=101)
+    instruments.request_failed(1332, 162)  # late error for a request that is no longer open
+
+    snapshot = instruments.snapshot(traces=True, now=110)
+    assert snapshot['counters']['requests_completed'] == 1 and snapshot['counters']['requests_failed'] == 1
+    assert snapshot['counters']['requests_retried'] == 1, 'Second attempt was not counted as a retry.'
+    assert snapshot['counters']['bytes_received'] == 4096 and snapshot['bars_per_second'] == 30.0
+    assert snapshot['errors'] == {'162': 2}, 'Error codes were not counted.'
+    latency = snapshot['histograms']['request_latency_seconds']
+    assert latency['count'] == 1 and latency['p50'] == 0.5, 'Latency was not observed in the right bucket.'
+    assert snapshot['histograms']['queue_wait_seconds']['sum'] == 0.5, 'Queue wait was not observed.'
+    assert [trace['ticker'] for trace in snapshot['traces']] == [1301, 1332], 'Traces were not kept in order.'
+    assert snapshot['traces'][0]['first_bar_at'] == 100.2 and snapshot['traces'][1]['error_codes'] == [162]
+
+    text = instruments.to_prometheus(now=110)
+    assert 'tws_extractor_requests_completed_total 1\n' in text, 'Counter missing from Prometheus export.'
+    assert 'tws_extractor_errors_total{code="162"} 2\n' in text, 'Error codes missing from Prometheus export.'
+    assert 'tws_extractor_request_latency_seconds_bucket{le="+Inf"} 1\n' in text, 'Histogram missing.'
+
+
+def test_overflow_bucket_is_exported_as_valid_json():
+    instruments = Instruments(clock=lambda: 100)
+    instruments.request_sent(1301, now=100)
+    instruments.request_ended(1301, now=200)  # beyond the largest latency bucket
+    snapshot = json.loads(instruments.to_json(now=200), parse_constant=lambda constant: None)
+    latency = snapshot['histograms']['request_latency_seconds']
+    assert latency['p50'] == latency['p99'] == 60, 'Overflow was not reported as the largest bound.'
+
+
+def test_instruments_since_checkpoint():
+    instruments = Instruments(clock=lambda: 100)
+    instruments.request_sent(1301, now=100)
+    instruments.request_failed(1301, 162, now=101)
+    instruments.request_sent(1332, now=101)  # still open when the checkpoint is taken
+    checkpoint = instruments.checkpoint(now=102)
+    instruments.request_sent(1301, attempt=2, now=102)
+    instruments.bars_received(1301, 300, now=103)
+    instruments.request_ended(1301, size=4096, now=103)
+
+    snapshot = instruments.since(checkpoint).snapshot(traces=True, now=112)
+    assert snapshot['counters']['requests_sent'] == 1 and snapshot['counters']['requests_failed'] == 0
+    assert snapshot['counters']['bars_received'] == 300 and snapshot['bars_per_second'] == 30.0
+    assert snapshot['errors'] == {}, 'Errors received before the checkpoint were reported.'
+    assert snapshot['histograms']['request_latency_seconds']['count'] == 1, 'Histograms were not subtracted.'
+    assert [trace['ticker'] for trace in snapshot['traces']] == [1301], 'Traces before the checkpoint were kept.'
+    assert snapshot['requests_in_flight'] == 1, 'Open requests were lost.'
+    assert instruments.snapshot()['counters']['requests_sent'] == 3, 'Session instruments were altered.'
+
+
+def test_instrumentation_is_exported_per_date(tmp_path, monkeypatch):
+    monkeypatch.setattr(tws_clients, 'CACHE_DIR', str(tmp_path))
+    with TWSSimulator() as simulator, ExtractionSession(*simulator.address, client_id=1) as session:
+        relax_pacing(session.client)
+        for end_date, tickers in [('20210216', [1301, 1302]), ('20210217', [1301, 1332, 1333])]:
+            extract_historical_data(tickers, end_date=end_date, end_time='15:01:00', session=session)
+        total = session.instruments.snapshot()
+    snapshots = []
+    for end_date in ['20210216', '20210217']:
+        with open(tmp_path / '1min' / end_date / '15_01_00' / 'instrumentation.json', 'r') as f:
+            snapshots.append(json.loads(f.read()))
+    assert [snapshot['counters']['requests_sent'] for snapshot in snapshots] == [2, 3], 'Dates were mixed up.'
+    assert snapshots[0]['errors'] == {'200': 1} and snapshots[1]['errors'] == {}, 'Errors were carried over.'
+    assert total['counters']['requests_sent'] == 5, 'Session instruments lost the running total.'
+
+
+def test_snapshot_is_exported_after_extraction(tmp_path):
+    path = str(tmp_path / 'instrumentation.json')
+    with TWSSimulator(latency=0.01) as simulator:
+        extractor = connect_extractor(simulator, instrumentation_file=path)
+        extractor.extract_historical_data([1301, 1302])
+    with open(path, 'r') as f:
+        snapshot = json.loads(f.read())
+    assert snapshot['counters']['requests_completed'] == 1, 'Completed request was not instrumented.'
+    assert snapshot['counters']['bars_received'] == 302 and snapshot['counters']['bytes_received'] > 0
+    assert snapshot['errors'] == {'200': 1}, 'Failed request was not instrumented.'
+    assert snapshot['histograms']['first_bar_seconds']['sum'] >= 0.01, 'Latency was not measured.'
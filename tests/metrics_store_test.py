@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from tws_equities.helpers import MetricsStore
+
+
+"""
+    MetricsStore keeps daily extraction metrics in a SQLite table keyed by date.
+    These tests write to a temporary directory, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/metrics_store_test.py
+"""
+
+
+def test_upsert_and_range_query(tmp_path):
+    path = str(tmp_path / 'metrics.db')
+    with MetricsStore(path) as store:
+        for day in (5, 4, 6):
+            store.upsert(f'2021-01-0{day}', {'total': 10, 'extracted': day, 'extraction_ratio': day / 10})
+        store.upsert('2021-01-05', {'total': 10, 'extracted': 9, 'extraction_ratio': 0.9})  # recomputed date
+    with MetricsStore(path) as store:
+        store.upsert('2021-01-07', {'total': 10, 'extracted': 10, 'extraction_ratio': 1.0, 'total_topix': 4})
+        data = store.query(start='2021-01-05', end='2021-01-06')
+        assert list(data.date) == ['2021-01-05', '2021-01-06'], 'Range query returned unexpected dates.'
+        assert list(data.extracted) == [9, 6], 'Recomputed metrics did not replace the older ones.'
+        data = store.query()
+        assert data.shape[0] == 4, 'Each date should have a single row.'
+        assert list(data.total_topix.isna()) == [True, True, True, False], 'New metric was not added.'
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from tws_equities.tws_clients.pacing import PacingEngine
+from tws_equities.tws_clients.pacing import is_small_bar_size
+
+
+"""
+    PacingEngine computes how long a historical data request must wait to stay within TWS API limits.
+    These tests drive the engine with an explicit clock, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/pacing_test.py
+"""
+
+
+def _contract(ticker):
+    return ticker, 'SMART', 'TRADES'
+
+
+def _request(ticker, end_date='20210101'):
+    return ticker, end_date, '15:01:00', '1 D', '1 min', 'TRADES', 0
+
+
+def test_identical_request_is_held_back():
+    pacer = PacingEngine()
+    pacer.record(_contract(1301), _request(1301), now=100)
+    assert pacer.delay(_contract(1301), _request(1301), now=105) == 10, 'Identical request was not delayed.'
+    assert pacer.delay(_contract(1301), _request(1301, '20210102'), now=105) == 0, \
+        'Request for a different date should not be delayed.'
+    assert pacer.delay(_contract(1301), _request(1301), now=115) == 0, 'Identical request delayed for too long.'
+
+
+def test_contract_request_limit():
+    pacer = PacingEngine()
+    for i in range(5):
+        pacer.record(_contract(1301), _request(1301, f'2021010{i + 1}'), now=100 + i * 0.1)
+    delay = pacer.delay(_contract(1301), _request(1301, '20210108'), now=100.5)
+    assert round(delay, 3) == 1.5, 'Sixth request for the same contract within 2 seconds was not delayed.'
+    assert pacer.delay(_contract(1332), _request(1332), now=100.5) == 0, 'Other contracts should not be delayed.'
+
+
+def test_request_window_applies_to_small_bars_only():
+    pacer = PacingEngine(request_limit=3, request_window=600)
+    for ticker in [1301, 1332, 1376]:
+        pacer.record(_contract(ticker), _request(ticker), small_bars=True, now=100)
+    assert pacer.delay(_contract(1377), _request(1377), small_bars=True, now=160) == 540
+    assert pacer.delay(_contract(1377), _request(1377), small_bars=False, now=160) == 0
+    assert pacer.window_delay(now=700) == 0, 'Request window did not slide.'
+    assert is_small_bar_size('30 secs') and not is_small_bar_size('1 min')
+
+
+def test_queue_wait_stats():
+    pacer = PacingEngine()
+    assert pacer.record(_contract(1301), _request(1301), queued_at=90, now=100) == 10
+    assert pacer.record(_contract(1332), _request(1332), queued_at=98, now=100) == 2
+    assert pacer.stats['requests'] == 2 and pacer.stats['max_wait'] == 10
+    assert pacer.mean_wait == 6
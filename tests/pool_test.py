@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from pytest import raises
+
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import relax_pacing
+from tws_equities.tws_clients import ConnectionPool
+from tws_equities.tws_clients import ExtractionSession
+
+
+"""
+    ConnectionPool shards tickers across several sessions & merges what they extract.
+    These tests run the pool against local TWS simulators, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/pool_test.py
+"""
+
+
+def _pool(*gateways):
+    pool = ConnectionPool(size=len(gateways), gateways=gateways, base_client_id=1)
+    for session in pool.sessions:
+        relax_pacing(session.client)
+    return pool
+
+
+def test_tickers_are_sharded_round_robin():
+    pool = ConnectionPool(size=3)
+    assert pool._shard(range(7)) == [[0, 3, 6], [1, 4], [2, 5]], 'Tickers were not sharded round-robin.'
+    assert [session.client_id for session in pool.sessions] == [10, 11, 12], 'Client IDs are not distinct.'
+
+
+def test_pool_output_matches_single_session():
+    tickers = list(range(7000, 7020)) + [1302, 1301]  # 1302 is answered with error code 200
+    with TWSSimulator() as first, TWSSimulator() as second:
+        with _pool(first.address, second.address) as pool:
+            pooled = pool.extract(tickers, '20210216')
+            instruments = pool.instruments.snapshot()
+        requests = [first.stats['requests'], second.stats['requests']]
+        with ExtractionSession(*first.address, client_id=3) as session:
+            relax_pacing(session.client)
+            single = session.extract(tickers, '20210216')
+    assert pooled == single, 'Merged output does not match the output of a single session.'
+    assert requests == [11, 11], 'Tickers were not spread across the connections.'
+    assert instruments['counters']['requests_sent'] == 22, 'Instruments were not merged across sessions.'
+    assert instruments['counters']['requests_completed'] == 21 and instruments['errors'] == {'200': 1}
+
+
+def test_healthy_sessions_finish_when_one_fails():
+    with TWSSimulator() as healthy:
+        unreachable = TWSSimulator()  # never started, nothing listens on its address once it is stopped
+        address = unreachable.address
+        unreachable.stop()
+        chunks = []
+        with _pool(healthy.address, address) as pool:
+            with raises(ConnectionError):
+                for chunk in pool.iter_extract(range(7000, 7010), '20210216'):
+                    chunks.append(chunk)
+    extracted = {ticker for chunk in chunks for ticker in chunk}
+    assert extracted == set(range(7000, 7010, 2)), 'Shard of the healthy session was not handed over.'
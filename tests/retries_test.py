@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from tws_equities.tws_clients.retries import CONNECTIVITY
+from tws_equities.tws_clients.retries import PACING
+from tws_equities.tws_clients.retries import PERMANENT
+from tws_equities.tws_clients.retries import TRANSIENT
+from tws_equities.tws_clients.retries import RetryPolicy
+from tws_equities.tws_clients.retries import classify
+
+
+"""
+    RetryPolicy decides whether & when a failed historical data request is sent again, based on its error codes.
+    No connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/retries_test.py
+"""
+
+
+_PACING = {'code': 162, 'message': 'Historical Market Data Service error message:Historical data request pacing '
+                                   'violation'}
+_NO_DATA = {'code': 162, 'message': 'Historical Market Data Service error message:HMDS query returned no data'}
+_TIMEOUT = {'code': -1, 'message': 'Data request for ticker: 1301 timed out after: 3 seconds'}
+
+
+def test_errors_are_classified():
+    assert classify(**_PACING) == PACING and classify(322) == PACING, 'Pacing violation was not recognized.'
+    assert classify(**_NO_DATA) == PERMANENT and classify(200) == PERMANENT, 'Permanent error was not recognized.'
+    assert classify(504) == CONNECTIVITY and classify(1100) == CONNECTIVITY, 'Connection loss was not recognized.'
+    assert classify(**_TIMEOUT) == TRANSIENT, 'Timeout was not treated as transient.'
+    assert classify(162, 'API historical data query cancelled: 1301') == TRANSIENT
+
+
+def test_pacing_violations_back_off_exponentially():
+    policy = RetryPolicy(base_delay=2, max_delay=10, jitter=0, max_backoffs=5)
+    assert policy.backoff([_TIMEOUT]) == 0, 'Transient error was not retried right away.'
+    assert policy.backoff([_PACING]) is not None and policy.backoff([_TIMEOUT, _NO_DATA]) is None, \
+        'Permanent error was retried.'
+    delays = [policy.backoff([_TIMEOUT] + [_PACING] * violations) for violations in range(1, 7)]
+    assert delays == [2, 4, 8, 10, 10, None], 'Backoff was not doubled, capped & given up on.'
+    jittered = RetryPolicy(base_delay=2, jitter=0.5, seed=1)
+    delays = [jittered.backoff([_PACING]) for _ in range(20)]
+    assert all(1 <= delay <= 2 for delay in delays) and len(set(delays)) > 1, 'Backoff was not jittered.'
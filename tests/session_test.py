@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import relax_pacing
+from tws_equities import tws_clients
+from tws_equities.helpers import BarStore
+from tws_equities.tws_clients import ExtractionSession
+from tws_equities.tws_clients import data_extractor
+from tws_equities.tws_clients import extract_historical_data
+
+
+"""
+    ExtractionSession keeps a single connection to TWS API open across dates & batches.
+    These tests run the session against a local TWS simulator, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/session_test.py
+"""
+
+
+def _session(simulator, **kwargs):
+    session = ExtractionSession(*simulator.address, client_id=1, **kwargs)
+    relax_pacing(session.client)
+    return session
+
+
+def _extracted(data):
+    return all(data[ticker]['meta_data']['status'] for ticker in data)
+
+
+def test_connection_is_shared_across_dates_and_batches():
+    with TWSSimulator() as simulator:
+        with _session(simulator) as session:
+            first = session.extract(range(6000, 6010), '20210216')
+            second = session.extract(range(6000, 6010), '20210217')
+            chunks = list(session.iter_extract(range(6010, 6020), '20210217', chunk_size=4))
+            assert session.is_connected, 'Connection was not kept alive between extractions.'
+        assert not session.is_connected, 'Connection was not closed along with the session.'
+        session.close()  # closing a closed session is a no-op
+        stats = dict(simulator.stats)
+    assert _extracted(first) and _extracted(second), 'Some tickers were not extracted.'
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2], 'Data was not handed over in chunks.'
+    assert stats['connections'] == 1, 'Connection was not re-used across dates & batches.'
+    assert stats['requests'] == 30, 'Unexpected number of requests.'
+
+
+def test_session_reconnects_after_disconnect(monkeypatch):
+    monkeypatch.setattr(data_extractor, 'RECONNECT_DELAY', 0.01)
+    with TWSSimulator(latency=0.005, disconnect_after=5) as simulator, _session(simulator) as session:
+        first = session.extract(range(6000, 6020), '20210216')
+        second = session.extract(range(6020, 6030), '20210216')
+        stats = dict(simulator.stats)
+    assert _extracted(first) and _extracted(second), 'Some tickers were not extracted.'
+    assert stats['connections'] == 2 and stats['disconnects'] == 1, 'Session did not re-connect.'
+    attempts = {meta_data['attempts'] for meta_data in (first[t]['meta_data'] for t in first)}
+    assert attempts == {1}, 'Requests lost with the connection were counted against the attempts.'
+
+
+def test_requests_are_held_back_while_connectivity_is_lost():
+    # responses arrive while connectivity is lost, free slots are refilled only once it is restored
+    notices = {3: [(0.05, 1100), (0.5, 1102)]}
+    with TWSSimulator(latency=0.1, notices=notices) as simulator, \
+            _session(simulator, max_requests_in_flight=3) as session:
+        data = session.extract(range(6000, 6006), '20210216')
+        traces = session.instruments.snapshot(traces=True)['traces']
+        stats = dict(simulator.stats)
+    assert _extracted(data) and stats['requests'] == 6, 'Requests were not maintained.'
+    sent_at = sorted(trace['sent_at'] for trace in traces)
+    assert sent_at[3] - sent_at[0] >= 0.4, 'Requests were sent while connectivity was lost.'
+
+
+def test_lost_requests_are_sent_again_once_connectivity_is_restored():
+    # responses for the requests in flight are dropped with 1101 & never arrive
+    notices = {3: [(0.05, 1100), (0.2, 1101)]}
+    with TWSSimulator(latency=0.5, notices=notices) as simulator, \
+            _session(simulator, max_requests_in_flight=3) as session:
+        data = session.extract(range(6000, 6006), '20210216')
+        stats = dict(simulator.stats)
+    assert _extracted(data), 'Some tickers were not extracted.'
+    assert stats['requests'] == 9, 'Lost requests were not sent again.'
+    assert all(data[ticker]['meta_data']['attempts'] == 1 for ticker in data), 'Lost requests were counted.'
+
+
+def test_failing_ticker_is_tried_max_attempts_times_in_total(tmp_path, monkeypatch):
+    monkeypatch.setattr(tws_clients, 'CACHE_DIR', str(tmp_path))
+    with TWSSimulator(errors={5000: [366] * 10}) as simulator, _session(simulator, max_attempts=3) as session:
+        extract_historical_data([5000, 5001], end_date='20210216', end_time='15:01:00', session=session)
+        stats = dict(simulator.stats)
+    with BarStore(str(tmp_path / '1min' / '20210216' / '15_01_00')) as store:
+        meta_data = store.read(5000)['meta_data']
+        assert store.status(5001) is True, 'Healthy ticker was not extracted.'
+    assert not meta_data['status'] and meta_data['attempts'] == 3, 'Failing ticker was not given up on.'
+    assert stats['requests'] == 4, 'Attempts of the session were repeated by the extraction.'
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+from os.path import abspath
+from os.path import dirname
+
+
+"""
+    CLI start-up should not pay for the subsystems a command does not use.
+    These tests run a fresh interpreter, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/startup_test.py
+"""
+
+
+def test_parsing_user_input_does_not_load_heavy_modules():
+    script = ('import sys, tws_equities; tws_equities.parse_user_args(["run"]); '
+              'print(",".join(name for name in ["pandas", "alive_progress", "ibapi.client"] if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', script], cwd=dirname(dirname(abspath(__file__))),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.splitlines()[-1] == '', f'Modules loaded before a command was triggered: {output}'
@@ -2,13 +2,13 @@
 
 
 from datetime import datetime as dt
-import json
 from os import listdir
 from os.path import dirname
 from os.path import join
 from tws_equities.tws_clients import extractor
 from tws_equities.tws_clients import extract_historical_data
 from tws_equities.data_files import create_csv_dump
+from tws_equities.helpers import BarStore
 from tws_equities.settings import CACHE_DIR
 from tws_equities.settings import HISTORICAL_DATA_STORAGE
 from tws_equities.settings import MONTH_MAP
@@ -113,14 +113,11 @@ def validate_data_negative(input_tickers, extracted_data):
 
 
 def validate_data_caching_positive(input_tickers):
-    target_path = join(CACHE_DIR, bar_size.replace(' ', ''), end_date, end_time.replace(':', '_'), 'success')
-    cached_files = listdir(target_path)
-    cached_ticker_ids = list(map(lambda x: int(x.split('.')[0]), cached_files))
-    assert all(x in input_tickers for x in cached_ticker_ids), 'Not all tickers have been cached properly.'
-    for ticker in cached_ticker_ids:
-        file_path = join(target_path, f'{ticker}.json')
-        with open(file_path, 'r') as f:
-            data = json.loads(f.read())
+    target_path = join(CACHE_DIR, bar_size.replace(' ', ''), end_date, end_time.replace(':', '_'))
+    with BarStore(target_path) as store:
+        cached_ticker_ids = store.tickers(status=True)
+        assert all(x in input_tickers for x in cached_ticker_ids), 'Not all tickers have been cached properly.'
+        for ticker, data in store.records(status=True):
             validate_bar_data(data['bar_data'], ticker)
             validate_meta_data(data['meta_data'], ticker)
 
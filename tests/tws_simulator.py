@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Local stand-in for TWS, speaks enough of the wire protocol to drive the extractor without a live session:
+        - version handshake("API\\0" prefix & version range), answered with server version & connection time
+        - START_API, answered with next valid ID, managed accounts & farm status codes 2104, 2106, 2158
+        - REQ_HISTORICAL_DATA, answered with HISTORICAL_DATA built from fixture bars or with an error
+        - CANCEL_HISTORICAL_DATA, drops the pending response
+    Latency, pacing errors(162 & 322), disconnects & connectivity notices(1100, 1101, 1102) can be injected to
+    reproduce TWS behaviour under load.
+
+    Usage:
+        with TWSSimulator(latency=0.01, errors={1301: [162]}) as simulator:
+            extractor = connect_extractor(simulator)
+"""
+
+import socket
+from heapq import heappop
+from heapq import heappush
+from itertools import count
+from random import Random
+from threading import Condition
+from threading import Lock
+from threading import Thread
+from time import strftime
+from time import time
+
+from ibapi import comm
+from ibapi.message import IN
+from ibapi.message import OUT
+from ibapi.server_versions import MAX_CLIENT_VER
+from tests.sample_input import get_input
+from tests.sample_input import _NEGATIVE_INPUT_PATH
+from tests.sample_input import _POSITIVE_INPUT_PATH
+from tws_equities.tws_clients import HistoricalDataExtractor
+from tws_equities.tws_clients.pacing import PacingEngine
+from tws_equities.tws_clients.retries import RetryPolicy
+
+
+_API_PREFIX = b'API\0'
+_FARM_STATUSES = [(2104, 'Market data farm connection is OK:jfarm'),
+                  (2106, 'HMDS data farm connection is OK:hkhmds'),
+                  (2158, 'Sec-def data farm connection is OK:secdefhk')]
+ERROR_MESSAGES = {
+    162: 'Historical Market Data Service error message:Historical data request pacing violation',
+    200: 'No security definition has been found for the request',
+    322: "Error processing request:-'bW' : cause - Only 50 simultaneous API historical data requests allowed.",
+    1100: 'Connectivity between IB and Trader Workstation has been lost.',
+    1101: 'Connectivity between IB and TWS has been restored- data lost.',
+    1102: 'Connectivity between IB and TWS has been restored- data maintained.',
+}
+# connectivity restored with loss of data, responses that are yet to be sent are dropped along with this notice
+_DATA_LOST = 1101
+# TWS rejects historical data requests beyond 50 open ones with error code 322
+MAX_OPEN_REQUESTS = 50
+
+
+def _message(*fields):
+    return comm.make_msg(''.join(comm.make_field(field) for field in fields))
+
+
+def _encode_bars(bars):
+    """
+        Encodes fixture bars(as saved by the extractor) into the bar section of a HISTORICAL_DATA message.
+    """
+    fields = []
+    for bar in bars:
+        date, time_ = bar['time_stamp'].split()
+        fields += [f'{date.replace("-", "")}  {time_}', bar['open'], bar['high'], bar['low'], bar['close'],
+                   bar['volume'], bar['average'], bar['count']]
+    return ''.join(comm.make_field(field) for field in fields)
+
+
+def load_fixtures():
+    """
+        Returns fixtures from "tests/sample_input", keyed by ticker ID.
+        Positive fixtures are served as bars, negative ones as the last error in their error stack.
+    """
+    return {**get_input(_POSITIVE_INPUT_PATH), **get_input(_NEGATIVE_INPUT_PATH)}
+
+
+class _Session:
+    """
+        Single client connection, requests are read on one thread & responses are sent from another one,
+        so that responses for overlapping requests can be delayed independently.
+    """
+
+    def __init__(self, simulator, connection):
+        self.simulator = simulator
+        self.connection = connection
+        self.server_version = None
+        self.open_requests = set()  # request IDs waiting for a response
+        self._outbox = []  # (due time, sequence, request ID, message)
+        self._sequence = count()
+        self._condition = Condition()
+        self._send_lock = Lock()  # handshake & rejections are sent from the receiving thread
+        self._closed = False
+
+    def start(self):
+        Thread(target=self._receive, daemon=True).start()
+        Thread(target=self._send_due, daemon=True).start()
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+
+    def send(self, message):
+        with self._send_lock:
+            self.connection.sendall(message)
+        self.simulator.count('messages_sent')
+
+    def schedule(self, request_id, message, delay):
+        with self._condition:
+            heappush(self._outbox, (time() + delay, next(self._sequence), request_id, message))
+            self._condition.notify()
+
+    def cancel(self, request_id):
+        with self._condition:
+            self.open_requests.discard(request_id)
+            self._outbox = [entry for entry in self._outbox if entry[2] != request_id]
+            self._outbox.sort()
+
+    def _send_due(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._outbox or self._outbox[0][0] > time()):
+                    self._condition.wait(self._outbox[0][0] - time() if self._outbox else None)
+                if self._closed:
+                    return
+                _, _, request_id, message = heappop(self._outbox)
+                self.open_requests.discard(request_id)
+                if request_id == (-1, _DATA_LOST):
+                    self._outbox = [entry for entry in self._outbox if isinstance(entry[2], tuple)]
+                    self._outbox.sort()
+                    self.open_requests.clear()
+            try:
+                self.send(message)
+            except OSError:
+                self.close()
+                return
+
+    def _receive(self):
+        frame_buf, prefix = comm.FrameBuffer(), b''
+        try:
+            while True:
+                data = self.connection.recv(65536)
+                if not data:
+                    break
+                if len(prefix) < len(_API_PREFIX):  # handshake starts with a bare prefix, not a framed message
+                    data = prefix + data
+                    prefix, data = data[:len(_API_PREFIX)], data[len(_API_PREFIX):]
+                    if len(prefix) == len(_API_PREFIX) and prefix != _API_PREFIX:
+                        break
+                frame_buf.extend(data)
+                for msg in frame_buf.messages():
+                    # version range is sent without a field terminator
+                    fields = comm.read_fields(bytes(msg)) if self.server_version else (bytes(msg),)
+                    msg.release()
+                    self.simulator.count('messages_received')
+                    if not self._handle(fields):
+                        return
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def _handle(self, fields):
+        """
+            Answers a message from the client, returns False once the connection has been dropped.
+        """
+        if self.server_version is None:
+            # version range, ex: "v100..151"
+            lowest, highest = map(int, fields[0].decode()[1:].split('..'))
+            self.server_version = max(lowest, min(highest, MAX_CLIENT_VER))
+            self.send(_message(self.server_version, strftime('%Y%m%d %H:%M:%S JST')))
+            return True
+        message_id = int(fields[0])
+        if message_id == OUT.START_API:
+            self.send(_message(IN.NEXT_VALID_ID, 1, 1))
+            self.send(_message(IN.MANAGED_ACCTS, 1, 'DU0000000'))
+            for code, text in _FARM_STATUSES:
+                self.send(_message(IN.ERR_MSG, 2, -1, code, text))
+        elif message_id == OUT.REQ_HISTORICAL_DATA:
+            # request ID, contract ID & symbol follow the message ID
+            request_id, ticker = int(fields[1]), fields[3].decode()
+            if self.simulator.should_disconnect():
+                self.close()
+                return False
+            self._answer_historical_data(request_id, ticker)
+            for delay, code in self.simulator.notices.get(self.simulator.stats['requests'], ()):
+                self.schedule((-1, code), self.simulator.error(-1, code), delay)  # keyed apart from requests
+        elif message_id == OUT.CANCEL_HISTORICAL_DATA:
+            self.cancel(int(fields[2]))
+        return True
+
+    def _answer_historical_data(self, request_id, ticker):
+        simulator = self.simulator
+        code = simulator.injected_error(ticker)
+        with self._condition:
+            if code is None and len(self.open_requests) >= simulator.max_open_requests:
+                code = 322
+            elif code is None:
+                self.open_requests.add(request_id)
+        if code is not None:
+            response = simulator.error(request_id, code)
+        else:
+            response = simulator.response(request_id, ticker)
+        if code == 322:  # rejected right away, request never reaches the data farm
+            self.send(response)
+        else:
+            self.schedule(request_id, response, simulator.delay(ticker))
+
+
+class TWSSimulator:
+    """
+        Threaded TCP server that answers historical data requests from fixture bars.
+
+        :param fixtures: ticker ID --> fixture(as saved by the extractor), defaults to "tests/sample_input"
+        :param default_ticker: fixture served for tickers without one of their own, None to answer them with
+                               error code 200(no security definition)
+        :param latency: seconds before a historical data request is answered, or a callable that takes the
+                        ticker & returns the seconds
+        :param errors: ticker --> error codes(ex: [162, 322]) returned by its consecutive requests, before the
+                       request is served normally
+        :param error_rate: fraction of requests answered with a pacing violation(162), chosen at random
+        :param max_open_requests: requests open at once on a connection beyond which 322 is returned
+        :param disconnect_after: number(s) of historical data requests after which the connection is dropped
+        :param notices: number of historical data requests --> (delay, code) for connectivity notices sent after
+                        that request, responses still pending are dropped with 1101(data lost)
+        :param seed: seed for the random choice of pacing violations
+    """
+
+    def __init__(self, fixtures=None, default_ticker=1301, latency=0.0, errors=None, error_rate=0.0,
+                 max_open_requests=MAX_OPEN_REQUESTS, disconnect_after=(), notices=None, seed=0, host='127.0.0.1',
+                 port=0):
+        fixtures = load_fixtures() if fixtures is None else fixtures
+        self._fixtures = {str(ticker): fixture for ticker, fixture in fixtures.items()}
+        self._encoded_bars = {}  # ticker --> encoded bar section, built on first request
+        self.default_ticker = None if default_ticker is None else str(default_ticker)
+        self.latency = latency
+        self.errors = {str(ticker): list(codes) for ticker, codes in (errors or {}).items()}
+        self.error_rate = error_rate
+        self.max_open_requests = max_open_requests
+        if isinstance(disconnect_after, int):
+            disconnect_after = [disconnect_after]
+        self.disconnect_after = set(disconnect_after)
+        self.notices = notices or {}
+        self._random = Random(seed)
+        self._lock = Lock()
+        self._server = socket.create_server((host, port))
+        self._server.settimeout(0.2)
+        self._sessions = []
+        self._running = False
+        self.stats = {'connections': 0, 'requests': 0, 'messages_received': 0, 'messages_sent': 0,
+                      'errors_sent': 0, 'disconnects': 0}
+
+    @property
+    def address(self):
+        return self._server.getsockname()[:2]
+
+    def start(self):
+        self._running = True
+        Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for session in self._sessions:
+            session.close()
+        self._server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _accept(self):
+        while self._running:
+            try:
+                connection, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, connection)
+            self._sessions.append(session)
+            self.count('connections')
+            session.start()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def should_disconnect(self):
+        """
+            Counts a historical data request, returns True if the connection has to be dropped before answering it.
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            if self.stats['requests'] not in self.disconnect_after:
+                return False
+            self.stats['disconnects'] += 1
+            return True
+
+    def injected_error(self, ticker):
+        """
+            Returns the error code to be injected for a request, None if the request has to be served.
+        """
+        with self._lock:
+            codes = self.errors.get(ticker)
+            if codes:
+                return codes.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 162
+        return None
+
+    def delay(self, ticker):
+        return self.latency(ticker) if callable(self.latency) else self.latency
+
+    def error(self, request_id, code, message=None):
+        """
+            Returns an ERR_MSG message for a request, request ID -1 for notices that concern the connection.
+        """
+        self.count('errors_sent')
+        return _message(IN.ERR_MSG, 2, request_id, code, message or ERROR_MESSAGES.get(code, 'Error'))
+
+    def response(self, request_id, ticker):
+        """
+            Returns the message that answers a historical data request, HISTORICAL_DATA for positive fixtures &
+            ERR_MSG for negative ones.
+        """
+        key = ticker if ticker in self._fixtures else self.default_ticker
+        if key is None:
+            return self.error(request_id, 200)
+        fixture = self._fixtures[key]
+        meta_data = fixture['meta_data']
+        if not meta_data['status']:
+            error = meta_data['_error_stack'][-1]
+            return self.error(request_id, error['code'], error['message'])
+        bars = self._encoded_bars.get(key)
+        if bars is None:
+            bars = self._encoded_bars[key] = _encode_bars(fixture['bar_data'])
+        header = ''.join(comm.make_field(field) for field in [IN.HISTORICAL_DATA, request_id, meta_data['start'],
+                                                               meta_data['end'], len(fixture['bar_data'])])
+        return comm.make_msg(header + bars)
+
+
+def relax_pacing(extractor):
+    """
+        Lifts the interval between identical requests & shortens the backoff after pacing violations, so that
+        retries are sent right away instead of stretching the tests by seconds.
+    """
+    extractor.pacer = PacingEngine(identical_request_interval=0)
+    extractor.retry_policy = RetryPolicy(base_delay=0.01)
+    return extractor
+
+
+def connect_extractor(simulator, extractor_class=HistoricalDataExtractor, client_id=1, **kwargs):
+    """
+        Returns an extractor with relaxed pacing(see "relax_pacing"), connected to the given simulator.
+        :param kwargs: passed on to the extractor, end date defaults to the date of the fixtures
+    """
+    kwargs = {'end_date': '20210216', 'timeout': 5, **kwargs}
+    extractor = relax_pacing(extractor_class(**kwargs))
+    extractor.connect(*simulator.address, client_id)
+    return extractor
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from tests.sample_input import get_positive_input
+from tests.tws_simulator import TWSSimulator
+from tests.tws_simulator import connect_extractor
+from tests.tws_simulator import relax_pacing
+from tws_equities.helpers import BarStore
+from tws_equities.tws_clients import ExtractionSession
+from tws_equities.tws_clients import _run_extractor
+from tws_equities.tws_clients import data_extractor
+
+
+"""
+    Runs the extractor end-to-end against a local TWS simulator, no connection to TWS is needed.
+
+    Here's how you can trigger these tests:
+        - pytest tests/tws_simulator_test.py
+"""
+
+
+def _extract(simulator, tickers, **kwargs):
+    extractor = connect_extractor(simulator, end_time='15:01:00', **kwargs)
+    return extractor, extractor.extract_historical_data(tickers)
+
+
+def test_extraction_matches_fixtures():
+    with TWSSimulator(default_ticker=None) as simulator:
+        _, data = _extract(simulator, [1301, 1302])
+    expected = get_positive_input()[1301]
+    assert data[1301] == expected, 'Extracted data does not match the bars served by the simulator.'
+    assert not data[1302]['meta_data']['status'], 'Ticker without a security definition was not failed.'
+    assert data[1302]['meta_data']['_error_stack'][-1]['code'] == 200, 'Error code was not passed through.'
+
+
+def test_extraction_recovers_from_pacing_errors_and_disconnects(monkeypatch):
+    monkeypatch.setattr(data_extractor, 'RECONNECT_DELAY', 0.01)
+    tickers = list(range(2000, 2040))
+    with TWSSimulator(latency=0.005, errors={2000: [162], 2001: [322]}, disconnect_after=10) as simulator:
+        extractor, data = _extract(simulator, tickers, max_requests_in_flight=5)
+        stats = dict(simulator.stats)
+    assert all(data[ticker]['meta_data']['status'] for ticker in tickers), 'Some tickers were not extracted.'
+    assert data[2000]['meta_data']['_error_stack'][0]['code'] == 162, 'Pacing violation was not recorded.'
+    assert extractor.counters['requests_rejected'] == 1, 'Rejected request was not put back in line.'
+    assert stats['connections'] == 2 and stats['disconnects'] == 1, 'Extractor did not re-connect.'
+
+
+def test_request_window_is_kept_full_across_batches(tmp_path):
+    tickers = list(range(4000, 4030))
+    with TWSSimulator(latency=0.01) as simulator, ExtractionSession(*simulator.address, client_id=1) as session:
+        client = relax_pacing(session.client)
+        occupancy = []
+        historical_data_end = client.historicalDataEnd
+
+        def record_occupancy(ticker, start, end):
+            historical_data_end(ticker, start, end)
+            if client._pending:  # window can only be kept full while there are tickers left to request
+                occupancy.append(len(client._requests_in_flight))
+
+        client.historicalDataEnd = record_occupancy
+        with BarStore(str(tmp_path)) as store:
+            success, failure = _run_extractor(tickers, '20210216', '15:01:00', '1 D', '1 min', 'TRADES', 0, 1,
+                                              False, (), store, batch_size=4, max_requests_in_flight=5,
+                                              session=session)
+    assert success == tickers and not failure, 'Some tickers were not extracted & cached.'
+    assert client.counters['peak_requests_in_flight'] == 5, 'Request window was not passed on to the session.'
+    assert occupancy and set(occupancy) == {5}, 'Request window drained between batches.'
+
+
+def test_session_backs_off_pacing_violations_with_default_attempts():
+    with TWSSimulator(errors={5000: [162, 162, 162]}) as simulator, \
+            ExtractionSession(*simulator.address, client_id=1) as session:
+        relax_pacing(session.client)  # shortens the waits only, attempts are left at the session's defaults
+        data = session.extract([5000, 5001], '20210216')
+        backoffs = session.client._backoffs.stats['scheduled']
+    meta_data = data[5000]['meta_data']
+    assert meta_data['status'], 'Ticker was given up on after a pacing violation.'
+    assert [error['code'] for error in meta_data['_error_stack']] == [162] * 3, 'Pacing violations were lost.'
+    assert meta_data['attempts'] == 1, 'Pacing violations were counted against the attempts.'
+    assert backoffs == 3, 'Pacing violations were not backed off.'
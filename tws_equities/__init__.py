@@ -14,12 +14,10 @@
 """
 
 
+from importlib import import_module
+
 from tws_equities.parsers import parse_user_args
 from tws_equities.helpers import get_logger
-from tws_equities.controller import run
-from tws_equities.controller import download
-from tws_equities.controller import convert
-from tws_equities.controller import metrics
 
 
 RED_CROSS = u'\u274C'
@@ -36,12 +34,16 @@ __micro__ = 0
 __version__ = f'{__major__}.{__minor__}.{__micro__}'
 
 
-COMMAND_MAP = {
-                    'run': run,
-                    'download': download,
-                    'convert': convert,
-                    'metrics': metrics
-              }
+# commands are loaded lazily(PEP 562), so that parsing user input or printing help does not import pandas & TWS API
+_COMMANDS = ['run', 'download', 'convert', 'metrics']
+
+
+def __getattr__(name):
+    if name in _COMMANDS:
+        return getattr(import_module('tws_equities.controller'), name)
+    if name == 'COMMAND_MAP':
+        return {command: __getattr__(command) for command in _COMMANDS}
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 __all__ = [
                 'parse_user_args',
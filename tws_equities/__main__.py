@@ -7,9 +7,9 @@ from sys import stderr
 # from logging import  Formatter
 # from logging.handlers import TimedRotatingFileHandler
 
+import tws_equities
 from tws_equities import parse_user_args
 from tws_equities import get_logger
-from tws_equities import COMMAND_MAP
 from tws_equities import settings
 
 
@@ -33,7 +33,7 @@ del user_args['command']
 def main():
     try:
         logger.info(f'Parsed user arguments, triggering target function for: {command}')
-        target_function = COMMAND_MAP[command]
+        target_function = getattr(tws_equities, command)  # only the modules needed by the command are loaded
         target_function(**user_args)
     except KeyboardInterrupt:
         _message = 'Detected keyboard interruption from the user, terminating program....'
@@ -3,20 +3,30 @@
 
 
 from tws_equities.data_files import create_csv_dump
+from tws_equities.data_files import create_dumps
+from tws_equities.data_files import export_metrics_sheet
+from tws_equities.data_files import create_parquet_dump
 # from tws_equities.data_files import generate_extraction_metrics
-from tws_equities.data_files import metrics_generator
+from tws_equities.data_files import generate_metrics
 from tws_equities.data_files.input_data import get_tickers_from_user_file
 from tws_equities.helpers import get_date_range
-from tws_equities.tws_clients import extract_historical_data
+from tws_equities.settings import DEFAULT_TICKERS_FILE
 from os.path import isfile
 
 
 # TODO: use verbose and debug options
+_DUMP_CREATORS = dict(csv=create_csv_dump, parquet=create_parquet_dump)
 
 
 def download(tickers=None, start_date=None, end_date=None, end_time=None,
-             duration=None, bar_size=None, what_to_show=None, use_rth=None, verbose=False):
-    input_is_a_file = isfile(tickers)
+             duration=None, bar_size=None, what_to_show=None, use_rth=None, connections=1, gateways=None,
+             verbose=False):
+    # TWS API clients are only loaded by the commands that download data
+    from tws_equities.tws_clients import extract_historical_data
+    from tws_equities.tws_clients import ExtractionSession
+    from tws_equities.tws_clients import ConnectionPool
+
+    input_is_a_file = isinstance(tickers, str) and isfile(tickers)
     if input_is_a_file:
         tickers = get_tickers_from_user_file(tickers)
     if start_date is None:
@@ -24,23 +34,41 @@ def download(tickers=None, start_date=None, end_date=None, end_time=None,
     if end_date is None:
         raise ValueError(f'User must specify at least the end date for data extraction.')
     date_range = get_date_range(start_date, end_date)
-    for date in date_range:
-        extract_historical_data(tickers=tickers, end_date=date, end_time=end_time, duration=duration,
-                                bar_size=bar_size, what_to_show=what_to_show, use_rth=use_rth,
-                                verbose=verbose)
+    # all the dates share the same connection(s) to TWS API
+    if connections > 1 or gateways is not None:
+        session = ConnectionPool(size=connections, gateways=gateways)
+    else:
+        session = ExtractionSession()
+    with session:
+        for date in date_range:
+            extract_historical_data(tickers=tickers, end_date=date, end_time=end_time, duration=duration,
+                                    bar_size=bar_size, what_to_show=what_to_show, use_rth=use_rth,
+                                    verbose=verbose, session=session)
 
 
-def convert(start_date=None, end_date=None, end_time='15:01:00', bar_size='1 min', verbose=False):
+# noinspection PyShadowingBuiltins
+def convert(start_date=None, end_date=None, end_time='15:01:00', bar_size='1 min', format='csv', workers=1,
+            verbose=False):
     if start_date is None:
         start_date = end_date
     if end_date is None:
         raise ValueError(f'User must pass at least the end date for data conversion.')
+    if format not in _DUMP_CREATORS:
+        raise ValueError(f'Unsupported data format: {format}, choose from: {list(_DUMP_CREATORS)}')
+    if workers < 1:
+        raise ValueError(f'Number of workers must be a positive integer, received: {workers}')
     date_range = get_date_range(start_date, end_date)
+    # dates & tickers within a date are converted in parallel, when more than one worker is available
+    if workers > 1:
+        create_dumps(date_range, end_time=end_time, bar_size=bar_size, format=format, workers=workers,
+                     verbose=verbose)
+        return
     for date in date_range:
-        create_csv_dump(date, end_time=end_time, bar_size=bar_size)
+        _DUMP_CREATORS[format](date, end_time=end_time, bar_size=bar_size)
 
 
-def metrics(tickers, start_date=None, end_date=None, bar_size='1 min', verbose=False):
+def metrics(tickers, start_date=None, end_date=None, end_time='15:01:00', bar_size='1 min', export=False,
+            verbose=False):
     # todo: input sequence
     if start_date is None:
         start_date = end_date
@@ -48,16 +76,24 @@ def metrics(tickers, start_date=None, end_date=None, bar_size='1 min', verbose=F
         raise ValueError(f'User must pass at least the end date for metrics generation.')
     if tickers is None:
         pass  # fixme: read cached input
+    # default input file only lists ticker IDs, unlike an input universe it has no status & group columns
+    if tickers == DEFAULT_TICKERS_FILE:
+        tickers = get_tickers_from_user_file(tickers)
     date_range = get_date_range(start_date, end_date)
-    for date in date_range:
-        metrics_generator(date, bar_size, tickers)
+    generate_metrics(date_range, bar_size, tickers, end_time=end_time)
+    # metrics are kept in a database, CSV sheet is only written when asked for
+    if export:
+        export_metrics_sheet(start_date=start_date, end_date=end_date)
 
 
-def run(tickers=None, start_date=None, end_date=None, end_time=None, duration='1 D',
-        bar_size='1 min', what_to_show='TRADES', use_rth=1, verbose=False, debug=False):
+# noinspection PyShadowingBuiltins
+def run(tickers=None, start_date=None, end_date=None, end_time='15:01:00', duration='1 D',
+        bar_size='1 min', what_to_show='TRADES', use_rth=1, connections=1, gateways=None, format='csv',
+        workers=1, verbose=False, debug=False):
     # TODO: load tickers from URL
     download(tickers=tickers, start_date=start_date, end_date=end_date, end_time=end_time,
              duration=duration, bar_size=bar_size, what_to_show=what_to_show, use_rth=use_rth,
-             verbose=verbose)
-    convert(start_date=start_date, end_date=end_date, end_time=end_time, bar_size=bar_size)
-    metrics(tickers, start_date=start_date, end_date=end_date, bar_size=bar_size)
+             connections=connections, gateways=gateways, verbose=verbose)
+    convert(start_date=start_date, end_date=end_date, end_time=end_time, bar_size=bar_size, format=format,
+            workers=workers)
+    metrics(tickers, start_date=start_date, end_date=end_date, end_time=end_time, bar_size=bar_size)
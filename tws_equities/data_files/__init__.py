@@ -4,8 +4,14 @@
 from tws_equities.data_files.input_data import get_default_tickers
 from tws_equities.data_files.input_data import get_tickers_from_user_file
 from tws_equities.data_files.input_data import get_japan_indices
+from tws_equities.data_files.input_data import get_japan_index_members
 from tws_equities.data_files.input_data import drop_unnamed_columns
 from tws_equities.data_files.input_data import TEST_TICKERS
 from tws_equities.data_files.historical_data import create_csv_dump
+from tws_equities.data_files.historical_data import create_parquet_dump
+from tws_equities.data_files.historical_data import create_dumps
+from tws_equities.data_files.historical_data import read_extracted_data
 # from tws_equities.data_files.historical_data import generate_extraction_metrics
 from tws_equities.data_files.historical_data import metrics_generator
+from tws_equities.data_files.historical_data import generate_metrics
+from tws_equities.data_files.historical_data import export_metrics_sheet
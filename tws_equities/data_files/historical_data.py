@@ -2,27 +2,38 @@
 
 
 from alive_progress import alive_bar
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+import csv
 import pandas as pd
 from logging import getLogger
-
-from tws_equities.data_files import get_japan_indices
+from operator import eq
+from operator import ge
+from operator import itemgetter
+from os import remove
+from os.path import getmtime
+from shutil import copyfileobj
+
+from tws_equities.data_files import get_japan_index_members
+from tws_equities.helpers import BarStore
+from tws_equities.helpers import MetricsStore
+from tws_equities.helpers import SUMMARY_FIELDS
 from tws_equities.helpers import read_json_file
 from tws_equities.helpers import save_data_as_json
 from tws_equities.helpers import make_dirs
+from tws_equities.helpers import create_batches
 from tws_equities.helpers import delete_directory
-from tws_equities.helpers import get_files_by_type
 from tws_equities.helpers import read_csv
 from tws_equities.helpers import isfile
 from tws_equities.helpers import isdir
 from tws_equities.helpers import join
-from tws_equities.helpers import sep
-from tws_equities.helpers import glob
 from tws_equities.helpers import write_to_console
 
 from tws_equities.settings import CACHE_DIR
 from tws_equities.settings import HISTORICAL_DATA_STORAGE
 from tws_equities.settings import MONTH_MAP
 from tws_equities.settings import DAILY_METRICS_FILE
+from tws_equities.settings import DAILY_METRICS_DB
 from tws_equities.settings import GREEN_TICK
 from tws_equities.settings import RED_CROSS
 
@@ -34,9 +45,41 @@ _BAR_CONFIG = {
                     'spinner': 'dots_reverse',
                     'bar': 'smooth'
               }
+# output columns, bars are written ticker by ticker in (ecode, time_stamp) order
+_BAR_COLUMNS = ['time_stamp', 'ecode', 'session', 'open', 'high', 'low', 'close', 'volume', 'average', 'count']
+_ERROR_COLUMNS = ['ecode', 'code', 'message']
+_PARQUET_COMPRESSION = 'zstd'
+_PARQUET_ROW_GROUP_TICKERS = 100  # tickers buffered before a row group is written
+_SHARD_TICKERS = 250  # tickers converted by a worker process in a single task
+# groups of input tickers that get their own extraction metrics, add a row here to track a new group
+# (name, title, input column, comparison, value), a ticker belongs to the group if comparison holds for the column
+_METRIC_GROUPS = [
+    ('topix', 'Topix', 'topix', eq, 1),
+    ('nikkei225', 'Nikkei 225', 'nikkei225', eq, 1),
+    ('jasdaq20', 'JASDAQ 20', 'jasdaq20', eq, 1),
+    ('first_section', 'First Section', 'section', eq, 'First Section'),
+    ('second_section', 'Second Section', 'section', eq, 'Second Section'),
+    ('mothers', 'Mothers', 'section', eq, 'Mothers'),
+    ('jasdaq_growth', 'JASDAQ Growth', 'section', eq, 'JASDAQ Growth'),
+    ('jasdaq_standard', 'JASDAQ Standard', 'section', eq, 'JASDAQ Standard'),
+    ('mcap_above_10b', 'Market Capital Above ¥10B', 'market_cap', ge, 10e+9),
+    ('pv_above_85m', 'Price x 3 Month\'s Trading Volume ¥85MM', 'pv', ge, 85e+6),
+]
 logger = getLogger(__name__)
 
 
+def _import_pyarrow():
+    """
+        Parquet support is optional, pyarrow is only imported when Parquet output is requested.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet format requires "pyarrow", please install it: pip install pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
 def _get_marker(ratio, threshold=0.95):
     return GREEN_TICK if ratio >= threshold else RED_CROSS
 
@@ -50,135 +93,205 @@ def _setup_storage_directories(date, bar_size='1 min'):
     return storage_dir
 
 
-# TODO: both dataframe generators could be refactored into a generic fucntion.
-# fixme: account for empty dataframes
-def generate_success_dataframe(target_directory, bar_title=None, verbose=False):
+def _write_success_rows(writer, store, tickers, bar):
+    """
+        Streams bars for the given tickers into a CSV writer, one ticker at a time.
+        Bars are written in time order, so rows come out sorted by (ecode, time_stamp) for sorted tickers.
+    """
+    for ticker in tickers:
+        bar_data = sorted(store.read(ticker)['bar_data'], key=itemgetter('time_stamp'))
+        writer.writerows([_bar['time_stamp'], ticker, _bar['session'], _bar['open'], _bar['high'], _bar['low'],
+                          _bar['close'], _bar['volume'], _bar['average'], _bar['count']] for _bar in bar_data)
+        bar()
+
+
+def _write_failure_rows(writer, store, tickers, bar):
+    """
+        Streams error stacks for the given tickers into a CSV writer, one ticker at a time.
     """
-        Creates a pandas datafame from JSON files present at target_directory.
-        Assumes that all these JSON files have valid bar data.
+    for ticker in tickers:
+        meta = store.read(ticker)['meta_data']
+        ecode = meta.get('ecode', ticker)
+        # if error stack is empty, then create a dummy row
+        error_stack = meta['_error_stack'] or [{'code': 'unknown', 'message': 'not available'}]
+        writer.writerows([ecode, error['code'], error['message']] for error in error_stack)
+        bar()
 
-        Parameters:
-        -----------
-        target_directory(str): location to read JSON files from
-        bar_title(str): message to show infront of the progress bar
-        verbose(bool): set to true to see info messages on console
+
+def generate_success_csv(store, path, bar_title=None, verbose=False):
+    """
+        Writes successful records from the given bar store to a CSV file.
+        Tickers are read one at a time in ascending order & their bars are streamed straight into the file,
+        so rows come out sorted by (ecode, time_stamp) while only one ticker is held in memory.
+        :param store: bar store to read records from
+        :param path: location of the CSV file to be written
+        :param bar_title: message to show infront of the progress bar
+        :param verbose: set to true to see info messages on console
     """
     if bar_title is not None:
         _BAR_CONFIG['title'] = bar_title
 
-    def _get_ticker_id(file_name):
-        return int(file_name.split(sep)[-1].split('.')[0])
-
-    # create a place holder dataframe
-    expected_columns = ['time_stamp', 'ecode', 'session', 'open', 'high', 'low',
-                        'close', 'volume', 'average', 'count']
-
-    # create temporary directory to store smaller CSV files
-    temp_directory = '.temp'
-    make_dirs(temp_directory)
-
-    # extract all json files from target directory
-    success_files = get_files_by_type(target_directory)
-    success_tickers = list(map(_get_ticker_id, success_files))
-    total = len(success_tickers)
-    data = pd.DataFrame(columns=expected_columns)
-
-    if bool(total):
-        write_to_console(f'=> Generating dataframe for success tickers...', verbose=verbose)
-        json_generator = map(read_json_file, success_files)
-        counter = 0  # to count temp files
-        with alive_bar(total=total, **_BAR_CONFIG) as bar:
-            for i in range(total):
-                ticker = success_tickers[i]
-                ticker_data = next(json_generator)  # load data into a dictionary
-                bar_data, meta_data = ticker_data['bar_data'], ticker_data['meta_data']
-                temp_data = pd.DataFrame(bar_data)
-                temp_data['ecode'] = ticker
-                data = data.append(temp_data)
-                _time_to_cache = ((i > 0) and (i % 100 == 0)) or (i+1 == total)
-                if _time_to_cache:
-                    if data.shape[0] > 0:
-                        temp_file = join(temp_directory, f'success_{counter}.csv')
-                        data.to_csv(temp_file)
-                        data = pd.DataFrame(columns=expected_columns)
-                        counter += 1
-                bar()
-
-        # merge all CSV files into a single dataframe
-        # delete all temp files
-        temp_files = get_files_by_type(temp_directory, file_type='csv')
-        if bool(temp_files):
-            data = pd.concat(map(read_csv, temp_files))
-            data.sort_values(by=['ecode', 'time_stamp'], inplace=True, ignore_index=True)
-            data = data[expected_columns]
-    delete_directory(temp_directory)
-
-    return data
-
-
-def generate_failure_dataframe(target_directory, bar_title=None, verbose=False):
-    """
-        Creates a pandas data fame from JSON files present at the given failure location.
-        Assumes that all these JSON files have valid error stacks.
-        :param target_directory: location to read JSON files from
+    tickers = store.tickers(status=True)
+    write_to_console(f'=> Generating CSV file for success tickers...', verbose=verbose)
+    with open(path, 'w', newline='') as f, alive_bar(total=len(tickers), **_BAR_CONFIG) as bar:
+        writer = csv.writer(f)
+        writer.writerow(_BAR_COLUMNS)
+        _write_success_rows(writer, store, tickers, bar)
+
+
+def generate_failure_csv(store, path, bar_title=None, verbose=False):
+    """
+        Writes error stacks from failed records in the given bar store to a CSV file, in ascending ticker order.
+        :param store: bar store to read records from
+        :param path: location of the CSV file to be written
         :param bar_title: message to show infron of progress bar
         :param verbose: set to true to see info messages on console
     """
     if bar_title is not None:
         _BAR_CONFIG['title'] = bar_title
 
-    def _get_ticker_id(file_name):
-        return int(file_name.split(sep)[-1].split('.')[0])
-
-    # create a place holder dataframe
-    expected_columns = ['ecode', 'code', 'message']
-    data = pd.DataFrame(columns=expected_columns)
-
-    # create temporary directory to store smaller CSV files
-    temp_directory = '.temp'
-    make_dirs(temp_directory)
-
-    # extract all json files from target directory
-    file_pattern = join(target_directory, '*.json')  # TODO: can be modified to match digital values
-    failure_files = glob(file_pattern)
-    total = len(failure_files)
-
-    if bool(total):
-        write_to_console(f'=> Generting dataframe for failure tickers...', verbose=verbose)
-        json_generator = map(read_json_file, failure_files)
-        counter = 0  # to count temp CSV files
-        with alive_bar(total=total, **_BAR_CONFIG) as bar:
-            for i in range(total):
-                ticker_data = next(json_generator)
-                meta = ticker_data['meta_data']
-                error_stack = meta['_error_stack']
-                ecode = meta.get('ecode', _get_ticker_id(failure_files[i]))
-                temp_data = pd.DataFrame(error_stack, columns=expected_columns)
-                temp_data['ecode'] = ecode
-                # if error stack is empty, then create a dummy row
-                if temp_data.shape[0] == 0:  # fixme: find a way to control this in the TWS Client
-                    dummy_row = {'ecode': ecode, 'code': 'unknown', 'message': 'not available'}
-                    temp_data = temp_data.append(dummy_row, ignore_index=True)
-
-                data = data.append(temp_data)
-                _time_to_cache = (i+1 == total) or ((i > 0) and (i % 100 == 0))
-                if _time_to_cache:
-                    if data.shape[0] > 0:
-                        temp_file = join(temp_directory, f'failure_{counter}.csv')
-                        data.to_csv(temp_file)
-                        data = pd.DataFrame(columns=expected_columns)
-                        counter += 1
-                bar()
-
-        # merge all CSV files into a single dataframe
-        # delete all temp files
-        temp_files = get_files_by_type(temp_directory, file_type='csv')
-        data = pd.concat(map(read_csv, temp_files))
-        data.sort_values(by=['ecode'], ignore_index=True, inplace=True)
-        data = data[expected_columns]
-    delete_directory(temp_directory)
-
-    return data
+    tickers = store.tickers(status=False)
+    write_to_console(f'=> Generating CSV file for failure tickers...', verbose=verbose)
+    with open(path, 'w', newline='') as f, alive_bar(total=len(tickers), **_BAR_CONFIG) as bar:
+        writer = csv.writer(f)
+        writer.writerow(_ERROR_COLUMNS)
+        _write_failure_rows(writer, store, tickers, bar)
+
+
+def _get_store_directory(target_date, end_time, bar_size):
+    return join(CACHE_DIR, bar_size.replace(' ', ''), target_date, end_time.replace(':', '_'))
+
+
+def _open_bar_store(target_date, end_time, bar_size):
+    """
+        Opens the bar store that holds data extracted for the given date.
+        Raise an error if directory for the given date is not present.
+    """
+    target_directory = _get_store_directory(target_date, end_time, bar_size)
+    if not isdir(target_directory):
+        raise NotADirectoryError(f'Could not find a data storage directory for date: {target_directory}')
+    return BarStore(target_directory)
+
+
+def _success_schema(pa):
+    return pa.schema([('time_stamp', pa.timestamp('s')), ('ecode', pa.int32()), ('session', pa.int8()),
+                      ('open', pa.float64()), ('high', pa.float64()), ('low', pa.float64()),
+                      ('close', pa.float64()), ('volume', pa.int64()), ('average', pa.float64()),
+                      ('count', pa.int64())])
+
+
+def _failure_schema(pa):
+    return pa.schema([('ecode', pa.int32()), ('code', pa.string()), ('message', pa.string())])
+
+
+def _write_success_row_groups(pa, writer, store, tickers, bar):
+    """
+        Writes bars for the given tickers to a Parquet writer, a row group is written for every few tickers.
+    """
+    tables = []
+    for i, ticker in enumerate(tickers):
+        bar_data = store.read(ticker)['bar_data']
+        if bool(bar_data):
+            columns = {name: [_bar[name] for _bar in bar_data] for name in _BAR_COLUMNS if name != 'ecode'}
+            columns['time_stamp'] = pa.array(columns['time_stamp'], pa.string()).cast(pa.timestamp('s'))
+            columns['ecode'] = [ticker] * len(bar_data)
+            table = pa.table(columns).select(_BAR_COLUMNS).cast(writer.schema)
+            tables.append(table.sort_by('time_stamp'))
+        if bool(tables) and (len(tables) == _PARQUET_ROW_GROUP_TICKERS or i + 1 == len(tickers)):
+            writer.write_table(pa.concat_tables(tables))
+            tables = []
+        bar()
+
+
+def _get_failure_table(pa, store, tickers, bar):
+    """
+        Collects error stacks for the given tickers into a Parquet table.
+    """
+    columns = {name: [] for name in _ERROR_COLUMNS}
+    for ticker in tickers:
+        meta = store.read(ticker)['meta_data']
+        ecode = meta.get('ecode', ticker)
+        # if error stack is empty, then create a dummy row
+        error_stack = meta['_error_stack'] or [{'code': 'unknown', 'message': 'not available'}]
+        for error in error_stack:
+            columns['ecode'].append(ecode)
+            columns['code'].append(str(error['code']))
+            columns['message'].append(error['message'])
+        bar()
+    return pa.table(columns, schema=_failure_schema(pa))
+
+
+def generate_success_parquet(store, path, bar_title=None, verbose=False):
+    """
+        Writes successful records from the given bar store to a Parquet file.
+        Tickers are read one at a time & written in row groups, columns are typed & compressed.
+        :param store: bar store to read records from
+        :param path: location of the Parquet file to be written
+        :param bar_title: message to show infront of the progress bar
+        :param verbose: set to true to see info messages on console
+    """
+    pa, pq = _import_pyarrow()
+    if bar_title is not None:
+        _BAR_CONFIG['title'] = bar_title
+
+    tickers = store.tickers(status=True)
+    write_to_console(f'=> Generating parquet file for success tickers...', verbose=verbose)
+    with pq.ParquetWriter(path, _success_schema(pa), compression=_PARQUET_COMPRESSION) as writer:
+        with alive_bar(total=len(tickers), **_BAR_CONFIG) as bar:
+            _write_success_row_groups(pa, writer, store, tickers, bar)
+
+
+def generate_failure_parquet(store, path, bar_title=None, verbose=False):
+    """
+        Writes error stacks from failed records in the given bar store to a Parquet file.
+        :param store: bar store to read records from
+        :param path: location of the Parquet file to be written
+        :param bar_title: message to show infront of progress bar
+        :param verbose: set to true to see info messages on console
+    """
+    pa, pq = _import_pyarrow()
+    if bar_title is not None:
+        _BAR_CONFIG['title'] = bar_title
+
+    tickers = store.tickers(status=False)
+    write_to_console(f'=> Generating parquet file for failure tickers...', verbose=verbose)
+    with alive_bar(total=len(tickers), **_BAR_CONFIG) as bar:
+        table = _get_failure_table(pa, store, tickers, bar)
+    pq.write_table(table, path, compression=_PARQUET_COMPRESSION)
+
+
+def create_parquet_dump(target_date, end_time='15:01:00', bar_size='1 min', verbose=False):
+    """
+        Creates Parquet files from JSON files for a given date.
+        Parquet files to be saved at the historical data storage location, partitioned by bar size & date:
+            'success.parquet' & 'failure.parquet'
+    """
+    logger.info('Generating final Parquet dump')
+    storage_dir = _setup_storage_directories(target_date, bar_size=bar_size)
+    _date = f'{target_date[:4]}/{target_date[4:6]}/{target_date[6:]}'
+    write_to_console(f'{"-"*30} Parquet Conversion: {_date} {"-"*27}', verbose=True)
+    with _open_bar_store(target_date, end_time, bar_size) as store:
+        path = join(storage_dir, 'success.parquet')
+        generate_success_parquet(store, path, bar_title='Success', verbose=verbose)
+        logger.debug(f'Success file saved at: {path}')
+
+        path = join(storage_dir, 'failure.parquet')
+        generate_failure_parquet(store, path, bar_title='Failure', verbose=verbose)
+        logger.debug(f'Failure file saved at: {path}')
+
+
+def read_extracted_data(data_location, name, columns=None):
+    """
+        Reads success or failure data saved at data_location, from the latest of Parquet & CSV files.
+        Only the given columns are read from the file.
+        :param data_location: historical data storage location for a given date
+        :param name: 'success' or 'failure'
+        :param columns: list of columns to be read, all columns are read if not given
+    """
+    parquet_file, csv_file = join(data_location, f'{name}.parquet'), join(data_location, f'{name}.csv')
+    if isfile(parquet_file) and not(isfile(csv_file) and getmtime(csv_file) > getmtime(parquet_file)):
+        return pd.read_parquet(parquet_file, columns=columns)
+    return pd.read_csv(csv_file, usecols=columns)
 
 
 def create_csv_dump(target_date, end_time='15:01:00', bar_size='1 min', verbose=False):
@@ -192,27 +305,116 @@ def create_csv_dump(target_date, end_time='15:01:00', bar_size='1 min', verbose=
     storage_dir = _setup_storage_directories(target_date, bar_size=bar_size)
     _date = f'{target_date[:4]}/{target_date[4:6]}/{target_date[6:]}'
     write_to_console(f'{"-"*30} CSV Conversion: {_date} {"-"*31}', verbose=True)
-    target_directory = join(CACHE_DIR, bar_size.replace(' ', ''), target_date, end_time.replace(':', '_'))
-
-    if not isdir(target_directory):
-        raise NotADirectoryError(f'Could not find a data storage directory for date: {target_directory}')
-
-    success_directory = join(target_directory, 'success')
-    failure_directory = join(target_directory, 'failure')
-
-    if isdir(success_directory):
+    with _open_bar_store(target_date, end_time, bar_size) as store:
         path = join(storage_dir, 'success.csv')
-        success = generate_success_dataframe(success_directory, bar_title='Success', verbose=verbose)
-        success.to_csv(path, index=False)
+        generate_success_csv(store, path, bar_title='Success', verbose=verbose)
         logger.debug(f'Success file saved at: {path}')
 
-    if isdir(failure_directory):
         path = join(storage_dir, 'failure.csv')
-        failure = generate_failure_dataframe(failure_directory, bar_title='Failure', verbose=verbose)
-        failure.to_csv(path, index=False)
+        generate_failure_csv(store, path, bar_title='Failure', verbose=verbose)
         logger.debug(f'Failure file saved at: {path}')
 
 
+def _no_progress():
+    pass
+
+
+# noinspection PyShadowingBuiltins
+def _convert_shard(directory, name, format, tickers, path):
+    """
+        Converts a shard of tickers from the bar store at the given directory into a part file.
+        Runs inside a worker process, CSV parts are written without a header so they can be concatenated.
+        :return: number of tickers converted
+    """
+    with BarStore(directory) as store:
+        if format == 'csv':
+            write_rows = _write_success_rows if name == 'success' else _write_failure_rows
+            with open(path, 'w', newline='') as f:
+                write_rows(csv.writer(f), store, tickers, _no_progress)
+        else:
+            pa, pq = _import_pyarrow()
+            if name == 'success':
+                with pq.ParquetWriter(path, _success_schema(pa), compression=_PARQUET_COMPRESSION) as writer:
+                    _write_success_row_groups(pa, writer, store, tickers, _no_progress)
+            else:
+                table = _get_failure_table(pa, store, tickers, _no_progress)
+                pq.write_table(table, path, compression=_PARQUET_COMPRESSION)
+    return len(tickers)
+
+
+# noinspection PyShadowingBuiltins
+def _merge_parts(name, format, parts, path):
+    """
+        Concatenates part files, in shard order, into the final file & deletes them.
+    """
+    if format == 'csv':
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerow(_BAR_COLUMNS if name == 'success' else _ERROR_COLUMNS)
+            for part in parts:
+                with open(part, 'r', newline='') as part_file:
+                    copyfileobj(part_file, f)
+    else:
+        pa, pq = _import_pyarrow()
+        schema = _success_schema(pa) if name == 'success' else _failure_schema(pa)
+        with pq.ParquetWriter(path, schema, compression=_PARQUET_COMPRESSION) as writer:
+            for part in parts:
+                part_file = pq.ParquetFile(part)
+                for i in range(part_file.num_row_groups):
+                    writer.write_table(part_file.read_row_group(i).cast(schema))  # seconds are read back as ms
+    for part in parts:
+        remove(part)
+
+
+# noinspection PyShadowingBuiltins
+def create_dumps(dates, end_time='15:01:00', bar_size='1 min', format='csv', workers=2, verbose=False):
+    """
+        Creates final dumps for multiple dates using a pool of worker processes.
+        Tickers for every date are split into shards of consecutive tickers, workers convert each shard into a
+        part file & parts for a date are concatenated in shard order as soon as all of them are ready.
+        Output is identical to a dump created by a single process, every worker holds one ticker at a time.
+        :param dates: list of dates(YYYYMMDD) to be converted
+        :param end_time: end time used for data extraction
+        :param bar_size: bar size used for data extraction
+        :param format: 'csv' or 'parquet'
+        :param workers: number of worker processes
+        :param verbose: set to true to see info messages on console
+    """
+    logger.info(f'Generating final {format} dumps for {len(dates)} date(s) with {workers} worker(s)')
+    jobs, tasks = {}, []
+    for date in dates:
+        storage_dir = _setup_storage_directories(date, bar_size=bar_size)
+        parts_directory = join(storage_dir, '.parts')
+        make_dirs(parts_directory)
+        with _open_bar_store(date, end_time, bar_size) as store:  # index is recovered before workers read it
+            for name, status in (('success', True), ('failure', False)):
+                shards = create_batches(store.tickers(status=status), batch_size=_SHARD_TICKERS)
+                parts = [join(parts_directory, f'{name}_{i}.{format}') for i in range(len(shards))]
+                jobs[(date, name)] = dict(path=join(storage_dir, f'{name}.{format}'), parts=parts,
+                                          pending=len(shards), parts_directory=parts_directory)
+                tasks.extend(((date, name), (store.directory, name, format, shard, part))
+                             for shard, part in zip(shards, parts))
+
+    write_to_console(f'{"-"*30} Conversion: {dates[0]} - {dates[-1]} {"-"*30}', verbose=True)
+    write_to_console(f'=> Converting {len(dates)} date(s) using {workers} worker(s)...', verbose=verbose)
+    _BAR_CONFIG['title'] = 'Converting'
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_convert_shard, *arguments): key for key, arguments in tasks}
+        with alive_bar(total=sum(len(arguments[3]) for _, arguments in tasks), **_BAR_CONFIG) as bar:
+            for (date, name), job in jobs.items():  # nothing to convert, only the header is written
+                if job['pending'] == 0:
+                    _merge_parts(name, format, job['parts'], job['path'])
+            for future in as_completed(futures):
+                bar(incr=future.result())
+                date, name = futures[future]
+                job = jobs[(date, name)]
+                job['pending'] -= 1
+                if job['pending'] == 0:
+                    _merge_parts(name, format, job['parts'], job['path'])
+                    logger.debug(f'{name.title()} file saved at: {job["path"]}')
+    for parts_directory in {job['parts_directory'] for job in jobs.values()}:
+        delete_directory(parts_directory)
+
+
 # noinspection PyUnusedLocal
 # TODO: to be deprecated
 def generate_extraction_metrics_(target_date, end_time='15:01:00', input_tickers=None, verbose=False):
@@ -257,16 +459,10 @@ def generate_extraction_metrics_(target_date, end_time='15:01:00', input_tickers
             raise FileNotFoundError(f'Can not find input tickers file: {input_tickers_file}')
         input_tickers = read_json_file(input_tickers_file)
 
-    japan_indices = get_japan_indices()
-
-    _n_225_tickers = japan_indices[japan_indices.n_225.str.contains('T')].n_225.unique().tolist()
-    n_225_tickers = list(map(lambda x: int(x.split('.')[0]), _n_225_tickers))
-
-    _topix_tickers = japan_indices[japan_indices.topix.str.contains('T')].topix.unique().tolist()
-    topix_tickers = list(map(lambda x: int(x.split('.')[0]), _topix_tickers))
-
-    _jasdaq_20_tickers = japan_indices[japan_indices.jasdaq_20.str.contains('T')].jasdaq_20.unique().tolist()
-    jasdaq_20_tickers = list(map(lambda x: int(x.split('.')[0]), _jasdaq_20_tickers))
+    index_members = get_japan_index_members()
+    n_225_tickers = index_members['n_225']
+    topix_tickers = index_members['topix']
+    jasdaq_20_tickers = index_members['jasdaq_20']
 
     success = read_csv(success_file)
     failure = read_csv(failure_file)
@@ -351,266 +547,176 @@ def generate_extraction_metrics_(target_date, end_time='15:01:00', input_tickers
 
 
 # TODO: get rid of max function from missed calculation
+def _get_group_metrics(total, extracted, failed):
+    return dict(total=total, extracted=extracted, failed=failed, missed=max(total - (extracted + failed), 0),
+                extraction_ratio=round(extracted / total, 3) if total > 0 else 0)
+
+
 def compute_extraction_metrics(success_data, failure_data, input_data):
-    # create aliases for variable names, done only to shorten the code
-    s, f, i = success_data, failure_data, input_data
-
-    # over-all metrics
-    total = i.code.shape[0]
-    extracted = s.ecode.unique().shape[0]
-    failed = f.ecode.unique().shape[0]
-    missed = max(total - (extracted + failed), 0)
-    extraction_ratio = round(extracted / total, 3) if total > 0 else 0
-
-    # metrics by index
-    # topix
-    topix = i[i.topix == 1]
-    total_topix = topix.code.shape[0]
-    extracted_topix = s[s.ecode.isin(topix.code)].ecode.unique().shape[0]
-    failed_topix = f[f.ecode.isin(topix.code)].ecode.unique().shape[0]
-    missed_topix = max(total_topix - (extracted_topix + failed_topix), 0)
-    extraction_ratio_topix = round(extracted_topix / total_topix, 3) if total_topix > 0 else 0
-
-    # nikkei 225
-    nikkei_225 = i[i.nikkei225 == 1]
-    total_nikkei225 = nikkei_225.code.shape[0]
-    extracted_nikkei225 = s[s.ecode.isin(nikkei_225.code)].ecode.unique().shape[0]
-    failed_nikkei225 = f[f.ecode.isin(nikkei_225.code)].ecode.unique().shape[0]
-    missed_nikkei225 = max(total_nikkei225 - (extracted_nikkei225 + failed_nikkei225), 0)
-    extraction_ratio_nikkei225 = round(extracted_nikkei225 / total_nikkei225, 3) if total_nikkei225 > 0 else 0
-
-    # jasdaq 20
-    jsadaq_20 = i[i.jasdaq20 == 1]
-    total_jasdaq20 = jsadaq_20.code.shape[0]
-    extracted_jasdaq20 = s[s.ecode.isin(jsadaq_20.code)].ecode.unique().shape[0]
-    failed_jasdaq20 = f[f.ecode.isin(jsadaq_20.code)].ecode.unique().shape[0]
-    missed_jasdaq20 = max(total_jasdaq20 - (extracted_jasdaq20 + failed_jasdaq20), 0)
-    extraction_ratio_jasdaq20 = round(extracted_jasdaq20 / total_jasdaq20, 3) if total_jasdaq20 > 0 else 0
-
-    # metrics by section
-    # first section
-    first_section = i[i.section == 'First Section']
-    total_first_section = first_section.code.shape[0]
-    extracted_first_section = s[s.ecode.isin(first_section.code)].ecode.unique().shape[0]
-    failed_first_section = f[f.ecode.isin(first_section.code)].ecode.unique().shape[0]
-    missed_first_section = max(total_first_section - (extracted_first_section + failed_first_section), 0)
-    extraction_ratio_first_section = round(extracted_first_section / total_first_section,
-                                           3) if total_first_section > 0 else 0
-
-    # second section
-    second_section = i[i.section == 'Second Section']
-    total_second_section = second_section.code.shape[0]
-    extracted_second_section = s[s.ecode.isin(second_section.code)].ecode.unique().shape[0]
-    failed_second_section = f[f.ecode.isin(second_section.code)].ecode.unique().shape[0]
-    missed_second_section = max(total_second_section - (extracted_second_section + failed_second_section), 0)
-    extraction_ratio_second_section = round(extracted_second_section / total_second_section,
-                                            3) if total_second_section > 0 else 0
-
-    # mothers
-    mothers = i[i.section == 'Mothers']
-    total_mothers = mothers.code.shape[0]
-    extracted_mothers = s[s.ecode.isin(mothers.code)].ecode.unique().shape[0]
-    failed_mothers = f[f.ecode.isin(mothers.code)].ecode.unique().shape[0]
-    missed_mothers = max(total_mothers - (extracted_mothers + failed_mothers), 0)
-    extraction_ratio_mothers = round(extracted_mothers / total_mothers, 3) if total_mothers > 0 else 0
-
-    # jasdaq growth
-    jasdaq_growth = i[i.section == 'JASDAQ Growth']
-    total_jasdaq_growth = jasdaq_growth.code.shape[0]
-    extracted_jasdaq_growth = s[s.ecode.isin(jasdaq_growth.code)].ecode.unique().shape[0]
-    failed_jasdaq_growth = f[f.ecode.isin(jasdaq_growth.code)].ecode.unique().shape[0]
-    missed_jasdaq_growth = max(total_jasdaq_growth - (extracted_jasdaq_growth + failed_jasdaq_growth), 0)
-    extraction_ratio_jasdaq_growth = round(extracted_jasdaq_growth / total_jasdaq_growth,
-                                           3) if total_jasdaq_growth > 0 else 0
-
-    # jasdaq standard
-    jasdaq_standard = i[i.section == 'JASDAQ Standard']
-    total_jasdaq_standard = jasdaq_standard.code.shape[0]
-    extracted_jasdaq_standard = s[s.ecode.isin(jasdaq_standard.code)].ecode.unique().shape[0]
-    failed_jasdaq_standard = f[f.ecode.isin(jasdaq_standard.code)].ecode.unique().shape[0]
-    missed_jasdaq_standard = max(total_jasdaq_standard - (extracted_jasdaq_standard +
-                                                          failed_jasdaq_standard), 0)
-    extraction_ratio_jasdaq_standard = round(extracted_jasdaq_standard / total_jasdaq_standard,
-                                             3) if total_jasdaq_standard > 0 else 0
-
-    # market cap > ¥ 10 B
-    mcap_above_10b = i[i.market_cap >= 10e+9]
-    total_mcap_above_10b = mcap_above_10b.code.shape[0]
-    extracted_mcap_above_10b = s[s.ecode.isin(mcap_above_10b.code)].ecode.unique().shape[0]
-    failed_mcap_above_10b = f[f.ecode.isin(mcap_above_10b.code)].ecode.unique().shape[0]
-    missed_mcap_above_10b = max(total_mcap_above_10b - (extracted_mcap_above_10b + failed_mcap_above_10b), 0)
-    extraction_ratio_mcap_above_10b = round(extracted_mcap_above_10b / total_mcap_above_10b,
-                                            3) if total_mcap_above_10b > 0 else 0
-
-    # 3 month's average trading volume * price >= ¥ 85 MM
-    pv_above_85m = i[i.pv >= 85e+6]
-    total_pv_above_85m = pv_above_85m.code.shape[0]
-    extracted_pv_above_85m = s[s.ecode.isin(pv_above_85m.code)].ecode.unique().shape[0]
-    failed_pv_above_85m = f[f.ecode.isin(pv_above_85m.code)].ecode.unique().shape[0]
-    missed_pv_above_85m = max(total_pv_above_85m - (extracted_pv_above_85m + failed_pv_above_85m), 0)
-    extraction_ratio_pv_above_85m = round(extracted_pv_above_85m / total_pv_above_85m,
-                                          3) if total_pv_above_85m > 0 else 0
-
-    metrics = dict(
-        total=total,
-        extracted=extracted,
-        failed=failed,
-        missed=missed,
-        extraction_ratio=extraction_ratio,
-        total_topix=total_topix,
-        extracted_topix=extracted_topix,
-        failed_topix=failed_topix,
-        missed_topix=missed_topix,
-        extraction_ratio_topix=extraction_ratio_topix,
-        total_nikkei225=total_nikkei225,
-        extracted_nikkei225=extracted_nikkei225,
-        failed_nikkei225=failed_nikkei225,
-        missed_nikkei225=missed_nikkei225,
-        extraction_ratio_nikkei225=extraction_ratio_nikkei225,
-        total_jasdaq20=total_jasdaq20,
-        extracted_jasdaq20=extracted_jasdaq20,
-        failed_jasdaq20=failed_jasdaq20,
-        missed_jasdaq20=missed_jasdaq20,
-        extraction_ratio_jasdaq20=extraction_ratio_jasdaq20,
-        total_first_section=total_first_section,
-        extracted_first_section=extracted_first_section,
-        failed_first_section=failed_first_section,
-        missed_first_section=missed_first_section,
-        extraction_ratio_first_section=extraction_ratio_first_section,
-        total_second_section=total_second_section,
-        extracted_second_section=extracted_second_section,
-        failed_second_section=failed_second_section,
-        missed_second_section=missed_second_section,
-        extraction_ratio_second_section=extraction_ratio_second_section,
-        total_mothers=total_mothers,
-        extracted_mothers=extracted_mothers,
-        failed_mothers=failed_mothers,
-        missed_mothers=missed_mothers,
-        extraction_ratio_mothers=extraction_ratio_mothers,
-        total_jasdaq_growth=total_jasdaq_growth,
-        extracted_jasdaq_growth=extracted_jasdaq_growth,
-        failed_jasdaq_growth=failed_jasdaq_growth,
-        missed_jasdaq_growth=missed_jasdaq_growth,
-        extraction_ratio_jasdaq_growth=extraction_ratio_jasdaq_growth,
-        total_jasdaq_standard=total_jasdaq_standard,
-        extracted_jasdaq_standard=extracted_jasdaq_standard,
-        failed_jasdaq_standard=failed_jasdaq_standard,
-        missed_jasdaq_standard=missed_jasdaq_standard,
-        extraction_ratio_jasdaq_standard=extraction_ratio_jasdaq_standard,
-        total_mcap_above_10b=total_mcap_above_10b,
-        extracted_mcap_above_10b=extracted_mcap_above_10b,
-        failed_mcap_above_10b=failed_mcap_above_10b,
-        missed_mcap_above_10b=missed_mcap_above_10b,
-        extraction_ratio_mcap_above_10b=extraction_ratio_mcap_above_10b,
-        total_pv_above_85m=total_pv_above_85m,
-        extracted_pv_above_85m=extracted_pv_above_85m,
-        failed_pv_above_85m=failed_pv_above_85m,
-        missed_pv_above_85m=missed_pv_above_85m,
-        extraction_ratio_pv_above_85m=extraction_ratio_pv_above_85m
-    )
+    """
+        Computes extraction metrics over the input universe & each of the groups in "_METRIC_GROUPS".
+        Success & failure data are reduced to distinct ticker IDs once, every group is then counted with a
+        single vectorized pass over the input.
+        Metrics for a group are suffixed with its name(ex: "extracted_topix"), over-all metrics have no suffix.
+        :param success_data: dataframe with an "ecode" column for the extracted tickers
+        :param failure_data: dataframe with an "ecode" column for the failed tickers
+        :param input_data: input universe, one row per ticker with a "code" column & group columns
+    """
+    success_codes, failure_codes = pd.unique(success_data.ecode), pd.unique(failure_data.ecode)
+    metrics = _get_group_metrics(input_data.code.shape[0], success_codes.shape[0], failure_codes.shape[0])
+
+    # boolean membership matrix, one row per input ticker & one column per group
+    groups = pd.DataFrame({name: compare(input_data[column], value)
+                           for name, _, column, compare, value in _METRIC_GROUPS}, index=input_data.index)
+    totals = groups.sum()
+    extracted = groups[input_data.code.isin(success_codes)].sum()
+    failed = groups[input_data.code.isin(failure_codes)].sum()
+    for name in groups.columns:
+        group_metrics = _get_group_metrics(int(totals[name]), int(extracted[name]), int(failed[name]))
+        metrics.update({f'{key}_{name}': value for key, value in group_metrics.items()})
     return metrics
 
 
+def _open_metrics_store():
+    """
+        Opens the store that keeps daily metrics, metrics from an existing CSV sheet are imported into a new store.
+    """
+    make_dirs(HISTORICAL_DATA_STORAGE)
+    new_store = not isfile(DAILY_METRICS_DB)
+    store = MetricsStore(DAILY_METRICS_DB)
+    if new_store and isfile(DAILY_METRICS_FILE):
+        for metrics in pd.read_csv(DAILY_METRICS_FILE).to_dict('records'):
+            store.upsert(metrics.pop('date'), metrics)
+    return store
+
+
 def update_metrics_sheet(date, data):
-    # create a dataframe for new metrics
-    new_metrics = pd.DataFrame(data, index=[0])
-    new_metrics['date'] = date
-    final_metrics = new_metrics
+    """
+        Saves metrics for a date in the metrics store, metrics recomputed for a date replace the older ones.
+        :param date: date for the metrics(expected format: "YYYY-MM-DD")
+        :param data: dictionary of metric name --> value
+    """
+    with _open_metrics_store() as store:
+        store.upsert(date, data)
+
 
-    # check for existing metrics
-    if isfile(DAILY_METRICS_FILE):
-        existing_metrics = pd.read_csv(DAILY_METRICS_FILE)
-        if date not in existing_metrics.date.values:
-            final_metrics = existing_metrics.append(new_metrics, ignore_index=True)
-        else:  # TODO: compare if metrics for the same date need an update
-            final_metrics = existing_metrics
+def export_metrics_sheet(start_date=None, end_date=None, path=None):
+    """
+        Writes metrics for a range of dates from the metrics store to a CSV file.
+        :param start_date: first date to be included(expected format: "YYYYMMDD")
+        :param end_date: last date to be included(expected format: "YYYYMMDD")
+        :param path: location of the CSV file, defaults to the daily metrics file
+    """
+    path = DAILY_METRICS_FILE if path is None else path
+    start, end = [None if date is None else f'{date[:4]}-{date[4:6]}-{date[6:]}'
+                  for date in (start_date, end_date)]
+    with _open_metrics_store() as store:
+        store.export_csv(path, start=start, end=end)
+    logger.debug(f'Metrics sheet saved at: {path}')
 
-    # adjust order of column headers, 'date' should come first
-    columns = ['date'] + list(data.keys())
-    metrics = final_metrics.round(decimals=3)[columns]
 
-    # save metrics
-    metrics.to_csv(DAILY_METRICS_FILE, index=False)
+def generate_extraction_status_sheets(sheets, input_):
+    """
+        Writes extraction status sheets for multiple dates in one pass, the delisted mask is computed once &
+        only the status column is computed for every date.
+        Status is "N/A" for delisted tickers, otherwise whether or not the ticker was extracted.
+        :param sheets: list of (location, date, extracted ticker IDs)
+        :param input_: input dataframe, one row per ticker with "code" & "status" columns
+    """
+    delisted = input_.status == 'D'
+    for location, date, extracted_tickers in sheets:
+        status = input_.code.isin(set(extracted_tickers)).astype(str).where(~delisted, 'N/A')
+        input_.assign(extraction_status=status).to_csv(join(location, f'status_{date}.csv'), index=False)
 
 
 def generate_daily_extraction_status_sheet(data, input_, location, date):
-    extracted_tickers = data.ecode.unique()
+    generate_extraction_status_sheets([(location, date, data.ecode)], input_)
 
-    def status_provider(row):
-        return 'N/A' if row.status == 'D' else (
-            True if row.code in extracted_tickers else False)
 
-    input_['extraction_status'] = input_.apply(status_provider, axis=1)
-    status_file = join(location, f'status_{date}.csv')
-    input_.to_csv(status_file, index=False)
+def read_extraction_summary(target_date, end_time='15:01:00', bar_size='1 min'):
+    """
+        Reads the per-ticker summary(status, bars, first & last time stamp, attempts, error codes) kept in the
+        bar store index for a given date, no bar data is read.
+        Raise an error if directory for the given date is not present.
+    """
+    with _open_bar_store(target_date, end_time, bar_size) as store:
+        return pd.DataFrame(store.summaries(), columns=['ecode', *SUMMARY_FIELDS])
 
 
-def metrics_generator(date, bar_size, tickers):
+def _read_extraction_status(date, end_time, bar_size, data_location):
+    """
+        Returns success & failure ticker IDs for a given date, from the summary kept by the bar store.
+        Falls back to the success & failure files, if data was not extracted on this machine.
     """
-        Generate extraction metrics for daily downloaded data
-        Writes data to two new files:
-        - metrics.csv: day-wise metrics (success, failed, missed v/s total stocks)
+    try:
+        summary = read_extraction_summary(date, end_time=end_time, bar_size=bar_size)
+        status = summary.status.astype(bool)
+        return summary[status], summary[~status]
+    except NotADirectoryError:
+        logger.warning(f'Could not find a bar store for {date}, reading ticker IDs from the final dump')
+        return (read_extracted_data(data_location, 'success', columns=['ecode']),
+                read_extracted_data(data_location, 'failure', columns=['ecode']))
+
+
+def generate_metrics(dates, bar_size, tickers, end_time='15:01:00'):
+    """
+        Generate extraction metrics for daily downloaded data, for a range of dates.
+        Input file is read once for all the dates & status sheets for all the dates are written in one pass.
+        Writes data to:
+        - metrics.db: day-wise metrics (success, failed, missed v/s total stocks)
         - status.csv: extraction status for each input ticker for a specific day
+        Metrics are computed from the per-ticker summary kept in the bar store index, bar data is not read.
 
         - Parameters:
         -------------
-        - data_location(str): location where downloaded data is kept
-        - input_file(str): full path to input file
+        - dates(list): dates for which metrics are to be generated
+        - bar_size(str): bar size used for data extraction
+        - tickers(str): full path to input file
+        - end_time(str): end time used for data extraction
     """
     logger.info('Generating final extraction metrics')
-    display_date = f'{date[:4]}/{date[4:6]}/{date[6:]}'
-    write_to_console(f'{"-"*30} Metrics Generation: {display_date} {"-"*31}', verbose=True)
+    if type(tickers) is list:
+        return  # TODO: simple metrics generation
     try:
-        data_location = join(HISTORICAL_DATA_STORAGE, bar_size.replace(' ', ''),
-                             date[:4], MONTH_MAP[int(date[4:6])], date)
-        # read success, failure & input files
-        success = pd.read_csv(join(data_location, 'success.csv'))
-        failure = pd.read_csv(join(data_location, 'failure.csv'))
-
-        if type(tickers) is list:
-            pass  # TODO: simple metrics generation
-        else:  # assuming that input is a file path
-            input_ = pd.read_csv(tickers)
-            # filter out relevant input --> active tickers
-            relevant_input = input_[input_.status == 'A']
-
-            # get extraction metrics
-            metrics = compute_extraction_metrics(success, failure, relevant_input)
-            write_to_console(f'Over-all Extraction: {_get_marker(metrics["extraction_ratio"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'Topix Extraction: {_get_marker(metrics["extraction_ratio_topix"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'Nikkei 225 Extraction: {_get_marker(metrics["extraction_ratio_nikkei225"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'JASDAQ 20 Extraction: {_get_marker(metrics["extraction_ratio_jasdaq20"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'First Section Extraction: {_get_marker(metrics["extraction_ratio_first_section"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'Second Section Extraction: '
-                             f'{_get_marker(metrics["extraction_ratio_second_section"])}', pointer='->',
-                             indent=2, verbose=True)
-            write_to_console(f'Mothers Extraction: {_get_marker(metrics["extraction_ratio_mothers"])}',
-                             pointer='->', indent=2, verbose=True)
-            write_to_console(f'JASDAQ Growth Extraction: '
-                             f'{_get_marker(metrics["extraction_ratio_jasdaq_growth"])}', pointer='->',
-                             indent=2, verbose=True)
-            write_to_console(f'JASDAQ Standard Extraction: '
-                             f'{_get_marker(metrics["extraction_ratio_jasdaq_standard"])}', pointer='->',
-                             indent=2, verbose=True)
-            write_to_console(f'Market Capital Above ¥10B Extraction: '
-                             f'{_get_marker(metrics["extraction_ratio_mcap_above_10b"])}', pointer='->',
-                             indent=2, verbose=True)
-            write_to_console(f'Price x 3 Month\'s Trading Volume ¥85MM Extraction: '
-                             f'{_get_marker(metrics["extraction_ratio_pv_above_85m"])}', pointer='->',
-                             indent=2, verbose=True)
-            # generate / update metrics sheet
-            _date = f'{date[:4]}-{date[4:6]}-{date[6:]}'
-            update_metrics_sheet(_date, metrics)
-
-            # generate daily extraction status sheet
-            generate_daily_extraction_status_sheet(success, input_, data_location, date)
+        # assuming that input is a file path
+        input_ = pd.read_csv(tickers)
+        # filter out relevant input --> active tickers
+        relevant_input = input_[input_.status == 'A']
     except Exception as e:
-        logger.critical(f'Metrics generation failed: {e}')
+        logger.critical(f'Metrics generation failed, could not read input universe from {tickers}: {e}')
+        return
+    status_sheets = []
+    with _open_metrics_store() as store:
+        for date in dates:
+            display_date = f'{date[:4]}/{date[4:6]}/{date[6:]}'
+            write_to_console(f'{"-"*30} Metrics Generation: {display_date} {"-"*31}', verbose=True)
+            try:
+                data_location = _setup_storage_directories(date, bar_size=bar_size)
+                # metrics only need the ticker IDs for success & failure
+                success, failure = _read_extraction_status(date, end_time, bar_size, data_location)
+
+                # get extraction metrics
+                metrics = compute_extraction_metrics(success, failure, relevant_input)
+                write_to_console(f'Over-all Extraction: {_get_marker(metrics["extraction_ratio"])}',
+                                 pointer='->', indent=2, verbose=True)
+                for name, title, *_ in _METRIC_GROUPS:
+                    write_to_console(f'{title} Extraction: {_get_marker(metrics[f"extraction_ratio_{name}"])}',
+                                     pointer='->', indent=2, verbose=True)
+                # generate / update metrics
+                store.upsert(f'{date[:4]}-{date[4:6]}-{date[6:]}', metrics)
+                status_sheets.append((data_location, date, success.ecode))
+            except Exception as e:
+                logger.critical(f'Metrics generation failed for {date}: {e}')
+
+    # generate daily extraction status sheets
+    generate_extraction_status_sheets(status_sheets, input_)
+
+
+def metrics_generator(date, bar_size, tickers, end_time='15:01:00'):
+    """
+        Generate extraction metrics for a single date, refer to "generate_metrics".
+    """
+    generate_metrics([date], bar_size, tickers, end_time=end_time)
 
 
 if __name__ == '__main__':
@@ -4,8 +4,13 @@ from os.path import isfile
 from os.path import dirname
 from os.path import join
 from os.path import sep
+import numpy as np
 import pandas as pd
 
+from tws_equities.data_files.input_data.snapshot import load_snapshot
+from tws_equities.settings import DEFAULT_TICKERS_FILE as PATH_TO_DEFAULT_TICKERS
+from tws_equities.settings import TEST_TICKERS
+
 
 # TODO: load test tickers from a function call
 # TODO: better error handling against user input
@@ -13,8 +18,7 @@ import pandas as pd
 
 _ROOT_DIRECTORY = dirname(__file__)
 _PATH_TO_JAPAN_INDICES = join(_ROOT_DIRECTORY, 'japan_indices.csv')
-PATH_TO_DEFAULT_TICKERS = join(_ROOT_DIRECTORY, 'tickers.csv')
-TEST_TICKERS = [1301, 1332, 1376, 1377, 1382, 1383, 1401]
+_MAX_INDICES = 64  # widest membership bitset, see "_compile_japan_indices"
 
 
 def _get_file_extension(file_path):
@@ -76,8 +80,11 @@ def _read_csv(file_path):
     return _format_column_names(pd.read_csv(file_path))
 
 
-def _load_tickers_from_a_file(file_path):
-    tickers = []
+def _compile_tickers(file_path):
+    """
+        Parses a file with ticker IDs into arrays of unique ticker IDs(ascending) & their status.
+        Ticker is active if any of its rows has an active status, all tickers are active if there is no status.
+    """
     data = _read_csv(file_path)
     data_columns = data.columns.tolist()
     target_columns = ['code', 'ecode', 'e_code', 'ticker_id']
@@ -85,14 +92,23 @@ def _load_tickers_from_a_file(file_path):
     target_columns_is_a_subset_of_data_columns = bool(common_columns)
     if not target_columns_is_a_subset_of_data_columns:
         raise ValueError(f'User specified an input file that does not have any column for tickers.')
+    column = common_columns[0]
+    data = data[~data[column].isna()]
     if 'status' in data_columns:
         active_statuses = ['A', 'a', 1, True]  # fixme: standardize
-        data = data[data.status.isin(active_statuses)]
-    for column in common_columns:
-        # not nan, convert to int, sort, extract unqiue & convert to python list
-        tickers = data[~data[column].isna()][column].astype(int).sort_values().unique().tolist()
-        break
-    return tickers
+        active = data.status.isin(active_statuses).to_numpy()
+    else:
+        active = np.ones(data.shape[0], dtype=bool)
+    tickers, positions = np.unique(data[column].astype('int64').to_numpy(), return_inverse=True)
+    ticker_is_active = np.zeros(tickers.shape[0], dtype=bool)
+    np.logical_or.at(ticker_is_active, positions, active)
+    return {'tickers': tickers, 'active': ticker_is_active}
+
+
+def _load_tickers_from_a_file(file_path):
+    _validate_target_file(file_path, expected_file_type='csv')
+    snapshot = load_snapshot(file_path, 'tickers', _compile_tickers)
+    return snapshot['tickers'][snapshot['active']].tolist()
 
 
 def get_default_tickers():
@@ -113,5 +129,34 @@ def get_japan_indices():
     return data
 
 
+def _compile_japan_indices(file_path):
+    """
+        Parses japan_indices.csv into arrays of ticker IDs(ascending) & a membership bitset for every ticker,
+        bit "i" is set if the ticker is a member of index "i". Bitset is as wide as the number of indices needs,
+        up to 64 indices are supported.
+    """
+    data = _read_csv(file_path).fillna('')
+    members = {index: {int(code.split('.')[0]) for code in data[index] if 'T' in code} for index in data.columns}
+    if len(members) > _MAX_INDICES:
+        raise ValueError(f'Membership bitset holds up to {_MAX_INDICES} indices, found {len(members)} in: '
+                         f'{file_path}')
+    tickers = np.array(sorted(set().union(*members.values())), dtype='int64')
+    membership = np.zeros(tickers.shape[0], dtype=np.min_scalar_type((1 << len(members)) - 1))
+    for bit, codes in enumerate(members.values()):
+        membership[np.isin(tickers, list(codes))] |= 1 << bit
+    return {'indices': np.array(list(members)), 'tickers': tickers, 'membership': membership}
+
+
+def get_japan_index_members():
+    """
+        Returns a dictionary of index name(ex: "topix") --> ticker IDs(ascending), for indices in japan_indices.csv
+    """
+    _validate_target_file(_PATH_TO_JAPAN_INDICES, expected_file_type='csv')
+    snapshot = load_snapshot(_PATH_TO_JAPAN_INDICES, 'japan_indices', _compile_japan_indices)
+    tickers, membership = snapshot['tickers'], snapshot['membership']
+    return {str(index): tickers[(membership >> bit) & 1 == 1].tolist()
+            for bit, index in enumerate(snapshot['indices'])}
+
+
 drop_unnamed_columns = _drop_unnamed_columns
 format_column_names = _format_column_names
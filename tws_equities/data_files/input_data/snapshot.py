@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Compiled snapshots of input files, a CSV file is parsed once & saved as NumPy arrays in the cache directory.
+    Snapshot is keyed by size & modification time of its source file, so it is re-built only when the file changes.
+    Arrays are memory mapped when loaded, pages are shared between the processes reading the same snapshot.
+"""
+
+from hashlib import sha1
+from json import dumps
+from json import loads
+from logging import getLogger
+from os import makedirs
+from os import remove
+from os import replace
+from os import stat
+from os.path import abspath
+from os.path import join
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+from tws_equities.settings import CACHE_DIR
+
+
+_SNAPSHOT_DIRECTORY = join(CACHE_DIR, 'snapshots')
+_KEY_FILE = 'key.json'
+_LOADED_SNAPSHOTS = {}  # snapshot directory --> (key, arrays), snapshots already loaded by this process
+logger = getLogger(__name__)
+
+
+def _get_source_key(file_path):
+    status = stat(file_path)
+    return f'{status.st_size}:{status.st_mtime_ns}'
+
+
+def _get_snapshot_directory(file_path, kind):
+    return join(_SNAPSHOT_DIRECTORY, f'{kind}_{sha1(abspath(file_path).encode()).hexdigest()[:16]}')
+
+
+def _read_snapshot(directory, key):
+    """
+        Returns memory mapped arrays from a snapshot, None if the snapshot is missing or out of date.
+    """
+    try:
+        with open(join(directory, _KEY_FILE), 'r') as f:
+            saved = loads(f.read())
+        if saved['key'] != key:
+            return None
+        return {name: np.load(join(directory, f'{name}.npy'), mmap_mode='r') for name in saved['arrays']}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_file(directory, name, write):
+    """
+        Writes a file through a uniquely named temporary file, which is then moved in place.
+        Processes building the same snapshot at the same time never write to the same file.
+    """
+    temp_file = NamedTemporaryFile(dir=directory, prefix=f'{name}.', suffix='.tmp', delete=False)
+    try:
+        with temp_file:
+            write(temp_file)
+        replace(temp_file.name, join(directory, name))
+    except BaseException:
+        remove(temp_file.name)
+        raise
+
+
+def _save_snapshot(directory, key, arrays):
+    """
+        Saves arrays to the snapshot directory, key is written last so a partially written snapshot is never read.
+    """
+    makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        _write_file(directory, f'{name}.npy', lambda f: np.save(f, array))
+    _write_file(directory, _KEY_FILE, lambda f: f.write(dumps({'key': key, 'arrays': list(arrays)}).encode()))
+
+
+def load_snapshot(file_path, kind, build):
+    """
+        Returns arrays compiled from the given file, snapshot is re-built if the file changed since it was taken.
+        :param file_path: location of the source file
+        :param kind: type of the snapshot(ex: "tickers"), a file can have a snapshot for each type
+        :param build: function that parses the source file & returns a dictionary of name --> NumPy array
+        :return: dictionary of name --> NumPy array
+    """
+    directory, key = _get_snapshot_directory(file_path, kind), _get_source_key(file_path)
+    loaded_key, arrays = _LOADED_SNAPSHOTS.get(directory, (None, None))
+    if loaded_key != key:
+        arrays = _read_snapshot(directory, key)
+    if arrays is None:
+        logger.debug(f'Compiling {kind} snapshot for: {file_path}')
+        arrays = build(file_path)
+        try:
+            _save_snapshot(directory, key, arrays)
+        except OSError as e:
+            logger.warning(f'Could not save {kind} snapshot for {file_path}: {e}')
+    _LOADED_SNAPSHOTS[directory] = (key, arrays)
+    return arrays
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from tws_equities.helpers.bar_store import BarStore
+from tws_equities.helpers.bar_store import SUMMARY_FIELDS
 from tws_equities.helpers.contract_maker import create_stock
+from tws_equities.helpers.metrics_store import MetricsStore
 from tws_equities.helpers.utils import *
 
 
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Append-only store for extracted data, one store per date.
+    Replaces one JSON file per ticker with a single segment file & a small index.
+"""
+
+from json import dumps
+from json import loads
+from mmap import ACCESS_READ
+from mmap import mmap
+from os import fsync
+from os.path import getsize
+from os.path import isfile
+from os.path import join
+from struct import Struct
+
+
+_HEADER = Struct('!I')  # length prefix for every record
+SEGMENT_FILE = 'bars.seg'
+INDEX_FILE = 'bars.idx'
+# every index entry carries a compact summary of its record, in this order
+SUMMARY_FIELDS = ('status', 'total_bars', 'first_bar', 'last_bar', 'attempts', 'error_codes')
+
+
+def _summarize(data):
+    """
+        Returns the summary for a record, as a list of values for "SUMMARY_FIELDS".
+    """
+    meta_data, bar_data = data['meta_data'], data['bar_data']
+    time_stamps = [_bar['time_stamp'] for _bar in bar_data]
+    return [bool(meta_data['status']), len(bar_data), min(time_stamps, default=None),
+            max(time_stamps, default=None), meta_data.get('attempts', 0),
+            [error['code'] for error in meta_data.get('_error_stack', [])]]
+
+
+class BarStore:
+    """
+        Keeps extracted data for a set of tickers in a single append-only segment file.
+        Every record is a length prefixed JSON document holding a ticker's meta & bar data, an index file
+        maps each ticker to the offset & a summary(status, number of bars, first & last time stamp, attempts &
+        error codes) of its latest record. Index is loaded in memory, so checking whether a ticker has been
+        processed is a dictionary lookup & extraction metrics can be computed without reading any bar data.
+
+        A ticker can be written more than once (ex: failure followed by a successful retry), latest record wins.
+        Records are read back through a memory map of the segment file.
+
+        Usage:
+            with BarStore(directory) as store:
+                store.extend(data)
+                for ticker, data in store.records(status=True):
+                    ...
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segment_path = join(directory, SEGMENT_FILE)
+        self.index_path = join(directory, INDEX_FILE)
+        self._index = {}  # ticker --> (offset, size, summary)
+        self._segment = None
+        self._index_file = None
+        self._map = None
+        self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, ticker):
+        return ticker in self._index
+
+    def _load_index(self):
+        """
+            Loads the index, re-builds it from the segment file if it is missing or lags behind.
+        """
+        end = 0
+        if isfile(self.index_path):
+            with open(self.index_path, 'r') as f:
+                for line in f:
+                    try:
+                        ticker, offset, size, summary = loads(line)
+                    except ValueError:  # partially written entry, record will be recovered from the segment
+                        break
+                    if not isinstance(summary, list):  # entry written without a summary, re-build the index
+                        self._index, end = {}, 0
+                        break
+                    self._index[ticker] = (offset, size, summary)
+                    end = max(end, offset + _HEADER.size + size)
+        if isfile(self.segment_path) and getsize(self.segment_path) > end:
+            self._recover(end)
+
+    def _recover(self, offset):
+        """
+            Indexes the records written after the given offset, these were not indexed due to an interruption.
+            A partially written or corrupt record at the end of the segment is dropped.
+        """
+        with open(self.segment_path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                size = _HEADER.unpack(header)[0]
+                payload = f.read(size)
+                if len(payload) < size:
+                    break
+                try:
+                    data = loads(payload)
+                except ValueError:
+                    break
+                self._index[data['meta_data']['ecode']] = (offset, size, _summarize(data))
+                offset += _HEADER.size + size
+        with open(self.segment_path, 'r+b') as f:
+            f.truncate(offset)
+        with open(self.index_path, 'w') as f:
+            f.writelines(dumps([ticker, *entry]) + '\n' for ticker, entry in self._index.items())
+
+    def _open_for_writing(self):
+        if self._segment is None:
+            self._segment = open(self.segment_path, 'ab')
+            self._index_file = open(self.index_path, 'a')
+        self._close_map()
+
+    def append(self, ticker, data):
+        """
+            Appends a record for the given ticker.
+            :param ticker: ticker ID
+            :param data: dictionary with meta & bar data for the ticker
+        """
+        self.extend({ticker: data})
+
+    def extend(self, data):
+        """
+            Appends records for multiple tickers, segment is written sequentially & synced before the index.
+            :param data: dictionary of ticker ID --> meta & bar data
+        """
+        if not data:
+            return
+        self._open_for_writing()
+        offset = self._segment.tell()
+        entries = []
+        for ticker, ticker_data in data.items():
+            payload = dumps(ticker_data, separators=(',', ':')).encode()
+            self._segment.write(_HEADER.pack(len(payload)))
+            self._segment.write(payload)
+            entries.append((ticker, offset, len(payload), _summarize(ticker_data)))
+            offset += _HEADER.size + len(payload)
+        self._segment.flush()
+        fsync(self._segment.fileno())
+        self._index_file.writelines(dumps(entry) + '\n' for entry in entries)
+        self._index_file.flush()
+        for ticker, offset, size, summary in entries:
+            self._index[ticker] = (offset, size, summary)
+
+    def status(self, ticker):
+        """
+            Returns the status of the latest record for a ticker, None if the ticker was never written.
+        """
+        entry = self._index.get(ticker)
+        return None if entry is None else entry[2][0]
+
+    def tickers(self, status=None):
+        """
+            Returns the stored ticker IDs in ascending order, optionally filtered by the status of latest record.
+        """
+        return sorted(ticker for ticker, entry in self._index.items() if status is None or entry[2][0] is status)
+
+    def summary(self, ticker):
+        """
+            Returns the summary of the latest record for a ticker as a dictionary, read from the index.
+        """
+        return dict(zip(SUMMARY_FIELDS, self._index[ticker][2]), ecode=ticker)
+
+    def summaries(self, status=None):
+        """
+            Returns summaries for the stored tickers in ascending ticker order, no record is read from the segment.
+        """
+        return [self.summary(ticker) for ticker in self.tickers(status=status)]
+
+    def read(self, ticker):
+        """
+            Returns the latest record for a ticker.
+        """
+        offset, size, _ = self._index[ticker]
+        if self._map is None:
+            self._flush()
+            with open(self.segment_path, 'rb') as f:
+                self._map = mmap(f.fileno(), 0, access=ACCESS_READ)
+        start = offset + _HEADER.size
+        return loads(self._map[start:start + size])
+
+    def records(self, status=None):
+        """
+            Yields (ticker ID, data) for the stored tickers in ascending ticker order, one record at a time.
+        """
+        for ticker in self.tickers(status=status):
+            yield ticker, self.read(ticker)
+
+    def _flush(self):
+        if self._segment is not None:
+            self._segment.flush()
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self):
+        self._close_map()
+        if self._segment is not None:
+            self._segment.close()
+            self._index_file.close()
+            self._segment = self._index_file = None
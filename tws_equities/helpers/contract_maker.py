@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from ibapi.client import Contract
+from ibapi.contract import Contract
 
 
 def create_stock(symbol, security_type='STK', exchange='SMART', currency='JPY'):
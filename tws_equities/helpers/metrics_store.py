@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Embedded store for daily extraction metrics, backed by a single SQLite table keyed by date.
+"""
+
+import sqlite3
+
+
+_TABLE = 'daily_metrics'
+
+
+class MetricsStore:
+    """
+        Keeps one row of extraction metrics per date in a SQLite table, date being the primary key.
+        Saving metrics for a date that already exists replaces them(upsert), so recomputing metrics for a date
+        is a single row write, no matter how long the history is.
+        Columns are added as new metrics show up, range queries are served by the primary key index.
+
+        Usage:
+            with MetricsStore(path) as store:
+                store.upsert('2021-01-04', metrics)
+                data = store.query(start='2021-01-01', end='2021-01-31')
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(f'CREATE TABLE IF NOT EXISTS {_TABLE} (date TEXT PRIMARY KEY)')
+        self._columns = self._get_columns()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_columns(self):
+        return [row[1] for row in self._connection.execute(f'PRAGMA table_info({_TABLE})')]
+
+    def _add_columns(self, names):
+        for name in names:
+            if name not in self._columns:  # column has no type, integers & ratios keep their own types
+                self._connection.execute(f'ALTER TABLE {_TABLE} ADD COLUMN "{name}"')
+                self._columns.append(name)
+
+    def upsert(self, date, metrics):
+        """
+            Saves metrics for a date, replaces the existing values for that date.
+            :param date: date for the metrics(expected format: "YYYY-MM-DD")
+            :param metrics: dictionary of metric name --> value
+        """
+        names = list(metrics)
+        self._add_columns(names)
+        columns = ', '.join(f'"{name}"' for name in ['date', *names])
+        placeholders = ', '.join('?' * (len(names) + 1))
+        updates = ', '.join(f'"{name}" = excluded."{name}"' for name in names) or 'date = excluded.date'
+        with self._connection:
+            self._connection.execute(f'INSERT INTO {_TABLE} ({columns}) VALUES ({placeholders}) '
+                                     f'ON CONFLICT(date) DO UPDATE SET {updates}', [date, *metrics.values()])
+
+    def query(self, start=None, end=None):
+        """
+            Returns metrics for the dates within the given range(both ends included) as a dataframe, by date.
+            :param start: first date to be included, from the beginning if not given
+            :param end: last date to be included, up to the latest if not given
+        """
+        conditions, parameters = [], []
+        if start is not None:
+            conditions.append('date >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('date <= ?')
+            parameters.append(end)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        import pandas as pd  # pandas is slow to import, only loaded when metrics are read
+        return pd.read_sql_query(f'SELECT * FROM {_TABLE}{where} ORDER BY date', self._connection,
+                                 params=parameters)
+
+    def export_csv(self, path, start=None, end=None):
+        """
+            Writes metrics for the given range of dates to a CSV file.
+        """
+        self.query(start=start, end=end).round(decimals=3).to_csv(path, index=False)
+
+    def close(self):
+        self._connection.close()
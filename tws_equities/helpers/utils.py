@@ -17,7 +17,6 @@ from os import listdir
 from os import makedirs
 from os import remove
 from os import rmdir
-import pandas as pd
 from time import time
 from time import sleep
 from sys import stdout
@@ -192,6 +191,7 @@ def _validate_target_file(file_path, expected_file_type='csv'):
 
 def read_csv(file_path, target_columns=None):
     _validate_target_file(file_path, expected_file_type='csv')
+    import pandas as pd  # pandas is slow to import, only loaded when a CSV file is read
     return pd.read_csv(file_path, usecols=target_columns)
 
 
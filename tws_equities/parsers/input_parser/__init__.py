@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from argparse import ArgumentParser
-from tws_equities.data_files import get_default_tickers
 from tws_equities.parsers.input_parser._cli_config import CLI_CONFIG
 from tws_equities.helpers import write_to_console
+from tws_equities.settings import DEFAULT_TICKERS_FILE
 
 # TODO: build uploader
 # TODO: allow the user to provide an output location
@@ -71,11 +71,11 @@ def parse_user_args(command_line=None):
         parser.print_help()
         exit(0)
 
-    # user did not specify tickers
+    # user did not specify tickers, default input file is loaded by the command that needs the tickers
     if hasattr(args, 'tickers') and args.tickers is None:
         write_to_console('User did not specify target tickers, loading from default input file.\n',
                          verbose=True)
-        args.tickers = get_default_tickers()
+        args.tickers = DEFAULT_TICKERS_FILE
 
     return vars(args)
 
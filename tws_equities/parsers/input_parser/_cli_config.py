@@ -41,6 +41,14 @@ _WHAT_TO_SHOW = dict(name='--what-to-show', flag='-w', type=str, default='TRADES
 _USE_RTH = dict(name='--use-rth', flag='-u', type=int, default=0, dest='use_rth', choices=[0, 1],
                 help='Whether(1) or not(0) to retrieve data generated only within Regular Trading Hours(RTH)')
 
+_CONNECTIONS = dict(name='--connections', flag='-c', type=int, default=1, dest='connections',
+                    help='Number of parallel connections to TWS API, each one uses a distinct client ID. '
+                         '(default: 1)')
+
+_GATEWAYS = dict(name='--gateway', flag='-g', type=INPUT_TYPES['gateway'], action='append', default=None,
+                 dest='gateways', help='TWS / IB Gateway address to spread the connections across, can be '
+                                       'repeated, default is "127.0.0.1:7497". (Expected format: "HOST:PORT")')
+
 
 # options built for CSV maker
 # TODO: provide default values for data & output locations
@@ -48,8 +56,17 @@ _DATA_LOCATION = dict(name='--data-location', flag='-d', default=None, dest='dat
                       help='Allows the user to choose a location from where raw data is to be read.')
 _OUTPUT_LOCATION = dict(name='--output-location', flag='-o', default=None, dest='output_location',
                         help='Allows the user to choose a location where the output file will be saved.')
-_FORMAT = dict(name='--format', flag='-f', type=str, default='csv', choices=['csv'], dest='format',
-               help='Allows the user to choose the final data format, currently only CSV is supported.')
+_FORMAT = dict(name='--format', flag='-f', type=str, default='csv', choices=['csv', 'parquet'], dest='format',
+               help='Allows the user to choose the final data format, Parquet files are typed & compressed but '
+                    'need "pyarrow" to be installed. (Defaults to "csv")')
+_WORKERS = dict(name='--workers', flag='-j', type=int, default=1, dest='workers',
+                help='Number of worker processes used to convert data, dates & tickers within a date are split '
+                     'across the workers. (default: 1)')
+
+# options built for metrics generator
+_EXPORT = dict(name='--export', flag='-x', default=False, action='store_true', dest='export',
+               help='Writes metrics for the given dates to "metrics.csv", metrics are always saved to the metrics '
+                    'database.')
 
 
 # optional arguments built specifically for tickers command, do not alter these
@@ -79,7 +96,9 @@ _TICKERS = dict(help='Use this command to pass custom ticker ID(s) as an input t
 
 # building config for run command
 _OPTIONAL_ARGUMENTS = dict(start_date=_START_DATE, end_date=_END_DATE, end_time=_END_TIME, duration=_DURATION,
-                           bar_size=_BAR_SIZE, what_to_show=_WHAT_TO_SHOW, use_rth=_USE_RTH)
+                           bar_size=_BAR_SIZE, what_to_show=_WHAT_TO_SHOW, use_rth=_USE_RTH,
+                           connections=_CONNECTIONS, gateways=_GATEWAYS, format=_FORMAT,
+                           workers=_WORKERS)
 _POSITIONAL_ARGUMENTS = dict(tickers=_TICKERS)
 _RUN = dict(help='Use this command to trigger a complete run that would download bar-data, convert & save it '
                  'to a CSV file and finally present the user with extraction metrics.',
@@ -91,7 +110,7 @@ _RUN = dict(help='Use this command to trigger a complete run that would download
 # TODO: output location
 _OPTIONAL_ARGUMENTS = dict(end_date=_END_DATE, end_time=_END_TIME, duration=_DURATION,
                            bar_size=_BAR_SIZE, what_to_show=_WHAT_TO_SHOW,
-                           use_rth=_USE_RTH)
+                           use_rth=_USE_RTH, connections=_CONNECTIONS, gateways=_GATEWAYS)
 _POSITIONAL_ARGUMENTS = dict(tickers=_TICKERS)
 _DOWNLOAD = dict(help='Use this command to only download and save bar-data in JSON format.',
                  description='Allows the user to trigger data download from TWS API, which will be saved in '
@@ -108,7 +127,8 @@ _UPLOAD = dict(help='Use this command to upload CSV files to a google drive loca
                optional_arguments=_OPTIONAL_ARGUMENTS, positional_arguments=_POSITIONAL_ARGUMENTS)
 
 # building config for download command
-_OPTIONAL_ARGUMENTS = dict(start_date=_START_DATE, end_date=_END_DATE)
+_OPTIONAL_ARGUMENTS = dict(start_date=_START_DATE, end_date=_END_DATE, end_time=_END_TIME, format=_FORMAT,
+                           workers=_WORKERS)
 _POSITIONAL_ARGUMENTS = None  # dict(tickers=_TICKERS)
 _CONVERT = dict(help='Use this command to convert & save already downloaded data to a CSV file.',
                 description='Allows the user to convert & save downloaded JSON data to a CSV file.',
@@ -116,12 +136,12 @@ _CONVERT = dict(help='Use this command to convert & save already downloaded data
 
 
 # building config for download command
-_OPTIONAL_ARGUMENTS = dict(start_date=_START_DATE, end_date=_END_DATE)
+_OPTIONAL_ARGUMENTS = dict(start_date=_START_DATE, end_date=_END_DATE, end_time=_END_TIME, export=_EXPORT)
 _POSITIONAL_ARGUMENTS = dict(tickers=_TICKERS)
 _METRICS = dict(help='Use this command to generate, display & save extraction metrics for a given date. ',
                 description='Allows the user to generate, display & save extraction metrics for a given '
-                            'date. This command expectes that data is already downloaded and available in '
-                            'CSV format.',
+                            'date. This command expectes that data is already downloaded, metrics are '
+                            'computed from the summary kept with the downloaded data.',
                 optional_arguments=_OPTIONAL_ARGUMENTS, positional_arguments=_POSITIONAL_ARGUMENTS)
 
 
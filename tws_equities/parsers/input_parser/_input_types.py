@@ -77,6 +77,18 @@ class _BarSize:
         return bar_size
 
 
+class _Gateway:
+
+    def __call__(self, gateway):
+        _err = 'Expected a gateway address as host and port separated by a colon (Ex: "127.0.0.1:4001").'
+        try:
+            host, port = gateway.rsplit(':', 1)
+            assert bool(host) and port.isdigit()
+        except:
+            raise ArgumentTypeError(_err)
+        return host, int(port)
+
+
 class _TickersList:
 
     def __call__(self, value):
@@ -128,5 +140,6 @@ INPUT_TYPES = {
                     'bar_size': _BarSize(),
                     'file': _File(),
                     'url': _URL(),
+                    'gateway': _Gateway(),
                     'list': _TickersList()
               }
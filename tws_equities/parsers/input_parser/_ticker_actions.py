@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from argparse import Action
-from tws_equities.data_files import get_tickers_from_user_file
 
-from tws_equities.data_files.input_data import PATH_TO_DEFAULT_TICKERS
-from tws_equities.data_files.input_data import TEST_TICKERS
+from tws_equities.settings import DEFAULT_TICKERS_FILE as PATH_TO_DEFAULT_TICKERS
+from tws_equities.settings import TEST_TICKERS
 
 
 class _ListLoader(Action):
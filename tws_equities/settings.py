@@ -20,6 +20,9 @@ PROJECT_DIR = join(BASE_DIR, 'tws_equities')
 CACHE_DIR = join(BASE_DIR, '.cache')
 HISTORICAL_DATA_STORAGE = join(BASE_DIR, 'historical_data')
 DAILY_METRICS_FILE = join(HISTORICAL_DATA_STORAGE, 'metrics.csv')
+DAILY_METRICS_DB = join(HISTORICAL_DATA_STORAGE, 'metrics.db')
+DEFAULT_TICKERS_FILE = join(PROJECT_DIR, 'data_files', 'input_data', 'tickers.csv')
+TEST_TICKERS = [1301, 1332, 1376, 1377, 1382, 1383, 1401]
 
 # status indicators  --> CROSS = BAD | TICK = GOOD
 RED_CROSS = u'\u274C'
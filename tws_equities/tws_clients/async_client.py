@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""
+    asyncio-native TWS API client.
+    Messages are read & framed on the event loop and dispatched straight into the Decoder, no EReader thread
+    or message queue is involved. Historical data requests are exposed as coroutines that resolve to the full
+    list of bars, so thousands of requests can be coordinated from a single thread.
+"""
+
+import asyncio
+from logging import getLogger
+
+from ibapi import comm
+from ibapi.client import EClient
+from ibapi.common import NO_VALID_ID
+from ibapi.decoder import Decoder
+from ibapi.server_versions import MAX_CLIENT_VER
+from ibapi.server_versions import MIN_CLIENT_VER
+
+from tws_equities.helpers import create_stock
+from tws_equities.tws_clients.base import TWSWrapper
+from tws_equities.tws_clients.data_extractor import MAX_SIMULTANEOUS_REQUESTS
+from tws_equities.tws_clients.pacing import PacingEngine
+from tws_equities.tws_clients.pacing import is_small_bar_size
+
+
+# farm status codes, 2158 is the last one received during the initial handshake
+_FARM_STATUS_OK = [2104, 2106, 2158]
+_FARM_STATUS_BROKEN = [2103, 2105, 2157]
+
+
+class RequestError(Exception):
+    """
+        Raised when TWS API responds to a request with an error.
+    """
+
+    def __init__(self, req_id, code, message):
+        super().__init__(f'{message}: Request ID: {req_id}, Error Code: {code}')
+        self.req_id = req_id
+        self.code = code
+        self.message = message
+
+
+class _TransportConnection:
+    """
+        Stands in for ibapi.connection.Connection, writes outgoing messages to an asyncio transport.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def isConnected(self):
+        return self.transport is not None and not self.transport.is_closing()
+
+    def sendMsg(self, msg):
+        if not self.isConnected():
+            return 0
+        self.transport.write(msg)
+        return len(msg)
+
+    def disconnect(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class _TWSProtocol(asyncio.Protocol):
+    """
+        Frames incoming bytes into messages with "comm.FrameBuffer", same as EReader. Unread bytes are only moved
+        when the buffer runs out of room, not once per message.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.frame_buf = comm.FrameBuffer()
+
+    def connection_made(self, transport):
+        self.client._on_connection_made(transport)
+
+    def data_received(self, data):
+        self.frame_buf.extend(data)
+        for msg in self.frame_buf.messages():
+            # views are only valid until the next write, hand out a copy
+            self.client._on_message(bytes(msg))
+            msg.release()
+
+    def connection_lost(self, exc):
+        self.client._on_connection_lost(exc)
+
+
+class _AsyncWrapper(TWSWrapper):
+    """
+        Collects bars for every pending request & resolves its future once the data set is complete.
+    """
+
+    def __init__(self, client):
+        TWSWrapper.__init__(self)
+        self.client = client
+
+    def historicalData(self, reqId, bar):
+        request = self.client._pending.get(reqId)
+        if request is not None:
+            request['bars'].append(bar)
+
+    def historicalDataEnd(self, reqId, start, end):
+        request = self.client._pending.pop(reqId, None)
+        if request is not None and not request['future'].done():
+            request['future'].set_result(request['bars'])
+
+    def error(self, reqId, errorCode, errorString):
+        self.client._on_error(reqId, errorCode, errorString)
+
+    def connectionClosed(self):
+        pass
+
+
+class AsyncTWSClient(EClient):
+    """
+        TWS API client driven by an asyncio event loop.
+        Request encoding is inherited from EClient, the socket & reader thread are replaced by an asyncio
+        transport.
+
+        Usage:
+            async def main():
+                client = AsyncTWSClient()
+                await client.connect()
+                bars = await client.req_historical_data(1301, '20210101 15:01:00')
+                client.disconnect()
+    """
+
+    def __init__(self, max_requests_in_flight=MAX_SIMULTANEOUS_REQUESTS, timeout=30, logger=None):
+        EClient.__init__(self, _AsyncWrapper(self))
+        self.logger = logger or getLogger(__name__)
+        self.timeout = timeout
+        self.pacer = PacingEngine()
+        self._max_requests_in_flight = min(max(1, max_requests_in_flight), MAX_SIMULTANEOUS_REQUESTS)
+        self._request_slots = None
+        self._handshake = None
+        self._farms_ready = None
+        self._pending = {}  # request ID --> {'future': asyncio.Future, 'bars': list}
+        self._next_req_id = 1
+
+    def _on_connection_made(self, transport):
+        self.conn = _TransportConnection(transport)
+
+    def _on_message(self, msg):
+        fields = comm.read_fields(msg)
+        if self.decoder is None:
+            # sometimes news arrive before the server version, wait for a message with 2 fields
+            # decoder is set up right away, following messages can arrive within the same data chunk
+            if len(fields) == 2:
+                server_version, conn_time = fields
+                self.serverVersion_ = int(server_version)
+                self.connTime = conn_time
+                self.decoder = Decoder(self.wrapper, self.serverVersion())
+                self._handshake.set_result(self.serverVersion_)
+            return
+        self.decoder.interpret(fields)
+
+    def _on_connection_lost(self, exc):
+        self.logger.error(f'Connection to TWS API was lost: {exc}')
+        self.setConnState(EClient.DISCONNECTED)
+        error = ConnectionError(f'Connection to TWS API was lost: {exc}')
+        for waiter in [self._handshake, self._farms_ready]:
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(error)
+        for request in self._pending.values():
+            if not request['future'].done():
+                request['future'].set_exception(error)
+        self._pending = {}
+
+    def _on_error(self, req_id, code, message):
+        if req_id == NO_VALID_ID:
+            if code in _FARM_STATUS_BROKEN:
+                self.logger.error(f'Insecure Connection: {message}, Error code: {code}')
+            elif code == 2158 and not self._farms_ready.done():
+                self.logger.info('Secure connection established to TWS API.')
+                self._farms_ready.set_result(True)
+            else:
+                self.logger.debug(f'{message}, Error code: {code}')
+            return
+        request = self._pending.pop(req_id, None)
+        if request is None:
+            self.logger.debug(f'{message}: Request ID: {req_id}, Error Code: {code}')
+            return
+        self.logger.error(f'{message}: Request ID: {req_id}, Error Code: {code}')
+        if not request['future'].done():
+            request['future'].set_exception(RequestError(req_id, code, message))
+
+    async def connect(self, host='127.0.0.1', port=7497, client_id=10, wait_for_farms=True):
+        """
+            Establishes a connection to TWS API & completes the version handshake.
+            :param host: IP Address of the machine hosting the TWS app
+            :param port: Port number on which TWS is listening to new connections
+            :param client_id: Client ID using which connection will be made
+            :param wait_for_farms: wait until TWS reports that data farms are connected (code: 2158)
+        """
+        loop = asyncio.get_running_loop()
+        self.host, self.port, self.clientId = host, port, client_id
+        self._handshake = loop.create_future()
+        self._farms_ready = loop.create_future()
+        self._request_slots = asyncio.Semaphore(self._max_requests_in_flight)
+        try:
+            await loop.create_connection(lambda: _TWSProtocol(self), host, port)
+        except OSError as e:
+            raise ConnectionError(f'Could not connect to TWS, please ensure TWS is running: {e}')
+        self.setConnState(EClient.CONNECTING)
+        self.conn.sendMsg(str.encode('API\0', 'ascii') + comm.make_msg(f'v{MIN_CLIENT_VER}..{MAX_CLIENT_VER}'))
+
+        await asyncio.wait_for(self._handshake, self.timeout)
+        self.setConnState(EClient.CONNECTED)
+        self.startApi()
+        if wait_for_farms:
+            await asyncio.wait_for(self._farms_ready, self.timeout)
+
+    def disconnect(self):
+        """
+            Terminates the connection to TWS API.
+        """
+        self.setConnState(EClient.DISCONNECTED)
+        if self.conn is not None:
+            self.conn.disconnect()
+            self.conn = None
+
+    async def _wait_for_pacing(self, ticker, request, small_bars):
+        contract = (ticker, 'SMART', request[4])
+        delay = self.pacer.delay(contract, request, small_bars=small_bars)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.pacer.delay(contract, request, small_bars=small_bars)
+        return contract
+
+    async def req_historical_data(self, ticker, end_date_time, duration='1 D', bar_size='1 min',
+                                  what_to_show='TRADES', use_rth=0, date_format=1, keep_upto_date=False,
+                                  chart_options=(), timeout=None):
+        """
+            Requests historical data for a ticker & waits for the complete data set.
+            Requests wait for a free slot (max 50 in flight) & for pacing limits before being sent.
+            :return: list of BarData objects
+            :raises RequestError: TWS API responded with an error
+            :raises asyncio.TimeoutError: response did not arrive within timeout, request is cancelled
+        """
+        queued_at = self.pacer.clock()
+        small_bars = is_small_bar_size(bar_size)
+        request = (ticker, end_date_time, duration, bar_size, what_to_show, use_rth)
+        async with self._request_slots:
+            contract = await self._wait_for_pacing(ticker, request, small_bars)
+            if not self.isConnected():
+                raise ConnectionError('Not connected to TWS API.')
+            req_id = self._next_req_id
+            self._next_req_id += 1
+            future = asyncio.get_running_loop().create_future()
+            self._pending[req_id] = {'future': future, 'bars': []}
+            self.pacer.record(contract, request, small_bars=small_bars, queued_at=queued_at)
+            self.reqHistoricalData(req_id, create_stock(ticker), end_date_time, duration, bar_size, what_to_show,
+                                   use_rth, date_format, keep_upto_date, chart_options)
+            try:
+                return await asyncio.wait_for(future, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                self._pending.pop(req_id, None)
+                if self.isConnected():
+                    self.cancelHistoricalData(req_id)
+                raise
@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import queue
+
+from ibapi import comm
+from ibapi.common import MAX_MSG_LEN
+from ibapi.common import NO_VALID_ID
+from ibapi.errors import BAD_LENGTH
+from ibapi.utils import BadMessage
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
 
@@ -14,3 +21,43 @@ class TWSClient(EClient):
 
     def __init__(self, wrapper):
         EClient.__init__(self, wrapper)
+        self.message_size = 0  # size of the message being processed, in bytes
+
+    def run_until(self, condition):
+        """
+            Message loop that mirrors EClient.run, but hands the control back as soon as the given condition
+            is met instead of tearing down the connection. Allows the same connection to be re-used.
+            :param condition: callable without arguments, checked before processing every message
+            :return: final value of the condition
+        """
+        while not(self.done or condition()) and (self.isConnected() or not self.msg_queue.empty()):
+            try:
+                text = self.msg_queue.get(block=True, timeout=0.2)
+            except queue.Empty:
+                self.msgLoopTmo()
+                continue
+            if len(text) > MAX_MSG_LEN:
+                self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(), f'{BAD_LENGTH.msg()}:{len(text)}:{text}')
+                self.disconnect()
+                break
+            self.message_size = len(text)
+            try:
+                self.decoder.interpret(comm.read_fields(text))
+            except BadMessage:
+                self.conn.disconnect()
+            self.msgLoopRec()
+        return condition()
+
+    def msgLoopTmo(self):
+        """
+            Invoked by the message loop when no message was received within the polling interval.
+            Intended to be overloaded.
+        """
+        pass
+
+    def msgLoopRec(self):
+        """
+            Invoked by the message loop after every message that was received & processed.
+            Intended to be overloaded.
+        """
+        pass
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Record & replay of TWS API wire sessions.
+    Recorder is attached to a connection & saves every framed message, in either direction, with a monotonic time
+    stamp to a compact binary capture file. Replay pushes a capture back through EReader & Decoder into wrapper
+    callbacks, at full speed or at the original pace, without a connection to TWS.
+
+    Capture file: 8 byte magic, followed by one record per message:
+        direction(1 byte) | monotonic time stamp in nano-seconds(8 bytes) | payload size(4 bytes) | payload
+"""
+
+from logging import getLogger
+from os.path import getsize
+from os.path import isfile
+from queue import Queue
+from struct import Struct
+from threading import Lock
+from time import monotonic_ns
+from time import perf_counter
+from time import sleep
+
+from ibapi import comm
+from ibapi.decoder import Decoder
+from ibapi.reader import EReader
+
+
+MAGIC = b'TWSCAP\x00\x01'
+INBOUND, OUTBOUND, HANDSHAKE = 0, 1, 2  # handshake is the first outbound message on a new connection
+_API_PREFIX = b'API\0'
+_RECORD_HEADER = Struct('!BQI')
+_SIZE_PREFIX = Struct('!I')
+_END = object()  # marks the end of a capture in the replay queue
+logger = getLogger(__name__)
+
+
+class SessionRecorder:
+    """
+        Writes the traffic on a connection to a capture file, attach it to a client before connecting:
+            client.recorder = SessionRecorder('session.cap')
+        Bytes are framed into messages as they arrive, messages are time stamped once complete.
+        Capture file is appended to, so that a session spanning re-connections ends up in a single file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        is_new = not isfile(path) or getsize(path) == 0
+        self._file = open(path, 'ab')
+        if is_new:
+            self._file.write(MAGIC)
+        self._lock = Lock()  # inbound traffic is recorded by reader thread, outbound by the caller
+        self._frames = {INBOUND: comm.FrameBuffer(), OUTBOUND: comm.FrameBuffer()}
+        self.stats = {'inbound': 0, 'outbound': 0, 'bytes': 0}
+
+    def _write(self, direction, payload, time_stamp):
+        self._file.write(_RECORD_HEADER.pack(direction, time_stamp, len(payload)))
+        self._file.write(payload)
+        self.stats['inbound' if direction == INBOUND else 'outbound'] += 1
+        self.stats['bytes'] += _RECORD_HEADER.size + len(payload)
+
+    def _record(self, direction, data):
+        with self._lock:
+            if self._file.closed:
+                return
+            time_stamp, frames = monotonic_ns(), self._frames[direction]
+            if direction == OUTBOUND and not len(frames) and bytes(data[:len(_API_PREFIX)]) == _API_PREFIX:
+                # new connection, version range is prefixed with "API\0" instead of being sent as a message
+                self._frames[INBOUND] = comm.FrameBuffer()
+                data = data[len(_API_PREFIX):]
+                size = _SIZE_PREFIX.unpack_from(data)[0]
+                self._write(HANDSHAKE, bytes(data[_SIZE_PREFIX.size:_SIZE_PREFIX.size + size]), time_stamp)
+                data = data[_SIZE_PREFIX.size + size:]
+            frames.extend(data)
+            for message in frames.messages():
+                self._write(direction, message, time_stamp)
+                message.release()
+
+    def inbound(self, data):
+        self._record(INBOUND, data)
+
+    def outbound(self, data):
+        self._record(OUTBOUND, data)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_capture(path):
+    """
+        Yields (direction, monotonic time stamp in nano-seconds, payload) for every message in a capture file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'Not a TWS capture file: {path}')
+    position, end = len(MAGIC), len(data)
+    while position + _RECORD_HEADER.size <= end:
+        direction, time_stamp, size = _RECORD_HEADER.unpack_from(data, position)
+        position += _RECORD_HEADER.size
+        if position + size > end:
+            logger.warning(f'Capture file ends with a truncated message: {path}')
+            return
+        yield direction, time_stamp, data[position:position + size]
+        position += size
+
+
+class _ReplayConnection:
+    """
+        Stands in for Connection, hands the inbound messages of a capture out to EReader as a byte stream.
+        Outbound messages are put straight into the message queue, after the inbound ones that preceded them.
+    """
+
+    def __init__(self, records, msg_queue, realtime=False):
+        self.records = records
+        self.msg_queue = msg_queue
+        self.realtime = realtime
+        self._pending = memoryview(b'')  # inbound message being handed out
+        self._connected = True
+        self._started_at = None  # (clock, time stamp) for the first message
+        self._offset = 0  # nano-seconds since the first message, as per the capture
+        self._last_time_stamp = None
+
+    def isConnected(self):
+        return self._connected
+
+    def _wait(self, time_stamp):
+        """
+            Holds back a message until its original offset from the first one has lapsed.
+        """
+        if self._last_time_stamp is not None:
+            # captures appended by different processes do not share a clock, time stamps can go backwards
+            self._offset += max(time_stamp - self._last_time_stamp, 0)
+        else:
+            self._started_at = perf_counter()
+        self._last_time_stamp = time_stamp
+        delay = self._started_at + self._offset / 1e9 - perf_counter()
+        if delay > 0:
+            sleep(delay)
+
+    def recvMsgInto(self, frame_buf):
+        while not self._pending:
+            record = next(self.records, None)
+            if record is None:
+                self._connected = False
+                self.msg_queue.put(_END)
+                return 0
+            direction, time_stamp, payload = record
+            if self.realtime:
+                self._wait(time_stamp)
+            if direction == INBOUND:
+                self._pending = memoryview(_SIZE_PREFIX.pack(len(payload)) + payload)
+            else:
+                self.msg_queue.put((direction, payload))
+        view = frame_buf.write_view(len(self._pending))
+        size = min(len(view), len(self._pending))
+        view[:size] = self._pending[:size]
+        frame_buf.commit(size)
+        self._pending = self._pending[size:]
+        return size
+
+
+def replay(path, wrapper, realtime=False, on_request=None, on_connect=None):
+    """
+        Pushes the inbound messages of a capture through EReader & Decoder into the wrapper callbacks.
+        :param path: location of the capture file
+        :param wrapper: EWrapper implementation that receives the callbacks
+        :param realtime: True to replay messages at their original pace, False to replay them at full speed
+        :param on_request: called with the fields of every outbound message, in the order they were sent
+        :param on_connect: called without arguments for every connection found in the capture, before its handshake
+        :return: replay statistics, number of messages & bytes decoded along with the time taken
+    """
+    msg_queue = Queue()
+    reader = EReader(_ReplayConnection(read_capture(path), msg_queue, realtime), msg_queue)
+    decoder, stats = None, {'connections': 0, 'messages': 0, 'bytes': 0, 'requests': 0}
+    start = perf_counter()
+    reader.start()
+    while True:
+        message = msg_queue.get()
+        if message is _END:
+            break
+        if isinstance(message, tuple):
+            direction, payload = message
+            if direction == HANDSHAKE:
+                decoder = None
+                stats['connections'] += 1
+                if on_connect is not None:
+                    on_connect()
+            elif on_request is not None:
+                stats['requests'] += 1
+                on_request(comm.read_fields(payload))
+            continue
+        fields = comm.read_fields(message)
+        if hasattr(wrapper, 'message_size'):  # see TWSClient.run_until
+            wrapper.message_size = len(message)
+        stats['messages'] += 1
+        stats['bytes'] += len(message)
+        if decoder is None:
+            # first message on a connection carries server version & connection time, as read by EClient.connect
+            if len(fields) == 2:
+                decoder = Decoder(wrapper, int(fields[0]))
+            continue
+        decoder.interpret(fields)
+    reader.join()
+    stats['time_lapsed'] = perf_counter() - start
+    return stats
@@ -7,30 +7,62 @@
 
 from tws_equities.tws_clients import TWSWrapper
 from tws_equities.tws_clients import TWSClient
+from tws_equities.tws_clients.capture import SessionRecorder
+from tws_equities.tws_clients.capture import replay
+from tws_equities.tws_clients.deadlines import DeadlineScheduler
+from tws_equities.tws_clients.instrumentation import Instruments
+from tws_equities.tws_clients.pacing import PacingEngine
+from tws_equities.tws_clients.pacing import is_small_bar_size
+from tws_equities.tws_clients.retries import CONNECTIVITY
+from tws_equities.tws_clients.retries import PACING
+from tws_equities.tws_clients.retries import RetryPolicy
+from tws_equities.tws_clients.retries import classify
 from tws_equities.helpers import create_stock
 from tws_equities.helpers import make_dirs
+from ibapi.message import OUT
+from ibapi.utils import HOT_PATH_LOGGING
+from collections import deque
 from logging import getLogger
-from os import name as os_name
-import signal
+from time import sleep
+from time import time
 
 
-OS_IS_UNIX = os_name == 'posix'
+# TWS rejects historical data requests beyond 50 open ones with error code 322
+MAX_SIMULTANEOUS_REQUESTS = 50
+# seconds without a request rejected with 322 after which a narrowed request window is widened again
+WINDOW_RECOVERY_INTERVAL = 30
+# seconds to wait before the first attempt to re-connect, doubles with every consecutive attempt
+RECONNECT_DELAY = 2
+# how to treat a bar received for a time stamp that already has one, see "_store_bar"
+DUPLICATE_POLICIES = ['first', 'last', 'merge']
 
 
 class HistoricalDataExtractor(TWSWrapper, TWSClient):
 
     def __init__(self, end_date='20210101', end_time='15:01:00', duration='1 D', bar_size='1 min',
                  what_to_show='TRADES', use_rth=0, date_format=1, keep_upto_date=False, chart_options=(),
-                 logger=None, timeout=3, max_attempts=3):
+                 logger=None, timeout=3, max_attempts=3, max_requests_in_flight=10, keep_alive=False,
+                 max_reconnects=3, duplicate_policy='last', prioritize_retries=True, capture_file=None,
+                 instrumentation_file=None, retry_policy=None):
         TWSWrapper.__init__(self)
         TWSClient.__init__(self, wrapper=self)
         self.ticker = None
         self._target_tickers = []
-        self._processed_tickers = []
+        # work queue, every ticker is in exactly one of these until the extraction completes
+        self._pending = deque()  # tickers yet to be requested
+        self._retries = deque()  # tickers to be requested again
+        self._backoffs = DeadlineScheduler()  # tickers waiting out a backoff, moved to retries once it is over
+        self._processed_tickers = set()  # tickers that are done, successfully or not
+        self._failed_tickers = set()  # tickers that were given up on
+        self.prioritize_retries = prioritize_retries
+        self._requests_in_flight = DeadlineScheduler()  # tickers waiting for a response
+        self._queued_at = {}  # ticker --> time at which the ticker was put in line for a request
         self.is_connected = False
         self.directory_maker = make_dirs
-        # TODO: implement broken connection handler
         self.connection_is_broken = False
+        self.keep_alive = keep_alive
+        self.max_reconnects = max_reconnects
+        self._connection_params = None
         self.handshake_completed = False
         self.end_date = end_date
         self.end_time = end_time
@@ -44,7 +76,24 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
         self.timeout = timeout
         self.logger = logger or getLogger(__name__)
         self.max_attempts = max_attempts
+        self.request_window = None  # number of requests to keep in flight, as configured
+        self.max_requests_in_flight = None  # current size of the window, narrowed down by 322
+        self._last_rejection = 0  # time at which a request was last rejected with 322
+        self.set_request_window(max_requests_in_flight)
         self.data = None
+        self.counters = None
+        # pacing limits apply per connection, engine outlives the target tickers
+        self.pacer = PacingEngine()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.queue_waits = {}  # ticker --> seconds the last request waited in queue
+        if duplicate_policy not in DUPLICATE_POLICIES:
+            raise ValueError(f'Duplicate policy: {duplicate_policy} is not one of: {DUPLICATE_POLICIES}')
+        self.duplicate_policy = duplicate_policy
+        self._bar_index = {}  # ticker --> {time stamp --> bar}, bars are shared with "bar_data"
+        self.capture_file = capture_file  # wire traffic is recorded to this file when set, see "capture"
+        # per request traces, outlive the target tickers so that a snapshot covers every extraction so far
+        self.instruments = Instruments()
+        self.instrumentation_file = instrumentation_file  # snapshot is exported here after every extraction
 
     def _init_data_tracker(self, ticker):
         """
@@ -55,8 +104,19 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
                       '_error_stack': [], 'total_bars': 0, 'ecode': ticker}
         _initial_data = {'meta_data': _meta_data, 'bar_data': []}
         self.data[ticker] = _initial_data
+        self._bar_index[ticker] = {}
         self.logger.info(f'Initialized data tracker for ticker: {ticker}')
 
+    def _init_counters(self):
+        """
+            Initializes throughput counters.
+            Should be invoked for every new set of target tickers.
+        """
+        self.counters = {'requests_sent': 0, 'requests_completed': 0, 'requests_failed': 0,
+                         'requests_rejected': 0, 'bars_received': 0,
+                         'peak_requests_in_flight': 0, 'total_queue_wait': 0.0, 'max_queue_wait': 0.0,
+                         'start_time': time(), 'end_time': None}
+
     def _reset_attr(self, **kwargs):
         """
             Resets the value of the given attributes
@@ -69,41 +129,98 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
             self.logger.debug(f'Attribute: {attr} was reset to: {value}')
         self.logger.info('Extractor client object was reset successfully')
 
-    def _set_timeout(self, ticker):
+    def set_request_window(self, size):
+        """
+            Sets the number of requests to keep in flight, capped at the limit imposed by TWS.
+        """
+        self.request_window = self.max_requests_in_flight = min(max(1, size), MAX_SIMULTANEOUS_REQUESTS)
+
+    def _widen_request_window(self):
+        """
+            Widens a request window narrowed down by 322 by one slot per completed request, once no request has
+            been rejected for WINDOW_RECOVERY_INTERVAL seconds.
+        """
+        if self.max_requests_in_flight < self.request_window and \
+                time() - self._last_rejection >= WINDOW_RECOVERY_INTERVAL:
+            self.max_requests_in_flight += 1
+            self.logger.debug(f'Request window widened to: {self.max_requests_in_flight}')
+
+    def _set_target_tickers(self, tickers):
+        """
+            Resets the work queue & data trackers for a new set of target tickers.
+        """
+        self._reset_attr(_target_tickers=tickers, data={}, _processed_tickers=set(), _failed_tickers=set(),
+                         _pending=deque(tickers), _retries=deque(), _backoffs=DeadlineScheduler(),
+                         _requests_in_flight=DeadlineScheduler(), _queued_at={}, queue_waits={},
+                         _bar_index={})
+        self._init_counters()
+
+    def _expire_requests(self):
         """
-            Break the call running longer than timeout threshold.
-            Call error method with code=-1 on timeout.
-            NOTE: Not supported on Windows OS yet.
+            Reports every request in flight that has crossed its deadline to error method with code=-1.
+            Invoked from the message loop, works on any thread & any OS.
         """
-        # noinspection PyUnusedLocal
-        def _handle_timeout(signum, frame):
-            try:
-                _message = f'Data request for ticker: {ticker} timed out after: {self.timeout} seconds'
-                self.error(ticker, -1, _message)
-            except OSError as e:  # TODO: make it work for Windows OS
-                self.logger.error(f'{e}')
+        expired = self._requests_in_flight.pop_expired()
+        for ticker in expired:
+            _message = f'Data request for ticker: {ticker} timed out after: {self.timeout} seconds'
+            self.logger.error(f'{_message}: Ticker ID: {ticker}, Error Code: -1')
+            self._request_failed(ticker, -1, _message)
+        if expired and self.handshake_completed:
+            self._fill_request_slots()
 
-        # TODO: final alarm
-        # if OS_IS_UNIX:
-        signal.signal(signal.SIGALRM, _handle_timeout)
-        signal.alarm(self.timeout)
+    def _get_pacing_keys(self, ticker):
+        """
+            Returns the keys that identify the contract & the request for given ticker with the pacing engine.
+        """
+        contract = (ticker, 'SMART', self.what_to_show)
+        request = (ticker, self.end_date, self.end_time, self.duration, self.bar_size, self.what_to_show,
+                   self.use_rth)
+        return contract, request
+
+    def _pacing_delay(self, ticker):
+        """
+            Returns the number of seconds to wait before a request for the given ticker is legal.
+        """
+        contract, request = self._get_pacing_keys(ticker)
+        return self.pacer.delay(contract, request, small_bars=is_small_bar_size(self.bar_size))
+
+    def _record_queue_wait(self, ticker):
+        """
+            Registers the request with pacing engine & keeps track of the time it waited in queue.
+        """
+        contract, request = self._get_pacing_keys(ticker)
+        wait = self.pacer.record(contract, request, small_bars=is_small_bar_size(self.bar_size),
+                                 queued_at=self._queued_at.pop(ticker, None))
+        self.queue_waits[ticker] = wait
+        self.counters['total_queue_wait'] += wait
+        self.counters['max_queue_wait'] = max(self.counters['max_queue_wait'], wait)
+        return wait
+
+    def _register_request(self, ticker):
+        """
+            Books a request for the given ticker as sent: deadline, attempts, counters & pacing.
+        """
+        now = time()
+        self._requests_in_flight.add(ticker, self.timeout, now=now)
+        self.data[ticker]['meta_data']['attempts'] += 1
+        self.counters['requests_sent'] += 1
+        wait = self._record_queue_wait(ticker)
+        self.instruments.request_sent(ticker, attempt=self.data[ticker]['meta_data']['attempts'],
+                                      queued_at=now - wait, now=now)
+        self.counters['peak_requests_in_flight'] = max(self.counters['peak_requests_in_flight'],
+                                                       len(self._requests_in_flight))
 
     def _request_historical_data(self, ticker):
         """
             Sends request to TWS API
         """
-        try:
-            if OS_IS_UNIX:
-                self._set_timeout(ticker)
-            contract = create_stock(ticker)
-            end_date_time = f'{self.end_date} {self.end_time}'
-            self.logger.info(f'Requesting historical data for ticker: {ticker}')
-            self.data[ticker]['meta_data']['attempts'] += 1
-            self.reqHistoricalData(ticker, contract, end_date_time, self.duration, self.bar_size,
-                                   self.what_to_show, self.use_rth, self.date_format, self.keep_upto_date,
-                                   self.chart_options)
-        except OSError as e:  # TODO: temporary piece, find a fix for Windows
-            self.logger.critical(f'{e}')
+        contract = create_stock(ticker)
+        end_date_time = f'{self.end_date} {self.end_time}'
+        self.logger.info(f'Requesting historical data for ticker: {ticker}')
+        self._register_request(ticker)
+        self.reqHistoricalData(ticker, contract, end_date_time, self.duration, self.bar_size,
+                               self.what_to_show, self.use_rth, self.date_format, self.keep_upto_date,
+                               self.chart_options)
 
     def _extraction_check(self, ticker):
         """
@@ -120,9 +237,162 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
         self.logger.debug(f'Extraction status check result for ticker: {ticker} is "{return_value}"')
         return return_value
 
+    def _extraction_completed(self):
+        """
+            Returns True once every target ticker has been marked as processed.
+        """
+        return not(self._pending or self._retries or self._backoffs or self._requests_in_flight)
+
+    def _next_ticker(self):
+        """
+            Returns the queue to take the next ticker from, None if there is nothing left to request.
+        """
+        queues = [self._retries, self._pending] if self.prioritize_retries else [self._pending, self._retries]
+        for queue in queues:
+            if queue:
+                return queue
+        return None
+
+    def _fill_request_slots(self):
+        """
+            Sends requests for queued tickers until the in-flight window is full.
+            Tickers that have already been extracted or have exhausted their attempts are marked as
+            processed on the way, without occupying a slot.
+            Nothing is sent while the connection is down, requests that would breach pacing limits are
+            held back at the front of their queue and picked up again by the message loop.
+            Tickers join the retry queue once their backoff is over, pending ones are sent in the meantime.
+        """
+        if self.connection_is_broken or not self.isConnected():
+            return
+        self._retries.extend(self._backoffs.pop_expired())
+        small_bars = is_small_bar_size(self.bar_size)
+        held_back = []
+        # window is re-checked on every step, callbacks can send requests while we are looping
+        while len(self._requests_in_flight) < self.max_requests_in_flight:
+            if small_bars and self.pacer.window_delay() > 0:
+                break
+            queue = self._next_ticker()
+            if queue is None:
+                break
+            ticker = queue.popleft()
+            if ticker in self._requests_in_flight or ticker in self._processed_tickers:
+                continue
+            if ticker not in self.data:
+                self._init_data_tracker(ticker)
+            if self._extraction_check(ticker):
+                self._processed_tickers.add(ticker)
+                self.logger.debug(f'Ticker: {ticker} was processed, completion marked')
+                continue
+            self._queued_at.setdefault(ticker, time())
+            if self._pacing_delay(ticker) > 0:
+                held_back.append((queue, ticker))
+                continue
+            self._request_historical_data(ticker)
+        for queue, ticker in reversed(held_back):
+            queue.appendleft(ticker)
+
+    def _schedule_retry(self, ticker):
+        """
+            Puts a ticker back in line as per the retry policy, a ticker that must not be retried is failed.
+            Tickers backing off wait outside the queues, so that they never hold up the rest.
+            :return: False if the ticker was failed
+        """
+        meta_data = self.data[ticker]['meta_data']
+        delay = self.retry_policy.backoff(meta_data['_error_stack'])
+        if delay is None:
+            self._processed_tickers.add(ticker)
+            self._failed_tickers.add(ticker)
+            return False
+        if delay > 0:
+            self._backoffs.add(ticker, delay)
+            self.logger.debug(f'Ticker: {ticker} will be requested again in {delay:.2f} seconds')
+        else:
+            self._retries.append(ticker)
+        return True
+
+    def _request_failed(self, ticker, code, message):
+        """
+            Puts a ticker whose request failed or timed out back in line, or moves it to the failed ones once it
+            has exhausted its attempts or received an error that rules out a retry. Requests lost along with the
+            connection are sent again once it is restored, their attempts are not counted.
+            Requests turned down for pacing were never served either, they are not counted against the attempts
+            & are only limited by the number of backoffs allowed by the retry policy.
+        """
+        meta_data = self.data[ticker]['meta_data']
+        meta_data['_error_stack'].append({'code': code, 'message': message})
+        self.counters['requests_failed'] += 1
+        self.instruments.request_failed(ticker, code)
+        category = classify(code, message)
+        if category == CONNECTIVITY:
+            meta_data['attempts'] -= 1
+            self._retries.appendleft(ticker)
+        elif category == PACING:
+            meta_data['attempts'] -= 1
+            self._schedule_retry(ticker)
+        elif meta_data['attempts'] >= self.max_attempts:
+            self._processed_tickers.add(ticker)
+            self._failed_tickers.add(ticker)
+        else:
+            self._schedule_retry(ticker)
+        # -1 indicates a timeout
+        # 504 indicates no connection
+        if code in [-1, 504]:
+            self.cancelHistoricalData(ticker)
+            self.logger.error(f'Canceling: {ticker} | {code} | {message}')
+
+    @property
+    def throughput(self):
+        """
+            Returns a snapshot of throughput counters for the current set of target tickers, along with
+            the derived request & bar rates.
+        """
+        if self.counters is None:
+            return {}
+        snapshot = dict(self.counters)
+        end_time = snapshot['end_time'] or time()
+        time_lapsed = max(end_time - snapshot['start_time'], 1e-6)
+        snapshot['requests_in_flight'] = len(self._requests_in_flight)
+        snapshot['requests_backing_off'] = len(self._backoffs)
+        snapshot['time_lapsed'] = round(time_lapsed, 3)
+        snapshot['requests_per_second'] = round(snapshot['requests_completed'] / time_lapsed, 3)
+        snapshot['bars_per_second'] = round(snapshot['bars_received'] / time_lapsed, 3)
+        requests_sent = snapshot['requests_sent']
+        snapshot['mean_queue_wait'] = round(snapshot['total_queue_wait'] / requests_sent, 3) if requests_sent else 0
+        snapshot['requests_timed_out'] = self._requests_in_flight.stats['expired']
+        snapshot['mean_latency'] = round(self._requests_in_flight.mean_latency, 3)
+        snapshot['max_latency'] = round(self._requests_in_flight.stats['max_latency'], 3)
+        return snapshot
+
+    def _requeue_requests_in_flight(self):
+        """
+            Puts the tickers that were waiting for a response back in line, their attempts are not counted.
+            Used when responses for these requests are never going to arrive, e.g. after a connection loss.
+        """
+        for ticker in self._requests_in_flight:
+            self.data[ticker]['meta_data']['attempts'] -= 1
+            self._requests_in_flight.discard(ticker)
+            self.instruments.request_dropped(ticker)
+            self._retries.appendleft(ticker)
+        self.logger.debug('Requests in flight were put back in line')
+
+    def _reconnect(self, attempt):
+        """
+            Re-establishes a broken connection, waits a little longer before every consecutive attempt.
+            :param attempt: number of consecutive re-connection attempts, including the current one
+        """
+        if attempt > self.max_reconnects:
+            raise ConnectionError(f'Lost connection to TWS API, could not re-connect after {self.max_reconnects} '
+                                  f'attempts.')
+        delay = RECONNECT_DELAY * 2 ** (attempt - 1)
+        self.logger.error(f'Lost connection to TWS API, re-connecting in {delay} seconds (attempt: {attempt})')
+        self._requeue_requests_in_flight()
+        self.disconnect()
+        sleep(delay)
+        self.connect(*self._connection_params)
+
     def connect(self, host='127.0.0.1', port=7497, client_id=10):
         """
-            Establishes a connection to TWS API
+            Establishes a connection to TWS API & waits for the initial handshake to complete
             Sets 'is_connected' to True after a successful connection
             @param host: IP Address of the machine hosting the TWS app
             @param port: Port number on which TWS is listening to new connections
@@ -130,18 +400,26 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
         """
         self.logger.info('Trying to connect to TWS API server')
         if not self.is_connected:
+            self._connection_params = (host, port, client_id)
+            if self.capture_file is not None:
+                self.recorder = SessionRecorder(self.capture_file)
             super().connect(host, port, client_id)
             self.is_connected = self.isConnected()
             self.logger.debug(f'Connection status: {self.is_connected}')
-            self.run()
+            if not self.is_connected:
+                raise ConnectionError(f'Not connected to TWS API, please launch TWS and enable API settings.')
+            self.run_until(lambda: self.handshake_completed)
 
     def disconnect(self):
         """
             Disconnects the client from TWS API
         """
         self.logger.info('Extraction completed, terminating main loop')
-        self._reset_attr(is_connected=False, handshake_completed=False)
+        self._reset_attr(is_connected=False, handshake_completed=False, connection_is_broken=False)
         super().disconnect()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def run(self):
         """
@@ -155,38 +433,153 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
             raise ConnectionError(f'Not connected to TWS API, please launch TWS and enable API settings.')
         super().run()
 
+    def msgLoopTmo(self):
+        """
+            Message loop is idle, expire the requests that timed out & retry the ones held back by pacing limits.
+        """
+        if self.handshake_completed:
+            self._expire_requests()
+            self._fill_request_slots()
+
+    def msgLoopRec(self):
+        """
+            Message was processed, expire the requests that timed out in the meantime.
+        """
+        if self._requests_in_flight:
+            self._expire_requests()
+
     def extract_historical_data(self, tickers=None):
         """
             Performs historical data extraction on tickers provided as input.
+            Up to "max_requests_in_flight" requests are kept outstanding on the connection, free slots
+            are re-filled as responses for the previous requests come back.
+            Connection is kept open after the extraction if the client was created with "keep_alive",
+            so that the next set of tickers can be sent through it, and is re-established if it breaks.
+            :return: extracted data, keyed by ticker ID
+        """
+        for _ in self.iter_historical_data(tickers):
+            pass
+        return self.data
+
+    def iter_historical_data(self, tickers=None, chunk_size=None):
+        """
+            Same as "extract_historical_data", but hands the data over in chunks as the tickers are processed,
+            while requests for the rest of them are kept in flight. Request window never drains between chunks.
+            :param chunk_size: number of processed tickers per chunk, all the tickers at once by default
+            :return: generator of extracted data, keyed by ticker ID
         """
         if tickers is not None:
-            self._reset_attr(_target_tickers=tickers, data={})
+            self._set_target_tickers(tickers)
         if not self.is_connected:
             self.connect()
-        unprocessed_tickers = list(set(self._target_tickers).difference(self._processed_tickers))
-        if bool(unprocessed_tickers):
-            self.logger.info(f'Found unprocessed tickers, proceeding with data extraction')
-            _target_ticker = unprocessed_tickers[0]
-            self.logger.debug(f'Target ticker: {_target_ticker}')
-            if _target_ticker not in self.data:
-                self._init_data_tracker(_target_ticker)
-            ticker_is_not_processed = not self._extraction_check(_target_ticker)
-            if ticker_is_not_processed:
-                self._request_historical_data(_target_ticker)
-            else:
-                self._processed_tickers.append(_target_ticker)
-                self.logger.debug(f'Ticker was processed, completion marked')
-                self.extract_historical_data()
-        else:
+        reconnects, handed_over = 0, set()
+        chunk_size = chunk_size or max(1, len(self._target_tickers))
+
+        def chunk_is_ready():
+            return len(self._processed_tickers) - len(handed_over) >= chunk_size or self._extraction_completed()
+
+        self.logger.info(f'Found unprocessed tickers, proceeding with data extraction')
+        self._fill_request_slots()
+        while True:
+            while not self.run_until(chunk_is_ready):
+                reconnects += 1
+                self._reconnect(reconnects)
+                self._fill_request_slots()
+            chunk = [ticker for ticker in dict.fromkeys(self._target_tickers)
+                     if ticker in self._processed_tickers and ticker not in handed_over]
+            handed_over.update(chunk)
+            if chunk:
+                yield {ticker: self.data[ticker] for ticker in chunk}
+            if self._extraction_completed():
+                break
+        self.counters['end_time'] = time()
+        self.logger.debug(f'Extraction throughput: {self.throughput}')
+        self.export_instrumentation()
+        if not self.keep_alive:
             self.disconnect()
 
+    def export_instrumentation(self, path=None, traces=False):
+        """
+            Exports a snapshot of request instrumentation, invoked automatically after every extraction.
+            :param path: ".prom" file for Prometheus text format, JSON otherwise,
+                         defaults to "instrumentation_file"
+            :param traces: set to True to include per request traces in JSON export
+            :return: snapshot as a dictionary
+        """
+        path = path or self.instrumentation_file
+        if path is not None:
+            self.instruments.export(path, traces=traces)
+            self.logger.debug(f'Exported instrumentation snapshot to: {path}')
+        return self.instruments.snapshot(traces=traces)
+
+    def replay_session(self, capture_file, realtime=False):
+        """
+            Replays a recorded session(see "capture_file") into this extractor, instead of extracting data from
+            TWS. Requests found in the capture are booked as if they were sent by the extractor & responses are
+            handled by the usual callbacks, which makes the decode path measurable without a connection to TWS.
+            :param capture_file: location of the capture file
+            :param realtime: True to replay messages at their original pace, False to replay them at full speed
+            :return: replayed data, keyed by ticker ID
+        """
+        self._set_target_tickers([])
+
+        def on_request(fields):
+            if int(fields[0]) != OUT.REQ_HISTORICAL_DATA:
+                return
+            ticker = int(fields[1])
+            if ticker not in self.data:
+                self._init_data_tracker(ticker)
+            self._target_tickers.append(ticker)
+            self._register_request(ticker)
+
+        def on_connect():
+            # responses for requests sent over a broken connection never arrive, as in "_reconnect"
+            self._requeue_requests_in_flight()
+
+        stats = replay(capture_file, self, realtime=realtime, on_request=on_request, on_connect=on_connect)
+        self.counters['end_time'] = time()
+        self.logger.debug(f'Replayed {stats["messages"]} messages in {stats["time_lapsed"]:.3f} seconds')
+        return self.data
+
+    def _store_bar(self, ticker, bar):
+        """
+            Adds a bar to the ticker's bar data, bars are indexed by time stamp.
+            A bar received for a time stamp that already has one is handled as per the duplicate policy:
+                - first: the bar received first is kept
+                - last: the bar received last replaces the existing one, in place
+                - merge: revisions of the same bar are combined, open is kept, high & low are widened,
+                         close & average are taken from the latest revision, volume & count are cumulative
+                         across revisions so the larger value is kept
+        """
+        index = self._bar_index[ticker]
+        existing = index.get(bar['time_stamp'])
+        if existing is None:
+            index[bar['time_stamp']] = bar
+            self.data[ticker]['bar_data'].append(bar)
+        elif self.duplicate_policy == 'last':
+            existing.update(bar)
+        elif self.duplicate_policy == 'merge':
+            existing.update(high=max(existing['high'], bar['high']), low=min(existing['low'], bar['low']),
+                            close=bar['close'], average=bar['average'],
+                            volume=max(existing['volume'], bar['volume']),
+                            count=max(existing['count'], bar['count']))
+
     def historicalData(self, ticker, bar):
         """
             This method is receives data from TWS API, invoked automatically after "reqHistoricalData".
             :param ticker: represents ticker ID
             :param bar: a bar object that contains OHLCV data
         """
-        self.logger.info(f'Bar-data received for ticker: {ticker}')
+        if HOT_PATH_LOGGING:  # invoked per bar, formatting is skipped unless switched on, see "ibapi.utils"
+            self.logger.info('Bar-data received for ticker: %s', ticker)
+        if ticker not in self._requests_in_flight:  # late response for a request that timed out or was cancelled
+            return
+        self._receive_bar(ticker, bar)
+
+    def _receive_bar(self, ticker, bar):
+        """
+            Converts a bar received from TWS API & stores it for the given ticker.
+        """
         time_stamp = bar.date
         date, time = time_stamp.split()
         year, month, day = date[:4], date[4:6], date[6:]
@@ -196,10 +589,49 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
         bar = {'time_stamp': time_stamp, 'open': bar.open, 'high': bar.high, 'low': bar.low,
                'close': bar.close, 'volume': bar.volume, 'average': bar.average,
                'count': bar.barCount, 'session': session}
+        self.counters['bars_received'] += 1
+        self.instruments.bars_received(ticker)
         if not((hour == 11 and minute > 30) or (hour == 12 and minute < 30)):  # fixme: temporary hack
-            if bar not in self.data[ticker]['bar_data']:
-                self.data[ticker]['bar_data'].append(bar)
-        self.logger.debug(f'Ticker ID: {ticker} | Bar-data: {bar}')
+            self._store_bar(ticker, bar)
+        if HOT_PATH_LOGGING:
+            self.logger.debug('Ticker ID: %s | Bar-data: %s', ticker, bar)
+
+    def historicalDataUpdate(self, ticker, bar):
+        """
+            Receives revisions of the latest bar, invoked automatically when "keep_upto_date" is set.
+            Revisions are applied according to the duplicate policy.
+            :param ticker: represents ticker ID
+            :param bar: a bar object that contains OHLCV data
+        """
+        if ticker not in self.data:  # revisions keep coming after the end of data, till the request is cancelled
+            return
+        self._receive_bar(ticker, bar)
+
+    def historicalDataBatch(self, ticker, columns):
+        """
+            Receives all the bars for a ticker at once, replaces "historicalData" calls with a single call per
+            response. Invoked automatically after "reqHistoricalData".
+            :param ticker: represents ticker ID
+            :param columns: typed arrays for date(yyyymmddhhmmss), open, high, low, close, volume, average
+                            & barCount, one entry per bar
+        """
+        if ticker not in self._requests_in_flight:  # late response for a request that timed out or was cancelled
+            return
+        self.logger.info(f'Bar-data received for ticker: {ticker}, total bars: {len(columns["date"])}')
+        self.counters['bars_received'] += len(columns['date'])
+        self.instruments.bars_received(ticker, len(columns['date']))
+        for time_stamp, _open, high, low, close, volume, average, count in zip(
+                columns['date'], columns['open'], columns['high'], columns['low'], columns['close'],
+                columns['volume'], columns['average'], columns['barCount']):
+            time_stamp = str(time_stamp)
+            hour, minute = int(time_stamp[8:10]), int(time_stamp[10:12])
+            if (hour == 11 and minute > 30) or (hour == 12 and minute < 30):  # fixme: temporary hack
+                continue
+            bar = {'time_stamp': f'{time_stamp[:4]}-{time_stamp[4:6]}-{time_stamp[6:8]} '
+                                 f'{time_stamp[8:10]}:{time_stamp[10:12]}:{time_stamp[12:]}',
+                   'open': _open, 'high': high, 'low': low, 'close': close, 'volume': volume,
+                   'average': average, 'count': count, 'session': 1 if hour < 12 else 2}
+            self._store_bar(ticker, bar)
 
     def historicalDataEnd(self, ticker, start, end):
         """
@@ -210,12 +642,19 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
             :param end: ending timestamp
         """
         self.logger.info(f'Data extraction completed for ticker: {ticker}')
+        if ticker not in self._requests_in_flight:  # late response for a request that timed out or was cancelled
+            return
         self.data[ticker]['meta_data']['start'] = start
         self.data[ticker]['meta_data']['end'] = end
         self.data[ticker]['meta_data']['status'] = True
         self.data[ticker]['meta_data']['total_bars'] = len(self.data[ticker]['bar_data'])
-        self._processed_tickers.append(ticker)
-        self.extract_historical_data()
+        self._requests_in_flight.finish(ticker)
+        self.instruments.request_ended(ticker, size=self.message_size)
+        self._processed_tickers.add(ticker)
+        self._failed_tickers.discard(ticker)
+        self.counters['requests_completed'] += 1
+        self._widen_request_window()
+        self._fill_request_slots()
 
     def error(self, ticker, code, message):
         """
@@ -245,31 +684,46 @@ class HistoricalDataExtractor(TWSWrapper, TWSClient):
             if code == 2158:
                 self.logger.info(f'Secure connection established to TWS API.')
                 self.handshake_completed = True
+            # error code 1100 indicates that connectivity between TWS and IB servers has been lost
+            # hold back new requests until connectivity is restored
+            if code == 1100:
+                self.logger.error(f'Connectivity Lost: {message}, Error code: {code}')
+                self.connection_is_broken = True
+            # error code 1101 indicates that connectivity has been restored but requests were lost
+            if code == 1101:
+                self.logger.error(f'Connectivity Restored: {message}, Error code: {code}')
+                self._requeue_requests_in_flight()
+                self.connection_is_broken = False
+            # error code 1102 indicates that connectivity has been restored and requests were maintained
+            if code == 1102:
+                self.logger.info(f'Connectivity Restored: {message}, Error code: {code}')
+                self.connection_is_broken = False
         else:
             self.logger.error(f'{message}: Ticker ID: {ticker}, Error Code: {code}')
-            meta_data = self.data[ticker]['meta_data']
-            attempts = meta_data['attempts']
-            error = {'code': code, 'message': message}
-            meta_data['_error_stack'].append(error)
-
-            if attempts >= self.max_attempts:
-                self._processed_tickers.append(ticker)
+            if ticker not in self.data:  # late response for a request from a previous set of tickers
+                return
+            # late response for a request that has been dealt with already, e.g. one that timed out
+            if not self._requests_in_flight.discard(ticker):
+                return
 
-            # -1 indicates a timeout
-            # 162 indicates that HMDS return no data
             # 322 indicates that API request limit(50) has been breached
-            # 504 indicates no connection
-            if code in [-1, 322, 504]:
+            # request was never served, back off without counting the attempt & narrow down the request window
+            if code == 322:
+                self.data[ticker]['meta_data']['attempts'] -= 1
+                self.data[ticker]['meta_data']['_error_stack'].append({'code': code, 'message': message})
+                self._schedule_retry(ticker)
+                self.max_requests_in_flight = max(1, len(self._requests_in_flight))
+                self._last_rejection = time()
+                self.counters['requests_rejected'] += 1
+                self.instruments.request_failed(ticker, code)
+                self.logger.error(f'Request window narrowed down to: {self.max_requests_in_flight}')
                 self.cancelHistoricalData(ticker)
                 self.logger.error(f'Canceling: {ticker} | {code} | {message}')
+            else:
+                self._request_failed(ticker, code, message)
 
         if self.handshake_completed:
-            self.logger.debug('Initial handshake completed, initiating data extraction')
-            extraction_is_not_completed = self._target_tickers != self._processed_tickers
-            if extraction_is_not_completed:
-                self.extract_historical_data()
-            else:
-                self.disconnect()
+            self._fill_request_slots()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Deadline scheduler, keeps track of the requests waiting for a response and finds the ones that timed out.
+    Driven from the message loop, so it works on any thread & any OS, unlike signal based alarms.
+"""
+
+from heapq import heappop
+from heapq import heappush
+from time import time
+
+
+class DeadlineScheduler:
+    """
+        Tracks outstanding requests, each with its own deadline, in a heap ordered by expiry.
+        Adding a request, finishing one & checking for expired ones are all O(log n), requests that finish
+        before their deadline are dropped from the heap lazily.
+
+        Timeout statistics are published through "stats":
+            - scheduled: number of requests added
+            - finished: number of requests that finished before their deadline
+            - expired: number of requests that crossed their deadline
+            - peak_outstanding: maximum number of requests outstanding at once
+            - total_latency, max_latency: seconds taken by the finished requests
+    """
+
+    def __init__(self, clock=time):
+        self.clock = clock
+        self._heap = []  # (deadline, sequence, key)
+        self._sequence = 0
+        self._outstanding = {}  # key --> (deadline, sequence, scheduled at)
+        self.stats = {'scheduled': 0, 'finished': 0, 'expired': 0, 'peak_outstanding': 0,
+                      'total_latency': 0.0, 'max_latency': 0.0}
+
+    def __len__(self):
+        return len(self._outstanding)
+
+    def __contains__(self, key):
+        return key in self._outstanding
+
+    def __iter__(self):
+        return iter(list(self._outstanding))
+
+    def add(self, key, timeout, now=None):
+        """
+            Registers a request that has to finish within timeout seconds, re-adding a key replaces its deadline.
+            :param key: hashable key for the request (ex: ticker ID)
+            :param timeout: number of seconds the request is allowed to take
+            :param now: current time, defaults to scheduler's clock
+        """
+        now = self.clock() if now is None else now
+        self._sequence += 1
+        deadline = now + timeout
+        self._outstanding[key] = (deadline, self._sequence, now)
+        heappush(self._heap, (deadline, self._sequence, key))
+        self.stats['scheduled'] += 1
+        self.stats['peak_outstanding'] = max(self.stats['peak_outstanding'], len(self._outstanding))
+        return deadline
+
+    def finish(self, key, now=None):
+        """
+            Removes a request that received its response, no-op for unknown keys.
+            :return: True if the request was outstanding
+        """
+        entry = self._outstanding.pop(key, None)
+        if entry is None:
+            return False
+        now = self.clock() if now is None else now
+        latency = max(now - entry[2], 0.0)
+        self.stats['finished'] += 1
+        self.stats['total_latency'] += latency
+        self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        return True
+
+    def discard(self, key):
+        """
+            Removes a request without counting it as finished, used for requests that will never be answered.
+        """
+        return self._outstanding.pop(key, None) is not None
+
+    def next_deadline(self):
+        """
+            Returns the earliest deadline among the outstanding requests, None if there are none.
+        """
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now=None):
+        """
+            Removes & returns the keys for requests that have crossed their deadline, earliest first.
+        """
+        now = self.clock() if now is None else now
+        expired = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, sequence, key = heappop(self._heap)
+            del self._outstanding[key]
+            expired.append(key)
+            self._drop_stale()
+        self.stats['expired'] += len(expired)
+        return expired
+
+    def _drop_stale(self):
+        """
+            Pops heap entries for requests that have finished or were re-added with a new deadline.
+        """
+        heap, outstanding = self._heap, self._outstanding
+        while heap and outstanding.get(heap[0][2], (None, None))[1] != heap[0][1]:
+            heappop(heap)
+
+    @property
+    def mean_latency(self):
+        return self.stats['total_latency'] / self.stats['finished'] if self.stats['finished'] else 0.0
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Instrumentation for historical data requests, traces every request from the moment it is queued till its
+    last bar is received & aggregates the traces into counters and histograms.
+    Snapshots can be exported as JSON or in Prometheus text format, to see where an extraction spends its time.
+"""
+
+from bisect import bisect_left
+from collections import deque
+from json import dumps
+from time import time
+
+
+# seconds, upper bounds of histogram buckets for waits & latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# upper bounds of histogram buckets for number of bars per request
+BAR_BUCKETS = (0, 1, 10, 50, 100, 250, 500, 1000, 5000)
+# number of finished request traces kept around for the JSON export
+MAX_TRACES = 10000
+COUNTERS = {
+    # name: help text, as published in Prometheus export
+    'requests_sent': 'Historical data requests sent',
+    'requests_completed': 'Historical data requests that received all their bars',
+    'requests_failed': 'Historical data requests that failed or timed out',
+    'requests_rejected': 'Historical data requests rejected for breaching the limit on open requests',
+    'requests_retried': 'Historical data requests sent for a ticker that had been requested before',
+    'requests_dropped': 'Historical data requests abandoned after a connection loss',
+    'bars_received': 'Bars received',
+    'bytes_received': 'Bytes received with historical data responses',
+}
+HISTOGRAMS = {
+    # name: (help text, bucket upper bounds)
+    'queue_wait_seconds': ('Time between queueing & sending a request, pacing & window waits', LATENCY_BUCKETS),
+    'first_bar_seconds': ('Time between sending a request & receiving its first bar', LATENCY_BUCKETS),
+    'request_latency_seconds': ('Time between sending a request & receiving its last bar', LATENCY_BUCKETS),
+    'bars_per_request': ('Bars received per completed request', BAR_BUCKETS),
+}
+
+
+class Histogram:
+    """
+        Counts observations into buckets with fixed upper bounds, the way Prometheus histograms do.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one counts observations beyond the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError('Histograms with different buckets can not be merged.')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def subtract(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError('Histograms with different buckets can not be subtracted.')
+        self.counts = [a - b for a, b in zip(self.counts, other.counts)]
+        self.sum -= other.sum
+        self.count -= other.count
+
+    def quantile(self, q):
+        """
+            Returns the upper bound of the bucket that holds the q-th quantile, None without observations.
+            Observations beyond the largest bound are reported as the largest bound, exports stay valid JSON.
+        """
+        if not self.count:
+            return None
+        rank, total = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative_counts(self):
+        """
+            Returns (upper bound, observations less than or equal to it) for every bucket, including "+Inf".
+        """
+        total, counts = 0, []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': round(self.sum, 6),
+                'mean': round(self.sum / self.count, 6) if self.count else None,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': {str(bound): count for bound, count in self.cumulative_counts()}}
+
+
+class RequestTrace:
+    """
+        Time line of a single historical data request, times are seconds since epoch.
+    """
+    __slots__ = ('ticker', 'attempt', 'queued_at', 'sent_at', 'first_bar_at', 'ended_at', 'bars', 'bytes',
+                 'error_codes')
+
+    def __init__(self, ticker, attempt, queued_at, sent_at):
+        self.ticker = ticker
+        self.attempt = attempt
+        self.queued_at = queued_at
+        self.sent_at = sent_at
+        self.first_bar_at = None
+        self.ended_at = None
+        self.bars = 0
+        self.bytes = 0
+        self.error_codes = []
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Instruments:
+    """
+        Records a trace per historical data request & aggregates them into counters & histograms.
+        Request for a ticker is identified by the ticker, only one request per ticker can be open at a time.
+
+        Usage:
+            instruments.request_sent(1301, attempt=1, queued_at=queued_at)
+            instruments.bars_received(1301, 390)
+            instruments.request_ended(1301, size=20480)
+            print(instruments.to_prometheus())
+    """
+
+    def __init__(self, clock=time, max_traces=MAX_TRACES):
+        self.clock = clock
+        self.started_at = clock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.errors = {}  # error code --> number of requests that received it
+        self.histograms = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+        self.traces = deque(maxlen=max_traces)  # finished requests, most recent last
+        self._open = {}  # ticker --> trace for the request waiting for a response
+
+    def request_sent(self, ticker, attempt=1, queued_at=None, now=None):
+        """
+            Opens a trace for a request that was just sent.
+            :param attempt: number of requests sent for the ticker so far, including this one
+            :param queued_at: time at which the ticker was put in line for the request, defaults to now
+        """
+        now = self.clock() if now is None else now
+        queued_at = now if queued_at is None else queued_at
+        self._open[ticker] = RequestTrace(ticker, attempt, queued_at, now)
+        self.counters['requests_sent'] += 1
+        if attempt > 1:
+            self.counters['requests_retried'] += 1
+        self.histograms['queue_wait_seconds'].observe(max(now - queued_at, 0.0))
+
+    def bars_received(self, ticker, count=1, now=None):
+        trace = self._open.get(ticker)
+        if trace is None:
+            return
+        if trace.first_bar_at is None:
+            trace.first_bar_at = self.clock() if now is None else now
+            self.histograms['first_bar_seconds'].observe(trace.first_bar_at - trace.sent_at)
+        trace.bars += count
+        self.counters['bars_received'] += count
+
+    def request_ended(self, ticker, size=0, now=None):
+        """
+            Closes the trace for a request that received all its bars.
+            :param size: number of bytes received with the response
+        """
+        trace = self._open.pop(ticker, None)
+        if trace is None:
+            return
+        trace.ended_at = self.clock() if now is None else now
+        trace.bytes += size
+        self.counters['requests_completed'] += 1
+        self.counters['bytes_received'] += size
+        self.histograms['request_latency_seconds'].observe(trace.ended_at - trace.sent_at)
+        self.histograms['bars_per_request'].observe(trace.bars)
+        self.traces.append(trace)
+
+    def request_failed(self, ticker, code, now=None):
+        """
+            Closes the trace for a request that failed(code=322 for a rejected one, code=-1 for a timeout).
+        """
+        self.errors[code] = self.errors.get(code, 0) + 1
+        trace = self._open.pop(ticker, None)
+        if trace is None:
+            return
+        trace.ended_at = self.clock() if now is None else now
+        trace.error_codes.append(code)
+        self.counters['requests_rejected' if code == 322 else 'requests_failed'] += 1
+        self.traces.append(trace)
+
+    def request_dropped(self, ticker):
+        """
+            Closes the trace for a request whose response is never going to arrive, e.g. after a connection loss.
+        """
+        trace = self._open.pop(ticker, None)
+        if trace is not None:
+            self.counters['requests_dropped'] += 1
+            self.traces.append(trace)
+
+    def merge(self, other):
+        """
+            Adds the counters & histograms from another instance, used to combine instruments of parallel sessions.
+        """
+        self.started_at = min(self.started_at, other.started_at)
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for code, count in other.errors.items():
+            self.errors[code] = self.errors.get(code, 0) + count
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        self.traces.extend(other.traces)
+        return self
+
+    def checkpoint(self, now=None):
+        """
+            Returns a copy of the counters & histograms recorded so far, without traces.
+            Pass it to "since" later on, to get what was recorded in between.
+        """
+        checkpoint = Instruments(clock=self.clock, max_traces=0)
+        checkpoint.started_at = self.clock() if now is None else now
+        checkpoint.counters.update(self.counters)
+        checkpoint.errors.update(self.errors)
+        for name, histogram in self.histograms.items():
+            checkpoint.histograms[name].merge(histogram)
+        return checkpoint
+
+    def since(self, checkpoint):
+        """
+            Returns new instruments holding only what was recorded after the given checkpoint was taken,
+            used to report a single extraction out of a session that runs several.
+        """
+        instruments = Instruments(clock=self.clock, max_traces=self.traces.maxlen)
+        instruments.started_at = checkpoint.started_at
+        for name, value in self.counters.items():
+            instruments.counters[name] = value - checkpoint.counters[name]
+        for code, count in self.errors.items():
+            if count > checkpoint.errors.get(code, 0):
+                instruments.errors[code] = count - checkpoint.errors.get(code, 0)
+        for name, histogram in self.histograms.items():
+            instruments.histograms[name].merge(histogram)
+            instruments.histograms[name].subtract(checkpoint.histograms[name])
+        instruments.traces.extend(trace for trace in self.traces if trace.sent_at >= checkpoint.started_at)
+        instruments._open.update(self._open)
+        return instruments
+
+    def snapshot(self, traces=False, now=None):
+        """
+            Returns counters, rates, error codes & histograms as a dictionary, ready to be dumped as JSON.
+            :param traces: set to True to include finished request traces
+        """
+        now = self.clock() if now is None else now
+        time_lapsed = max(now - self.started_at, 1e-6)
+        snapshot = {'time_lapsed': round(time_lapsed, 3), 'requests_in_flight': len(self._open),
+                    'counters': dict(self.counters),
+                    'requests_per_second': round(self.counters['requests_completed'] / time_lapsed, 3),
+                    'bars_per_second': round(self.counters['bars_received'] / time_lapsed, 3),
+                    'errors': {str(code): count for code, count in sorted(self.errors.items())},
+                    'histograms': {name: histogram.snapshot() for name, histogram in self.histograms.items()}}
+        if traces:
+            snapshot['traces'] = [trace.as_dict() for trace in self.traces]
+        return snapshot
+
+    def to_json(self, traces=False, now=None):
+        return dumps(self.snapshot(traces=traces, now=now), indent=1)
+
+    def to_prometheus(self, prefix='tws_extractor', now=None):
+        """
+            Returns a snapshot in Prometheus text exposition format.
+        """
+        snapshot, lines = self.snapshot(now=now), []
+        for name, help_text in COUNTERS.items():
+            lines += [f'# HELP {prefix}_{name}_total {help_text}', f'# TYPE {prefix}_{name}_total counter',
+                      f'{prefix}_{name}_total {self.counters[name]}']
+        lines += [f'# HELP {prefix}_errors_total Error codes received for historical data requests',
+                  f'# TYPE {prefix}_errors_total counter']
+        lines += [f'{prefix}_errors_total{{code="{code}"}} {count}' for code, count in snapshot['errors'].items()]
+        for name in ['requests_per_second', 'bars_per_second', 'requests_in_flight']:
+            lines += [f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {snapshot[name]}']
+        for name, (help_text, _) in HISTOGRAMS.items():
+            histogram = self.histograms[name]
+            lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} histogram']
+            lines += [f'{prefix}_{name}_bucket{{le="{bound}"}} {count}'
+                      for bound, count in histogram.cumulative_counts()]
+            lines += [f'{prefix}_{name}_sum {histogram.sum}', f'{prefix}_{name}_count {histogram.count}']
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, traces=False):
+        """
+            Writes a snapshot to the given file, in Prometheus text format for ".prom" files & as JSON otherwise.
+        """
+        content = self.to_prometheus() if path.endswith('.prom') else self.to_json(traces=traces)
+        with open(path, 'w') as f:
+            f.write(content)
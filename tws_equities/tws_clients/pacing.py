@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Pacing engine, models the limits imposed by TWS API on historical data requests.
+    A request is only sent once the engine finds it legal, instead of reacting to pacing violations.
+    Reference: https://interactivebrokers.github.io/tws-api/historical_limitations.html
+"""
+
+from collections import deque
+from time import time
+
+
+# no identical historical data requests within 15 seconds
+IDENTICAL_REQUEST_INTERVAL = 15
+# six or more requests for the same contract, exchange & tick type within 2 seconds is a violation
+CONTRACT_REQUEST_LIMIT = 5
+CONTRACT_REQUEST_WINDOW = 2
+# no more than 60 requests within any 10 minute period, applies to bars of 30 seconds or less
+REQUEST_LIMIT = 60
+REQUEST_WINDOW = 600
+SMALL_BAR_SIZES = ['1 secs', '5 secs', '10 secs', '15 secs', '30 secs']
+
+
+def is_small_bar_size(bar_size):
+    """
+        Returns True if requests for the given bar size are subject to the 10 minute request limit.
+    """
+    return bar_size in SMALL_BAR_SIZES
+
+
+class PacingEngine:
+    """
+        Tracks recently sent historical data requests and computes how long a new request must wait to
+        stay within the pacing limits. Waiting times are published through "stats".
+
+        Requests are identified by two hashable keys:
+            - contract: identifies contract, exchange & tick type (ex: (1301, 'SMART', 'TRADES'))
+            - request: identifies the request as a whole, including contract, end date-time, duration, etc.
+    """
+
+    def __init__(self, request_limit=REQUEST_LIMIT, request_window=REQUEST_WINDOW,
+                 identical_request_interval=IDENTICAL_REQUEST_INTERVAL,
+                 contract_request_limit=CONTRACT_REQUEST_LIMIT, contract_request_window=CONTRACT_REQUEST_WINDOW,
+                 clock=time):
+        self.request_limit = request_limit
+        self.request_window = request_window
+        self.identical_request_interval = identical_request_interval
+        self.contract_request_limit = contract_request_limit
+        self.contract_request_window = contract_request_window
+        self.clock = clock
+        self._window = deque()  # timestamps for requests subject to the request limit
+        self._identical = {}  # request --> last sent at
+        self._identical_expiry = deque()  # (sent at, request) in the order requests were sent
+        self._contracts = {}  # contract --> timestamps for recent requests
+        self.stats = {'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+
+    def _prune(self, now):
+        """
+            Forgets the requests that no longer count against any of the limits.
+        """
+        while self._window and now - self._window[0] >= self.request_window:
+            self._window.popleft()
+        while self._identical_expiry and now - self._identical_expiry[0][0] >= self.identical_request_interval:
+            sent_at, request = self._identical_expiry.popleft()
+            if self._identical.get(request) == sent_at:
+                del self._identical[request]
+        window = self.contract_request_window
+        for contract in [c for c, sent in self._contracts.items() if now - sent[-1] >= window]:
+            del self._contracts[contract]
+
+    def window_delay(self, now=None):
+        """
+            Returns the number of seconds to wait before any request for small bars can be sent.
+        """
+        now = self.clock() if now is None else now
+        self._prune(now)
+        if len(self._window) < self.request_limit:
+            return 0
+        return self._window[len(self._window) - self.request_limit] + self.request_window - now
+
+    def delay(self, contract, request, small_bars=False, now=None):
+        """
+            Returns the number of seconds to wait before the given request can be sent, 0 if it is legal now.
+            :param contract: hashable key for contract, exchange & tick type
+            :param request: hashable key for the request as a whole
+            :param small_bars: True if the request is for bars of 30 seconds or less
+            :param now: current time, defaults to engine's clock
+        """
+        now = self.clock() if now is None else now
+        self._prune(now)
+        delays = [0]
+        if request in self._identical:
+            delays.append(self._identical[request] + self.identical_request_interval - now)
+        recent = self._contracts.get(contract, ())
+        if len(recent) >= self.contract_request_limit:
+            oldest = recent[len(recent) - self.contract_request_limit]
+            delays.append(oldest + self.contract_request_window - now)
+        if small_bars:
+            delays.append(self.window_delay(now))
+        return max(delays)
+
+    def record(self, contract, request, small_bars=False, queued_at=None, now=None):
+        """
+            Registers a request that is being sent.
+            :param queued_at: time at which the request was queued, used to publish the waiting time
+            :return: number of seconds the request waited in queue
+        """
+        now = self.clock() if now is None else now
+        if small_bars:
+            self._window.append(now)
+        self._identical[request] = now
+        self._identical_expiry.append((now, request))
+        self._contracts.setdefault(contract, deque()).append(now)
+
+        wait = max(now - queued_at, 0.0) if queued_at is not None else 0.0
+        self.stats['requests'] += 1
+        self.stats['total_wait'] += wait
+        self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+        return wait
+
+    @property
+    def mean_wait(self):
+        return self.stats['total_wait'] / self.stats['requests'] if self.stats['requests'] else 0.0
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Pool of extraction sessions, runs data extraction over multiple TWS API connections in parallel.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from queue import Queue
+
+from tws_equities.tws_clients.instrumentation import Instruments
+from tws_equities.tws_clients.session import ExtractionSession
+
+
+DEFAULT_GATEWAY = ('127.0.0.1', 7497)
+_DONE = object()  # put in the chunk queue by a session once it is done with its shard
+
+
+class ConnectionPool:
+    """
+        Opens N extraction sessions with distinct client IDs, optionally spread across several TWS / IB Gateway
+        instances, shards the target tickers across them and merges the extracted data.
+        Every session has its own connection, EReader thread & message loop.
+        Exposes the same "extract" interface as ExtractionSession, so it can be used in place of one.
+
+        Usage:
+            with ConnectionPool(size=4, gateways=[('127.0.0.1', 4001), ('127.0.0.1', 4002)]) as pool:
+                data = pool.extract(tickers, '20210101')
+    """
+
+    def __init__(self, size=2, gateways=None, base_client_id=10, logger=None, **session_options):
+        if size < 1:
+            raise ValueError(f'Pool size must be a positive integer, received: {size}')
+        gateways = list(gateways or [DEFAULT_GATEWAY])
+        self.logger = logger or getLogger(__name__)
+        self.sessions = []
+        for i in range(size):
+            host, port = gateways[i % len(gateways)]
+            session = ExtractionSession(host=host, port=port, client_id=base_client_id + i, logger=self.logger,
+                                        **session_options)
+            self.sessions.append(session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self):
+        return len(self.sessions)
+
+    @property
+    def instruments(self):
+        """
+            Request instrumentation combined across all the sessions.
+        """
+        combined = Instruments()
+        for session in self.sessions:
+            combined.merge(session.instruments)
+        return combined
+
+    def close(self):
+        """
+            Terminates all the open connections.
+        """
+        for session in self.sessions:
+            session.close()
+
+    def _shard(self, tickers):
+        """
+            Splits tickers across sessions in a round-robin fashion, keeps the shards balanced.
+        """
+        tickers = list(tickers)
+        return [tickers[i::self.size] for i in range(self.size)]
+
+    def extract(self, tickers, end_date, **options):
+        """
+            Extracts historical data for the given tickers, each session works on its own shard.
+            Accepts the same parameters as ExtractionSession.extract.
+            :return: extracted data from all the sessions, keyed by ticker ID
+        """
+        data = {}
+        for chunk in self.iter_extract(tickers, end_date, **options):
+            data.update(chunk)
+        return data
+
+    def iter_extract(self, tickers, end_date, **options):
+        """
+            Same as "extract", but yields the extracted data in chunks, as soon as any of the sessions hands one
+            over.
+            Accepts the same parameters as ExtractionSession.iter_extract.
+            If a session fails, the rest are allowed to finish their shards & the error is raised afterwards, so
+            that chunks extracted by the healthy sessions are not lost.
+            :return: generator of extracted data, keyed by ticker ID
+        """
+        shards = self._shard(tickers)
+        jobs = [(session, shard) for session, shard in zip(self.sessions, shards) if shard]
+        self.logger.debug(f'Extracting {sum(map(len, shards))} tickers over {len(jobs)} connections')
+        chunks = Queue()
+
+        def work(session, shard):
+            try:
+                for chunk in session.iter_extract(shard, end_date, **options):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(_DONE)
+
+        with ThreadPoolExecutor(max_workers=len(jobs) or 1) as executor:
+            futures = [executor.submit(work, session, shard) for session, shard in jobs]
+            for _ in jobs:
+                for chunk in iter(chunks.get, _DONE):
+                    yield chunk
+            errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            self.logger.error(f'{len(errors)} of {len(jobs)} sessions failed, first error: {errors[0]}')
+            raise errors[0]
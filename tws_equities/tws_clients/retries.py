@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Retry policy for historical data requests, classifies the errors received for a request & decides whether and
+    when it is sent again.
+    Reference: https://interactivebrokers.github.io/tws-api/message_codes.html
+"""
+
+from random import Random
+
+
+# request can never succeed, e.g. unknown contract or no data for the date, it is not retried
+PERMANENT = 'permanent'
+# request was turned down for breaching pacing limits, retried after an exponential backoff
+PACING = 'pacing'
+# request was lost along with the connection, retried as soon as the connection is restored
+CONNECTIVITY = 'connectivity'
+# anything else, including timeouts(code=-1), retried right away
+TRANSIENT = 'transient'
+ERROR_CATEGORIES = [PERMANENT, PACING, CONNECTIVITY, TRANSIENT]
+# 200: no security definition, 203: security not available for the account, 321: invalid request,
+# 354: no market data subscription
+PERMANENT_ERRORS = [200, 203, 321, 354]
+# 322: more than 50 simultaneous historical data requests
+PACING_ERRORS = [322]
+# 504: not connected, 1100: connectivity between TWS & IB servers lost, 2103, 2105, 2157: data farm disconnected
+CONNECTIVITY_ERRORS = [504, 1100, 2103, 2105, 2157]
+# seconds to wait after the first pacing violation, doubles with every consecutive one
+BASE_DELAY = 2
+MAX_DELAY = 120
+# fraction of the delay that is randomized, so that tickers turned down together are not retried together
+JITTER = 0.5
+# consecutive pacing violations after which a ticker is given up on
+MAX_BACKOFFS = 8
+
+
+def classify(code, message=''):
+    """
+        Returns the category for an error received for a historical data request, one of ERROR_CATEGORIES.
+        Code 162 is shared by several HMDS errors, these are told apart by the message.
+    """
+    if code == 162:
+        message = message.lower()
+        if 'pacing violation' in message:
+            return PACING
+        if 'no data' in message:
+            return PERMANENT
+        return TRANSIENT
+    if code in PERMANENT_ERRORS:
+        return PERMANENT
+    if code in PACING_ERRORS:
+        return PACING
+    if code in CONNECTIVITY_ERRORS:
+        return CONNECTIVITY
+    return TRANSIENT
+
+
+def is_permanent_failure(error_stack):
+    """
+        Returns True if the latest error in a ticker's error stack(see "_error_stack") rules out another attempt.
+    """
+    return bool(error_stack) and classify(error_stack[-1]['code'], error_stack[-1]['message']) == PERMANENT
+
+
+class RetryPolicy:
+    """
+        Decides how long a ticker waits before it is requested again, based on the errors received for it.
+        Pacing violations are backed off exponentially with jitter, other retriable errors are retried right away.
+
+        Usage:
+            delay = policy.backoff(data[ticker]['meta_data']['_error_stack'])
+            if delay is None:
+                # give up on the ticker
+    """
+
+    def __init__(self, base_delay=BASE_DELAY, max_delay=MAX_DELAY, jitter=JITTER, max_backoffs=MAX_BACKOFFS,
+                 seed=None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_backoffs = max_backoffs
+        self._random = Random(seed)
+
+    def backoff(self, error_stack):
+        """
+            Returns the number of seconds to wait before the next attempt, None if the ticker must not be retried.
+            :param error_stack: errors received for the ticker so far, latest one last
+        """
+        if is_permanent_failure(error_stack):
+            return None
+        violations = 0
+        for error in reversed(error_stack):
+            if classify(error['code'], error['message']) != PACING:
+                break
+            violations += 1
+        if not violations:
+            return 0
+        if violations > self.max_backoffs:
+            return None
+        delay = min(self.max_delay, self.base_delay * 2 ** (violations - 1))
+        return delay * (1 - self.jitter * self._random.random())
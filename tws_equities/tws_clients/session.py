@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Long-lived extraction session, shares a single TWS API connection across batches and dates.
+"""
+
+from logging import getLogger
+
+from tws_equities.tws_clients.data_extractor import HistoricalDataExtractor
+
+
+class ExtractionSession:
+    """
+        Connects to TWS API once and streams every extraction request through the same connection.
+        Connection is opened lazily with the first request and is re-established automatically if it breaks.
+
+        Usage:
+            with ExtractionSession() as session:
+                for date in dates:
+                    data = session.extract(tickers, date, end_time='15:01:00')
+    """
+
+    def __init__(self, host='127.0.0.1', port=7497, client_id=10, timeout=3, max_attempts=3,
+                 max_requests_in_flight=10, max_reconnects=3, duplicate_policy='last', retry_policy=None,
+                 logger=None):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.logger = logger or getLogger(__name__)
+        self.client = HistoricalDataExtractor(logger=self.logger, timeout=timeout, max_attempts=max_attempts,
+                                              max_requests_in_flight=max_requests_in_flight, keep_alive=True,
+                                              max_reconnects=max_reconnects, duplicate_policy=duplicate_policy,
+                                              retry_policy=retry_policy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_connected(self):
+        return self.client.is_connected
+
+    @property
+    def instruments(self):
+        """
+            Request instrumentation for every extraction since the session was created.
+        """
+        return self.client.instruments
+
+    def open(self):
+        """
+            Connects to TWS API, if not connected already.
+        """
+        if not self.client.is_connected:
+            self.logger.info(f'Opening extraction session with client ID: {self.client_id}')
+            self.client.connect(self.host, self.port, self.client_id)
+
+    def close(self):
+        """
+            Terminates the connection to TWS API, if one is open.
+        """
+        if self.client.is_connected:
+            self.logger.info('Closing extraction session')
+            self.client.disconnect()
+
+    def extract(self, tickers, end_date, end_time='15:01:00', duration='1 D', bar_size='1 min',
+                what_to_show='TRADES', use_rth=0, date_format=1, keep_upto_date=False, chart_options=(),
+                max_requests_in_flight=None):
+        """
+            Extracts historical data for the given tickers using the session's connection.
+            Accepts the same parameters as HistoricalDataExtractor.
+            :return: extracted data, keyed by ticker ID
+        """
+        data = {}
+        for chunk in self.iter_extract(tickers, end_date, end_time=end_time, duration=duration, bar_size=bar_size,
+                                       what_to_show=what_to_show, use_rth=use_rth, date_format=date_format,
+                                       keep_upto_date=keep_upto_date, chart_options=chart_options,
+                                       max_requests_in_flight=max_requests_in_flight):
+            data.update(chunk)
+        return data
+
+    def iter_extract(self, tickers, end_date, end_time='15:01:00', duration='1 D', bar_size='1 min',
+                     what_to_show='TRADES', use_rth=0, date_format=1, keep_upto_date=False, chart_options=(),
+                     max_requests_in_flight=None, chunk_size=None):
+        """
+            Same as "extract", but yields the extracted data in chunks of "chunk_size" processed tickers, while the
+            request window is kept full with the rest of them.
+            :param max_requests_in_flight: size of the request window, keeps the current one if not given
+            :return: generator of extracted data, keyed by ticker ID
+        """
+        self.client._reset_attr(end_date=end_date, end_time=end_time, duration=duration, bar_size=bar_size,
+                                what_to_show=what_to_show, use_rth=use_rth, date_format=date_format,
+                                keep_upto_date=keep_upto_date, chart_options=chart_options)
+        if max_requests_in_flight is not None:
+            self.client.set_request_window(max_requests_in_flight)
+        self.open()
+        return self.client.iter_historical_data(list(tickers), chunk_size=chunk_size)